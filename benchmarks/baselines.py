@@ -0,0 +1,184 @@
+"""
+Benchmark results as JSON, saved baselines and comparisons between the two.
+
+A result file looks like
+    {"name": "pipeline-1m", "suite": "pipeline", "created": "...", "git_commit": "...",
+     "environment": {...}, "config": {...}, "metrics": {"train.wall_seconds": 12.3, ...},
+     "details": {...}}
+Only "metrics" is compared. Metrics ending in rows_per_second or requests_per_second
+are better when higher, all others (seconds, MiB, milliseconds, errors) when lower.
+
+    python3 benchmarks/baselines.py benchmarks/results/pipeline-1m-20260101T120000.json
+    python3 benchmarks/baselines.py results.json --baseline benchmarks/baselines/pipeline-1m.json --fail-on-regression
+"""
+import os
+import sys
+import json
+import time
+import platform
+import logging
+import argparse
+import subprocess
+from importlib import metadata
+
+logger = logging.getLogger(__name__)
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'scripts')
+BASELINES_DIR = os.path.join(BENCHMARKS_DIR, 'baselines')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+HIGHER_IS_BETTER_SUFFIXES = ('rows_per_second', 'requests_per_second')
+PACKAGES = ('numpy', 'pandas', 'pyarrow', 'xgboost', 'mlflow')
+
+sys.path.insert(0, SCRIPTS_DIR)
+from pod_resources import available_cpus, memory_limit_bytes  # noqa: E402
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    """
+    What the numbers depend on besides the code: CPUs, memory limit and library versions.
+    """
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    limit = memory_limit_bytes()
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': available_cpus(),
+        'memory_limit_mib': round(limit / 2**20) if limit else None,
+        'packages': versions,
+    }
+
+
+def new_result(name, suite, config):
+    return {
+        'name': name,
+        'suite': suite,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'git_commit': git_commit(),
+        'environment': environment(),
+        'config': config,
+        'metrics': {},
+        'details': {},
+    }
+
+
+def write_result(result, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    logger.info(f"Results written to {path}")
+
+
+def load_result(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def baseline_path(name):
+    return os.path.join(BASELINES_DIR, f"{name}.json")
+
+
+def results_path(name):
+    return os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%dT%H%M%S')}.json")
+
+
+def higher_is_better(metric):
+    return metric.endswith(HIGHER_IS_BETTER_SUFFIXES)
+
+
+def compare(current, baseline, tolerance=0.1):
+    """
+    Compares the metrics both results have. Returns rows of
+    (metric, baseline value, current value, relative change, verdict), where the verdict
+    is 'regression' or 'improvement' when the metric moved the wrong or right way by
+    more than tolerance (a fraction), else 'ok'.
+    """
+    rows = []
+    for metric, base_value in baseline['metrics'].items():
+        value = current['metrics'].get(metric)
+        if value is None or base_value is None:
+            continue
+        if base_value == 0:
+            change = 0.0 if value == 0 else float('inf')
+        else:
+            change = (value - base_value) / abs(base_value)
+        better = change if higher_is_better(metric) else -change
+        verdict = 'regression' if better < -tolerance else 'improvement' if better > tolerance else 'ok'
+        rows.append((metric, base_value, value, change, verdict))
+    return rows
+
+
+def report_comparison(current, baseline, tolerance=0.1):
+    """
+    Logs the comparison with baseline as a table and returns the number of regressions.
+    """
+    for key in ('cpus', 'memory_limit_mib', 'packages'):
+        if current['environment'].get(key) != baseline['environment'].get(key):
+            logger.warning(f"Environment differs from the baseline ({key}: {baseline['environment'].get(key)} -> "
+                           f"{current['environment'].get(key)}); differences may not come from the code.")
+    rows = compare(current, baseline, tolerance)
+    logger.info(f"Compared with baseline {baseline['name']} (commit {baseline.get('git_commit')}, {baseline['created']}), "
+                f"tolerance {tolerance:.0%}:")
+    width = max([len(row[0]) for row in rows] + [6])
+    for metric, base_value, value, change, verdict in rows:
+        marker = {'regression': '  <-- REGRESSION', 'improvement': '  (improvement)'}.get(verdict, '')
+        logger.info(f"  {metric:<{width}} {base_value:>12.4g} -> {value:>12.4g}  {change:+7.1%}{marker}")
+    regressions = sum(1 for row in rows if row[4] == 'regression')
+    logger.info(f"{regressions} regression(s), {sum(1 for row in rows if row[4] == 'improvement')} improvement(s) "
+                f"in {len(rows)} metric(s).")
+    return regressions
+
+
+def add_baseline_arguments(parser):
+    parser.add_argument('--results-path', type=str, default=None,
+                        help='Where to write this run\'s results (default: benchmarks/results/<name>-<time>.json).')
+    parser.add_argument('--baseline-path', type=str, default=None,
+                        help='Baseline to compare with or save to (default: benchmarks/baselines/<name>.json).')
+    parser.add_argument('--save-baseline', action='store_true', help='Save this run as the new baseline.')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative change beyond which a metric counts as a regression or an improvement.')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 if any metric regressed.')
+
+
+def finish(result, args):
+    """
+    Writes the results, compares them with the baseline if there is one and saves them
+    as the baseline if asked. Returns the process exit status.
+    """
+    write_result(result, args.results_path or results_path(result['name']))
+    path = args.baseline_path or baseline_path(result['name'])
+    regressions = 0
+    if os.path.exists(path) and not args.save_baseline:
+        regressions = report_comparison(result, load_result(path), args.tolerance)
+    elif not args.save_baseline:
+        logger.info(f"No baseline at {path}; rerun with --save-baseline to create one.")
+    if args.save_baseline:
+        write_result(result, path)
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    parser = argparse.ArgumentParser(description="Compare a benchmark result file with a baseline.")
+    parser.add_argument('results', type=str, help='Result JSON written by pipeline_benchmark.py or serving_benchmark.py.')
+    parser.add_argument('--baseline', type=str, default=None, help='Baseline JSON (default: the saved baseline of the same name).')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    current = load_result(args.results)
+    regressions = report_comparison(current, load_result(args.baseline or baseline_path(current['name'])), args.tolerance)
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
@@ -0,0 +1,196 @@
+"""
+Throughput and peak memory of the pipeline scripts on synthetic data.
+
+Runs preprocessing.py, xgboost_script.py, evaluation_script.py and batch_scoring.py
+one after the other, as the Argo steps do, on a synthetic Telco file of --rows rows
+(generated once and reused). Each stage is a separate process, and for each one the
+benchmark records the wall time, CPU time, rows per second and peak RSS (of the
+largest process, from wait4). The per-span breakdown from instrumentation.py is kept
+in the result's details. Training runs a fixed number of rounds (no early stopping),
+so the work does not change with the data.
+
+    python3 benchmarks/pipeline_benchmark.py --rows 1M --save-baseline
+    python3 benchmarks/pipeline_benchmark.py --rows 1M --fail-on-regression
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import statistics
+import subprocess
+
+import baselines
+import synthetic_telco
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STAGES = ('preprocess', 'train', 'evaluate', 'score')
+IN_MEMORY_MAX_ROWS = 2000000  # Larger inputs use the chunked/iterator code paths, as a big pod would
+
+
+def script(name):
+    return os.path.join(baselines.SCRIPTS_DIR, name)
+
+
+def run_stage(stage, command, env, log_path):
+    """
+    Runs one stage to completion and returns its wall time, CPU time (user + system,
+    including worker processes) and peak RSS. The output goes to log_path.
+    """
+    logger.info(f"Running {stage}: {' '.join(command[1:])}")
+    with open(log_path, 'w') as log:
+        start = time.perf_counter()
+        # Run from the work directory: a local MLflow store puts its artifacts under ./mlruns
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT, env=env, cwd=os.path.dirname(os.path.dirname(log_path)))
+        # wait4 rather than Popen.wait: it returns the resource usage of this child alone
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_seconds = time.perf_counter() - start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{stage} failed with exit code {process.returncode}; see {log_path}")
+    return {
+        'wall_seconds': round(wall_seconds, 3),
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 3),
+        'peak_rss_mib': round(usage.ru_maxrss / 1024, 1),  # ru_maxrss is in KiB on Linux
+    }
+
+
+def count_rows(path):
+    import data_io
+    return sum(len(chunk) for chunk in data_io.iter_frames(path, 1000000, columns=['Churn']))
+
+
+def stage_commands(args, data_path, work_dir, chunked):
+    ext = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}[args.format]
+    paths = {
+        'train': os.path.join(work_dir, 'output', 'train', f'train{ext}'),
+        'test': os.path.join(work_dir, 'output', 'test', f'test{ext}'),
+        'encoder': os.path.join(work_dir, 'model', 'feature_encoder.json'),
+        'model': os.path.join(work_dir, 'model', 'xgboost-model'),
+    }
+    chunk_size = str(args.chunk_size)
+    experiment = ['--mlflow-experiment-name', args.mlflow_experiment_name]
+
+    def perf(stage):
+        return ['--perf-output-path', os.path.join(work_dir, 'perf', f'{stage}.json')]
+
+    return paths, {
+        'preprocess': [sys.executable, script('preprocessing.py'),
+                       '--input-data-path', data_path,
+                       '--output-train-path', paths['train'], '--output-test-path', paths['test'],
+                       '--encoder-output-path', paths['encoder'],
+                       '--drift-baseline-path', os.path.join(work_dir, 'model', 'drift_baseline.json'),
+                       '--chunk-size', chunk_size if chunked else '0'] + perf('preprocess') + experiment,
+        'train': [sys.executable, script('xgboost_script.py'),
+                  '--train-data-path', paths['train'], '--valid-data-path', paths['test'],
+                  '--model-output-path', paths['model'],
+                  '--metrics-output-path', os.path.join(work_dir, 'output', 'metrics.json'),
+                  '--encoder-path', paths['encoder'],
+                  '--compiled-model-output-path', os.path.join(work_dir, 'model', 'compiled_trees.npz'),
+                  '--training-mode', args.training_mode or ('iterator' if chunked else 'in-memory'),
+                  '--chunk-size', chunk_size] + perf('train') + experiment,
+        'evaluate': [sys.executable, script('evaluation_script.py'),
+                     '--model-path', paths['model'], '--valid-data-path', paths['test'],
+                     '--metrics-output-path', os.path.join(work_dir, 'output', 'eval_metrics.json'),
+                     '--chunk-size', chunk_size if chunked else '0'] + perf('evaluate') + experiment,
+        'score': [sys.executable, script('batch_scoring.py'),
+                  '--input-path', data_path, '--model-path', paths['model'], '--encoder-path', paths['encoder'],
+                  '--output-path', os.path.join(work_dir, 'output', 'scores', 'scores.parquet'),
+                  '--chunk-size', chunk_size] + experiment,
+    }
+
+
+def run_pipeline(args, data_path, work_dir, env, chunked):
+    """
+    One pass over the selected stages. Returns {stage: measurements}.
+    """
+    paths, commands = stage_commands(args, data_path, work_dir, chunked)
+    rows = {'preprocess': args.rows, 'score': args.rows}
+    measurements = {}
+    for stage in STAGES:
+        if stage not in args.stages:
+            continue
+        measurement = run_stage(stage, commands[stage], env, os.path.join(work_dir, 'logs', f'{stage}.log'))
+        if stage in ('train', 'evaluate') and stage not in rows:
+            rows['train'], rows['evaluate'] = count_rows(paths['train']), count_rows(paths['test'])
+        measurement['rows'] = rows[stage]
+        measurement['rows_per_second'] = round(rows[stage] / measurement['wall_seconds'], 1)
+        perf_path = os.path.join(work_dir, 'perf', f'{stage}.json')
+        if os.path.exists(perf_path):
+            with open(perf_path) as f:
+                measurement['spans'] = json.load(f)['spans']
+        logger.info(f"{stage}: {measurement['rows']} rows in {measurement['wall_seconds']:.1f}s "
+                    f"({measurement['rows_per_second']:.0f} rows/sec), {measurement['cpu_seconds']:.1f}s CPU, "
+                    f"peak RSS {measurement['peak_rss_mib']:.0f} MiB")
+        measurements[stage] = measurement
+    return measurements
+
+
+def main(args):
+    args.rows = synthetic_telco.parse_rows(args.rows)
+    name = args.name or f"pipeline-{args.rows_label}"
+    data_path = os.path.abspath(os.path.join(args.data_dir, f"telco_{args.rows_label}_seed{args.seed}.csv"))
+    if not os.path.exists(data_path):
+        synthetic_telco.write_csv(data_path, args.rows, args.seed)
+    chunked = args.rows > IN_MEMORY_MAX_ROWS if args.chunked is None else args.chunked
+
+    work_dir = os.path.abspath(args.work_dir or os.path.join(baselines.BENCHMARKS_DIR, 'work', name))
+    shutil.rmtree(work_dir, ignore_errors=True)
+    for sub_dir in ('logs', 'perf'):
+        os.makedirs(os.path.join(work_dir, sub_dir))
+
+    env = dict(os.environ)
+    env.setdefault('MLFLOW_TRACKING_URI', f"sqlite:///{os.path.join(work_dir, 'mlflow.db')}")
+    env['MLFLOW_SPOOL_DIR'] = os.path.join(work_dir, 'mlflow_spool')
+    env['SM_HP_NUM_ROUND'] = str(args.num_round)
+    env['SM_HP_EARLY_STOPPING_ROUNDS'] = '0'  # A fixed amount of training work
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [baselines.SCRIPTS_DIR, env.get('PYTHONPATH')]))
+    if env['MLFLOW_TRACKING_URI'].startswith('sqlite:'):
+        # Create the tracking database up front so its migrations are not timed as part of a stage
+        subprocess.run([sys.executable, '-c', 'import mlflow; mlflow.MlflowClient().search_experiments()'],
+                       env=env, cwd=work_dir, check=True, capture_output=True)
+
+    config = {
+        'rows': args.rows, 'seed': args.seed, 'stages': list(args.stages), 'format': args.format,
+        'chunked': chunked, 'chunk_size': args.chunk_size, 'training_mode': args.training_mode or ('iterator' if chunked else 'in-memory'),
+        'num_round': args.num_round, 'repeat': args.repeat, 'tracking_uri': env['MLFLOW_TRACKING_URI'],
+    }
+    result = baselines.new_result(name, 'pipeline', config)
+    runs = [run_pipeline(args, data_path, work_dir, env, chunked) for _ in range(args.repeat)]
+
+    # The median over repeats damps one-off noise such as a cold page cache
+    for stage in runs[0]:
+        for key in ('wall_seconds', 'cpu_seconds', 'rows_per_second', 'peak_rss_mib'):
+            result['metrics'][f"{stage}.{key}"] = statistics.median(run[stage][key] for run in runs)
+    result['details'] = {'runs': runs, 'work_dir': work_dir}
+    return baselines.finish(result, args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages on synthetic Telco data.")
+    parser.add_argument('--rows', type=str, default='100K', help='Rows of synthetic input, e.g. 10K, 1M, 100M.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--name', type=str, default=None, help='Result and baseline name (default: pipeline-<rows>).')
+    parser.add_argument('--stages', type=str, nargs='+', choices=STAGES, default=list(STAGES),
+                        help='Stages to run. Later stages need the outputs of earlier ones.')
+    parser.add_argument('--data-dir', type=str, default=os.path.join(baselines.BENCHMARKS_DIR, 'data'),
+                        help='Where the synthetic input is generated and reused from.')
+    parser.add_argument('--work-dir', type=str, default=None, help='Stage outputs and logs (default: benchmarks/work/<name>). Emptied first.')
+    parser.add_argument('--format', type=str, choices=('csv', 'parquet', 'arrow'), default='parquet', help='Handoff format between stages.')
+    parser.add_argument('--chunked', action='store_true', default=None,
+                        help=f'Use the chunked/iterator code paths (default: above {IN_MEMORY_MAX_ROWS} rows).')
+    parser.add_argument('--no-chunked', action='store_false', dest='chunked', help='Use the in-memory code paths at any size.')
+    parser.add_argument('--chunk-size', type=int, default=500000, help='Rows per chunk in the chunked code paths and batch scoring.')
+    parser.add_argument('--training-mode', type=str, choices=('in-memory', 'iterator', 'external-memory'), default=None,
+                        help='Overrides the training mode implied by --chunked.')
+    parser.add_argument('--num-round', type=int, default=100, help='Boosting rounds (early stopping is off).')
+    parser.add_argument('--repeat', type=int, default=1, help='Run the stages this many times and keep the median.')
+    parser.add_argument('--mlflow-experiment-name', type=str, default='Churn_Benchmark')
+    baselines.add_baseline_arguments(parser)
+    args = parser.parse_args()
+    args.rows_label = args.rows.strip().lower()
+    sys.exit(main(args))
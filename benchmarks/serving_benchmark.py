@@ -0,0 +1,276 @@
+"""
+Open-loop latency benchmark for model_server.py (or any Seldon REST endpoint).
+
+Requests from a JSON-lines payload file (see synthetic_telco.py --payloads-path) are
+sent at a fixed arrival rate, whatever the server's response times, as real
+traffic would arrive. Latency is measured from each request's scheduled send time,
+so time spent queueing behind a slow server (or waiting for a free connection) is
+counted instead of hidden, i.e. there is no coordinated omission. The report gives
+p50/p95/p99/max latency, the achieved rate and the error count.
+
+By default the benchmark starts model_server.py on a free local port with the model
+of a pipeline_benchmark.py run, and records the server's peak RSS and batching counters.
+
+    python3 benchmarks/serving_benchmark.py --rate 500 --duration 30 --save-baseline
+    python3 benchmarks/serving_benchmark.py --rate 500 --duration 30 --compiled --fail-on-regression
+    python3 benchmarks/serving_benchmark.py --url http://churn-model-server:9000 --rate 200
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import subprocess
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+import baselines
+import synthetic_telco
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PREDICTIONS_PATH = '/api/v1.0/predictions'
+DEFAULT_PAYLOADS_PATH = os.path.join(baselines.BENCHMARKS_DIR, 'data', 'requests.jsonl')
+DEFAULT_MODEL_DIR = os.path.join(baselines.BENCHMARKS_DIR, 'work', 'pipeline-100k', 'model')
+
+
+def load_payloads(path):
+    with open(path, 'rb') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def arrival_offsets(rate, duration, arrival, seed=0):
+    """
+    Send times (seconds from the start) for duration seconds at rate requests per
+    second: evenly spaced, or with exponential gaps for arrival='poisson'.
+    """
+    count = int(rate * duration)
+    if arrival == 'poisson':
+        offsets = np.cumsum(np.random.default_rng(seed).exponential(1.0 / rate, count))
+        return offsets[offsets < duration]
+    return np.arange(count) / rate
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP/1.1 connections to one host, opened on demand up to max_connections.
+    """
+
+    def __init__(self, host, port, max_connections):
+        self.host = host
+        self.port = port
+        self._idle = []
+        self._slots = asyncio.Semaphore(max_connections)
+
+    async def post(self, path, body, timeout):
+        """
+        POSTs body and returns (status, response body). Connections that fail are dropped.
+        """
+        async with self._slots:
+            reader, writer = self._idle.pop() if self._idle else await asyncio.open_connection(self.host, self.port)
+            try:
+                status, content = await asyncio.wait_for(self._exchange(reader, writer, path, body), timeout)
+            except BaseException:
+                writer.close()
+                raise
+            self._idle.append((reader, writer))
+            return status, content
+
+    async def _exchange(self, reader, writer, path, body):
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        return status, await reader.readexactly(length)
+
+    def close(self):
+        for _, writer in self._idle:
+            writer.close()
+
+
+async def replay(url, payloads, offsets, warmup_seconds, max_connections, timeout):
+    """
+    Sends payloads[i % len(payloads)] at start + offsets[i]. Returns the latencies (s)
+    of successful requests after the warm-up, the per-request send lag and the error count.
+    """
+    parsed = urllib.parse.urlparse(url)
+    pool = ConnectionPool(parsed.hostname, parsed.port or 80, max_connections)
+    path = parsed.path if parsed.path not in ('', '/') else PREDICTIONS_PATH
+    latencies, lags, errors = [], [], []
+    loop = asyncio.get_running_loop()
+    start = loop.time() + 0.1
+
+    async def send(index, offset):
+        scheduled = start + offset
+        try:
+            status, _ = await pool.post(path, payloads[index % len(payloads)], timeout)
+            ok = status == 200
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            ok = False
+            if not errors:
+                logger.warning(f"Request failed: {e!r}")
+        if offset < warmup_seconds:
+            return
+        if ok:
+            latencies.append(loop.time() - scheduled)
+        else:
+            errors.append(index)
+
+    # Each request becomes its own task at its send time, so a slow response never delays the next send
+    tasks = set()
+    for index, offset in enumerate(offsets):
+        delay = start + offset - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lags.append(loop.time() - start - offset)
+        task = asyncio.create_task(send(index, offset))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+    pool.close()
+    return np.asarray(latencies), np.asarray(lags), len(errors)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def http_get(url, timeout=2.0):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+def start_server(args, log_path):
+    """
+    Starts model_server.py on a free local port and waits until it answers /health/ping.
+    Returns (process, base URL).
+    """
+    port = free_port()
+    command = [sys.executable, os.path.join(baselines.SCRIPTS_DIR, 'model_server.py'),
+               '--model-path', os.path.join(args.model_dir, 'xgboost-model'),
+               '--encoder-path', os.path.join(args.model_dir, 'feature_encoder.json'),
+               '--host', '127.0.0.1', '--port', str(port),
+               '--max-batch-size', str(args.max_batch_size), '--max-wait-ms', str(args.max_wait_ms),
+               '--predict-threads', str(args.predict_threads)]
+    if args.compiled:
+        command += ['--compiled-model-path', os.path.join(args.model_dir, 'compiled_trees.npz')]
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    log = open(log_path, 'w')
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"model_server.py exited with code {process.returncode}; see {log_path}")
+        try:
+            http_get(f"{base_url}/health/ping")
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"model_server.py did not become ready; see {log_path}")
+
+
+def peak_rss_mib(pid):
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return round(int(line.split()[1]) / 1024, 1)
+    return None
+
+
+def main(args):
+    if not os.path.exists(args.payloads_path):
+        synthetic_telco.write_payloads(args.payloads_path, 10000)
+    payloads = load_payloads(args.payloads_path)
+    offsets = arrival_offsets(args.rate, args.warmup_seconds + args.duration, args.arrival)
+    name = args.name or f"serving-{'compiled' if args.compiled else 'xgboost'}-{args.rate:g}rps"
+    config = {
+        'rate': args.rate, 'duration': args.duration, 'warmup_seconds': args.warmup_seconds, 'arrival': args.arrival,
+        'payloads_path': args.payloads_path, 'payloads': len(payloads), 'max_connections': args.max_connections,
+        'url': args.url, 'compiled': args.compiled, 'max_batch_size': args.max_batch_size,
+        'max_wait_ms': args.max_wait_ms, 'predict_threads': args.predict_threads,
+    }
+    result = baselines.new_result(name, 'serving', config)
+
+    process = None
+    url = args.url
+    if not url:
+        process, url = start_server(args, os.path.join(baselines.BENCHMARKS_DIR, 'work', name, 'model_server.log'))
+    try:
+        logger.info(f"Sending {len(offsets)} requests to {url} over {args.warmup_seconds + args.duration:g}s "
+                    f"({args.arrival} arrivals at {args.rate:g}/s, first {args.warmup_seconds:g}s are warm-up).")
+        latencies, lags, errors = asyncio.run(
+            replay(url, payloads, offsets, args.warmup_seconds, args.max_connections, args.timeout))
+        if process is not None:
+            result['metrics']['server_peak_rss_mib'] = peak_rss_mib(process.pid)
+            result['details']['server_status'] = json.loads(http_get(f"{url}/health/status"))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    measured = len(latencies) + errors
+    if len(latencies):
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+        result['metrics'].update({
+            'latency_p50_ms': round(p50, 3), 'latency_p95_ms': round(p95, 3), 'latency_p99_ms': round(p99, 3),
+            'latency_max_ms': round(latencies.max() * 1000, 3),
+        })
+    result['metrics']['achieved_requests_per_second'] = round(measured / args.duration, 1)
+    result['metrics']['errors'] = errors
+    lag_p99 = float(np.percentile(lags, 99) * 1000) if len(lags) else 0.0
+    result['details']['client_send_lag_p99_ms'] = round(lag_p99, 3)
+    if lag_p99 > 5:
+        logger.warning(f"The client sent requests up to {lag_p99:.1f} ms late (p99); it may be the bottleneck at this rate.")
+
+    logger.info(f"{measured} requests measured, {errors} error(s). Latency p50 {result['metrics'].get('latency_p50_ms')} ms, "
+                f"p95 {result['metrics'].get('latency_p95_ms')} ms, p99 {result['metrics'].get('latency_p99_ms')} ms, "
+                f"max {result['metrics'].get('latency_max_ms')} ms.")
+    if 'server_status' in result['details']:
+        status = result['details']['server_status']
+        logger.info(f"Server: {status['rows'] / max(status['batches'], 1):.1f} rows per batch, "
+                    f"peak RSS {result['metrics']['server_peak_rss_mib']} MiB.")
+    return baselines.finish(result, args)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay Seldon requests at a fixed arrival rate and report latency percentiles.")
+    parser.add_argument('--payloads-path', type=str, default=DEFAULT_PAYLOADS_PATH,
+                        help='Request bodies, one JSON object per line. Generated if missing.')
+    parser.add_argument('--rate', type=float, default=200.0, help='Requests per second.')
+    parser.add_argument('--duration', type=float, default=30.0, help='Measured seconds, after the warm-up.')
+    parser.add_argument('--warmup-seconds', type=float, default=3.0, help='Initial seconds at the same rate that are not measured.')
+    parser.add_argument('--arrival', type=str, choices=('constant', 'poisson'), default='poisson',
+                        help='Evenly spaced requests, or Poisson arrivals as from many independent clients.')
+    parser.add_argument('--max-connections', type=int, default=256, help='Concurrent connections the client may open.')
+    parser.add_argument('--timeout', type=float, default=10.0, help='Seconds before a request counts as an error.')
+    parser.add_argument('--name', type=str, default=None, help='Result and baseline name (default: serving-<model>-<rate>rps).')
+    parser.add_argument('--url', type=str, default=None,
+                        help='Benchmark a running server (e.g. http://localhost:9000) instead of starting model_server.py.')
+    parser.add_argument('--model-dir', type=str, default=DEFAULT_MODEL_DIR,
+                        help='Directory holding xgboost-model, feature_encoder.json and compiled_trees.npz.')
+    parser.add_argument('--compiled', action='store_true', help='Serve compiled_trees.npz instead of the XGBoost model.')
+    parser.add_argument('--max-batch-size', type=int, default=256)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+    parser.add_argument('--predict-threads', type=int, default=1)
+    baselines.add_baseline_arguments(parser)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,180 @@
+import time
+import logging
+import argparse
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import data_io
+import drift_monitor
+from feature_encoding import load_encoder, ID_COLUMN
+from pod_resources import available_cpus, peak_rss_bytes
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# --- Worker side ---
+
+_worker_state = {}
+
+
+def _init_worker(model_path, encoder_path, nthread, drift_baseline_path=None):
+    """
+    Runs once per worker process: loads the model, the feature encoder and, for drift
+    monitoring, the baseline profile.
+    """
+    import xgboost as xgb
+
+    booster = xgb.Booster()
+    booster.load_model(model_path)
+    booster.set_param({'nthread': nthread})
+    _worker_state.update(booster=booster, encoder=load_encoder(encoder_path))
+    if drift_baseline_path:
+        _worker_state['baseline'] = drift_monitor.Profile.load(drift_baseline_path)
+
+
+def score_chunk(chunk):
+    """
+    Encodes one chunk of raw customer records and returns (customer ids, churn
+    probabilities, this worker's peak RSS in bytes, drift profile of the chunk or None).
+    """
+    encoder = _worker_state['encoder']
+    features = encoder.transform_columns({col: chunk[col].to_numpy() for col in encoder.feature_columns})
+    probabilities = _worker_state['booster'].inplace_predict(features).astype(np.float32)
+    ids = chunk[ID_COLUMN].to_numpy() if ID_COLUMN in chunk.columns else None
+    profile = None
+    if 'baseline' in _worker_state:
+        # A few KiB of counts per chunk; the driver adds them up
+        profile = _worker_state['baseline'].empty()
+        profile.update(features)
+    return ids, probabilities, peak_rss_bytes(), profile
+
+
+# --- Driver side ---
+
+def score_file(input_path, model_path, encoder_path, output_path, chunk_size=100000, workers=None,
+               threads_per_worker=1, threshold=0.5, progress_interval=10.0, drift_baseline_path=None):
+    """
+    Streams input_path in chunks through a process pool and appends the churn
+    probabilities to output_path in input order. At most 2 * workers chunks are in
+    flight at once, so memory is bounded by the chunk size, not the input size.
+    With drift_baseline_path the encoded rows are also profiled against the training
+    baseline. Returns (dict of run statistics, drift profile of the input or None).
+    """
+    workers = workers or max(1, available_cpus() // threads_per_worker)
+    max_in_flight = 2 * workers
+    logger.info(f"Scoring {input_path} with {workers} worker(s) x {threads_per_worker} thread(s), chunks of {chunk_size} rows.")
+
+    stats = {'rows': 0, 'chunks': 0, 'worker_peak_rss_bytes': 0}
+    drift = {'profile': None}
+    start = last_report = time.time()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(model_path, encoder_path, threads_per_worker, drift_baseline_path)) as executor, \
+            data_io.FrameWriter(output_path) as writer:
+        pending = collections.deque()
+
+        def write_next():
+            ids, probabilities, worker_rss, profile = pending.popleft().result()
+            output = pd.DataFrame({
+                'churn_probability': probabilities,
+                'churn_prediction': (probabilities > threshold).astype(np.int8),
+            })
+            if ids is not None:
+                output.insert(0, ID_COLUMN, ids)
+            writer.write(output)
+            stats['rows'] += len(output)
+            stats['chunks'] += 1
+            stats['worker_peak_rss_bytes'] = max(stats['worker_peak_rss_bytes'], worker_rss)
+            if profile is not None:
+                drift['profile'] = profile if drift['profile'] is None else drift['profile'].merge(profile)
+
+        for chunk in data_io.iter_frames(input_path, chunk_size):
+            if len(pending) >= max_in_flight:
+                write_next()
+            pending.append(executor.submit(score_chunk, chunk))
+
+            now = time.time()
+            if now - last_report >= progress_interval:
+                elapsed = now - start
+                logger.info(f"Progress: {stats['rows']} rows scored, {stats['rows'] / elapsed:.0f} rows/sec, "
+                            f"driver peak RSS {peak_rss_bytes() / 2**20:.0f} MiB, "
+                            f"worker peak RSS {stats['worker_peak_rss_bytes'] / 2**20:.0f} MiB")
+                last_report = now
+        while pending:
+            write_next()
+
+    stats['seconds'] = time.time() - start
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    stats['driver_peak_rss_bytes'] = peak_rss_bytes()
+    stats['workers'] = workers
+    logger.info(f"Scored {stats['rows']} rows in {stats['seconds']:.1f}s ({stats['rows_per_second']:.0f} rows/sec). "
+                f"Peak RSS: driver {stats['driver_peak_rss_bytes'] / 2**20:.0f} MiB, "
+                f"worker {stats['worker_peak_rss_bytes'] / 2**20:.0f} MiB.")
+    return stats, drift['profile']
+
+
+def main(args):
+    # Imported here rather than at module level so spawned workers do not load mlflow
+    import tracking
+
+    with tracking.start_run(args.mlflow_experiment_name, run_name="batch_scoring_run") as run:
+        run.log_params({
+            'input_path': args.input_path,
+            'model_path': args.model_path,
+            'encoder_path': args.encoder_path,
+            'output_path': args.output_path,
+            'chunk_size': args.chunk_size,
+            'threads_per_worker': args.threads_per_worker,
+            'decision_threshold': args.decision_threshold,
+            'drift_baseline_path': args.drift_baseline_path,
+        })
+        stats, profile = score_file(
+            args.input_path, args.model_path, args.encoder_path, args.output_path,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            threads_per_worker=args.threads_per_worker,
+            threshold=args.decision_threshold,
+            progress_interval=args.progress_interval,
+            drift_baseline_path=args.drift_baseline_path,
+        )
+        run.log_metrics({name: float(value) for name, value in stats.items()})
+        if profile is not None:
+            report = drift_monitor.compare(drift_monitor.Profile.load(args.drift_baseline_path), profile)
+            drift_monitor.log_report(run, report)
+            log = logger.warning if report['status'] == 'drift' else logger.info
+            log(f"Drift of the scoring input: {drift_monitor.summarize(report)}")
+            if args.drift_profile_output_path:
+                # For drift_monitor.py --profiles-dir, e.g. the check in front of deploy-seldon-model
+                profile.save(args.drift_profile_output_path)
+        run.set_tag("batch_scoring_status", "completed")
+    logger.info("Batch scoring script finished.")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score raw customer records with the trained XGBoost model.")
+    parser.add_argument('--input-path', type=str, default='/opt/ml/processing/input/WA_Fn-UseC_-Telco-Customer-Churn.csv',
+                        help='Raw customer records (CSV, Parquet or Arrow IPC) with the same columns as the training input.')
+    parser.add_argument('--model-path', type=str, default='/opt/ml/processing/model/xgboost-model',
+                        help='Model saved by xgboost_script.py.')
+    parser.add_argument('--encoder-path', type=str, default='/opt/ml/processing/model/feature_encoder.json',
+                        help='Feature encoder saved by preprocessing.py.')
+    parser.add_argument('--output-path', type=str, default='/opt/ml/processing/output/scores/scores.parquet',
+                        help='Where to write customerID, churn_probability and churn_prediction. Format from the extension.')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows per chunk.')
+    parser.add_argument('--workers', type=int, default=0, help='Worker processes. Defaults to pod CPUs / threads per worker.')
+    parser.add_argument('--threads-per-worker', type=int, default=1, help='XGBoost threads per worker.')
+    parser.add_argument('--decision-threshold', type=float, default=0.5, help='Probabilities above this give churn_prediction = 1.')
+    parser.add_argument('--progress-interval', type=float, default=10.0, help='Seconds between progress log lines.')
+    parser.add_argument('--drift-baseline-path', type=str, default=None,
+                        help='Drift baseline from preprocessing.py; the input is then scored for drift and the result logged.')
+    parser.add_argument('--drift-profile-output-path', type=str, default=None,
+                        help='Where to save the drift profile of the input, for drift_monitor.py --profiles-dir.')
+    parser.add_argument('--mlflow-experiment-name', type=str, default="Churn_Prediction_Scoring", help="Name of the MLflow experiment.")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,171 @@
+"""
+Binary classification metrics computed from one sort of the scores.
+
+Sorting the scores once gives cumulative true/false positive counts at every distinct
+threshold. ROC AUC, PR AUC (average precision) and precision/recall/F1/accuracy at
+any threshold are then read off those arrays instead of re-scanning the data per metric.
+"""
+import numpy as np
+
+
+def score_curve(y_true, y_score):
+    """
+    Returns (thresholds, tps, fps): the distinct scores in decreasing order and the
+    number of positives/negatives scoring at or above each of them.
+    """
+    y_true = np.asarray(y_true).astype(bool)
+    y_score = np.asarray(y_score)
+    order = np.argsort(-y_score, kind='mergesort')
+    y_score = y_score[order]
+    y_true = y_true[order]
+    # Last index of each run of equal scores
+    distinct = np.flatnonzero(np.diff(y_score))
+    ends = np.r_[distinct, len(y_score) - 1]
+    tps = np.cumsum(y_true, dtype=np.int64)[ends]
+    fps = (ends + 1) - tps
+    return y_score[ends], tps, fps
+
+
+def roc_auc_from_curve(tps, fps):
+    if tps[-1] == 0 or fps[-1] == 0:
+        return float('nan')
+    tpr = np.r_[0, tps] / tps[-1]
+    fpr = np.r_[0, fps] / fps[-1]
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+
+def average_precision_from_curve(tps, fps):
+    """
+    Area under the precision-recall curve as the step-wise sum used by sklearn's
+    average_precision_score.
+    """
+    if tps[-1] == 0:
+        return float('nan')
+    precision = tps / (tps + fps)
+    recall = tps / tps[-1]
+    return float(np.sum(np.diff(np.r_[0, recall]) * precision))
+
+
+def threshold_sweep(thresholds, tps, fps):
+    """
+    Precision, recall and F1 when predicting positive for scores >= each threshold.
+    """
+    n_pos = tps[-1]
+    precision = tps / np.maximum(tps + fps, 1)
+    recall = tps / n_pos if n_pos else np.zeros(len(tps))
+    denominator = precision + recall
+    f1 = np.divide(2 * precision * recall, denominator, out=np.zeros(len(tps)), where=denominator > 0)
+    return {'threshold': thresholds, 'precision': precision, 'recall': recall, 'f1': f1}
+
+
+def metrics_at_threshold(thresholds, tps, fps, threshold):
+    """
+    Accuracy, precision, recall and F1 when predicting positive for scores > threshold,
+    the rule XGBClassifier.predict uses with threshold 0.5.
+    """
+    n_pos, n_neg = tps[-1], fps[-1]
+    above = int(np.searchsorted(-thresholds, -threshold, side='left'))  # thresholds are decreasing
+    tp = tps[above - 1] if above else 0
+    fp = fps[above - 1] if above else 0
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / n_pos if n_pos else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    accuracy = (tp + (n_neg - fp)) / (n_pos + n_neg)
+    return {'accuracy': float(accuracy), 'precision': float(precision), 'recall': float(recall), 'f1_score': float(f1)}
+
+
+def bootstrap_intervals(y_true, y_score, threshold=0.5, n_bootstrap=200, confidence=0.95, n_bins=1000,
+                        random_state=42, max_block_cells=1 << 22):
+    """
+    Percentile confidence intervals for auc, pr_auc, accuracy, precision, recall and f1_score.
+
+    Uses the Poisson bootstrap: each resample weights every row with a Poisson(1) count.
+    Scores are binned into n_bins equal-width bins over [0, 1] (threshold * n_bins should
+    be a whole number so the threshold is a bin edge), and the weighted positive
+    and negative counts per bin are accumulated into two (n_bootstrap, n_bins) matrices,
+    one row block at a time, so memory does not grow with the number of rows. All
+    resamples' metrics are then computed at once from cumulative sums over the bins. AUC
+    and PR AUC are therefore accurate to the bin width.
+    """
+    y_true = np.asarray(y_true).astype(bool)
+    y_score = np.clip(np.asarray(y_score, dtype=np.float64), 0.0, 1.0)
+    rng = np.random.default_rng(random_state)
+    # Bin b holds scores in (b / n_bins, (b + 1) / n_bins], so a score equal to the
+    # threshold falls below it, as in metrics_at_threshold()
+    bins = np.clip(np.ceil(y_score * n_bins).astype(np.int64) - 1, 0, n_bins - 1)
+
+    pos = np.zeros(n_bootstrap * n_bins)
+    neg = np.zeros(n_bootstrap * n_bins)
+    offsets = (np.arange(n_bootstrap, dtype=np.int64) * n_bins)[:, None]
+    block_rows = max(1, max_block_cells // n_bootstrap)
+    for start in range(0, len(y_true), block_rows):
+        block_bins = bins[start:start + block_rows]
+        block_true = y_true[start:start + block_rows]
+        weights = rng.poisson(1.0, size=(n_bootstrap, len(block_bins))).astype(np.float64)
+        index = (offsets + block_bins[None, :]).ravel()
+        pos += np.bincount(index, weights=(weights * block_true).ravel(), minlength=n_bootstrap * n_bins)
+        neg += np.bincount(index, weights=(weights * ~block_true).ravel(), minlength=n_bootstrap * n_bins)
+    pos = pos.reshape(n_bootstrap, n_bins)[:, ::-1]  # Highest scores first
+    neg = neg.reshape(n_bootstrap, n_bins)[:, ::-1]
+
+    tps = np.cumsum(pos, axis=1)
+    fps = np.cumsum(neg, axis=1)
+    n_pos = tps[:, -1:]
+    n_neg = fps[:, -1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # AUC: each positive beats the negatives in lower bins and ties half of its own bin
+        auc = np.sum(pos * (n_neg - fps + neg / 2), axis=1) / (n_pos[:, 0] * n_neg[:, 0])
+        precision_curve = tps / np.maximum(tps + fps, 1e-12)
+        pr_auc = np.sum(pos / n_pos * precision_curve, axis=1)
+
+        # Bins strictly above the threshold are predicted positive
+        above = n_bins - int(np.ceil(threshold * n_bins))
+        tp = tps[:, above - 1] if above > 0 else np.zeros(n_bootstrap)
+        fp = fps[:, above - 1] if above > 0 else np.zeros(n_bootstrap)
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = tp / n_pos[:, 0]
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        accuracy = (tp + n_neg[:, 0] - fp) / (n_pos[:, 0] + n_neg[:, 0])
+
+    alpha = (1 - confidence) / 2
+    intervals = {}
+    for name, values in (('auc', auc), ('pr_auc', pr_auc), ('accuracy', accuracy),
+                         ('precision', precision), ('recall', recall), ('f1_score', f1)):
+        lower, upper = np.nanquantile(values, [alpha, 1 - alpha])
+        intervals[name] = (float(lower), float(upper))
+    return intervals
+
+
+def evaluate_scores(y_true, y_score, threshold=0.5, n_bootstrap=0, confidence=0.95, random_state=42):
+    """
+    Computes every metric from a single sort of y_score.
+    Returns (metrics, sweep): metrics is a flat dict of floats (with *_ci_lower/*_ci_upper
+    entries when n_bootstrap > 0) and sweep is threshold_sweep() over all distinct scores.
+    """
+    thresholds, tps, fps = score_curve(y_true, y_score)
+    metrics = metrics_at_threshold(thresholds, tps, fps, threshold)
+    metrics['auc'] = roc_auc_from_curve(tps, fps)
+    metrics['pr_auc'] = average_precision_from_curve(tps, fps)
+
+    sweep = threshold_sweep(thresholds, tps, fps)
+    best = int(np.argmax(sweep['f1']))
+    metrics['best_f1_score'] = float(sweep['f1'][best])
+    metrics['best_f1_threshold'] = float(sweep['threshold'][best])
+
+    if n_bootstrap:
+        intervals = bootstrap_intervals(y_true, y_score, threshold, n_bootstrap, confidence, random_state=random_state)
+        for name, (lower, upper) in intervals.items():
+            metrics[f'{name}_ci_lower'] = lower
+            metrics[f'{name}_ci_upper'] = upper
+    return metrics, sweep
+
+
+def downsample_sweep(sweep, max_points=1000):
+    """
+    Thins the threshold sweep to at most max_points evenly spaced rows for logging.
+    """
+    n = len(sweep['threshold'])
+    if n <= max_points:
+        return sweep
+    index = np.unique(np.linspace(0, n - 1, max_points).astype(np.int64))
+    return {name: values[index] for name, values in sweep.items()}
@@ -0,0 +1,285 @@
+"""
+Parallel k-fold cross-validation over a shared, quantized copy of the processed data.
+
+The data is quantized once into uint8 codes (see shared_dataset.py) and its rows are
+reordered once so that every fold is a contiguous block. A fold's validation set is
+then a slice of the shared arrays and its training set the slices before and after
+it, all zero-copy views that a DataIter feeds straight into a QuantileDMatrix. The
+folds train concurrently on a process pool; each fold gets nthread so that the
+folds running at the same time use exactly the pod's CPUs.
+
+    stratified: rows are dealt into k folds per class, so every fold has the churn rate
+                of the whole data set.
+    time:       the rows are ordered by arrival batch (the base files, then each
+                incremental refresh's files, see watermark.py). The last k batches
+                are the validation folds, each trained on every batch before it, so
+                the model is always scored on data newer than what it was trained on.
+                The rows inside a file carry no time order (the in-memory split
+                shuffles them), so this needs at least two batches.
+
+xgboost_script.py runs this with --cv-folds before training the final model, and logs
+the mean and spread of each metric over the folds. It can also run on its own:
+
+    python3 scripts/cross_validation.py --data-paths train.parquet test.parquet --folds 5
+"""
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import data_io
+import tracking
+import binary_metrics
+from pod_resources import available_cpus
+from shared_dataset import compute_cuts, quantize, SharedArrays, MISSING_CODE
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ('stratified', 'time')
+SUMMARY_METRICS = ('auc', 'pr_auc', 'accuracy', 'precision', 'recall', 'f1_score', 'best_num_round')
+
+
+def load_codes(paths, chunk_size, frames=None, max_bin=256):
+    """
+    Reads the processed files (or frames, target first) in order and returns the
+    features as uint8 codes, the labels as float32 and, per row, the index of the
+    file or frame it came from. Cuts come from the first chunk, so only the codes of
+    the whole data set are ever held in memory.
+    """
+    if frames is None:
+        frames = ((index, chunk) for index, path in enumerate(paths) for chunk in data_io.iter_frames(path, chunk_size))
+    else:
+        frames = enumerate(frames)
+    cuts = None
+    codes, labels, sources = [], [], []
+    for index, frame in frames:
+        X, y = data_io.split_features_target(frame)
+        if cuts is None:
+            cuts = compute_cuts(X.to_numpy(dtype=np.float32), max_bin)
+        codes.append(quantize(X.to_numpy(dtype=np.float32), cuts))
+        labels.append(y.to_numpy(dtype=np.float32))
+        sources.append(np.full(len(y), index, dtype=np.int32))
+    return np.concatenate(codes), np.concatenate(labels), np.concatenate(sources)
+
+
+def stratified_order(y, folds, random_state):
+    """
+    Deals the shuffled rows of each class into folds round-robin. Returns (order,
+    bounds): rows in fold order and the start of each fold in that order (plus the end).
+    """
+    rng = np.random.default_rng(random_state)
+    assignment = np.empty(len(y), dtype=np.int32)
+    for label in np.unique(y):
+        members = rng.permutation(np.flatnonzero(y == label))
+        assignment[members] = np.arange(len(members)) % folds
+    order = np.argsort(assignment, kind='stable')
+    bounds = np.searchsorted(assignment[order], np.arange(folds + 1))
+    return order, bounds
+
+
+def time_order(batches):
+    """
+    Rows sorted by arrival batch (stable, so file order within a batch). Returns
+    (order, bounds): the start of each batch in that order (plus the end).
+    """
+    order = np.argsort(batches, kind='stable')
+    bounds = np.searchsorted(batches[order], np.unique(batches))
+    return order, np.append(bounds, len(batches))
+
+
+def fold_plan(strategy, n_rows, bounds, folds):
+    """
+    [(train row ranges, validation row range)] per fold, as (start, stop) pairs into
+    the reordered arrays. For 'time', bounds are the batch starts and the last folds
+    batches (at most all but the first) are validated on.
+    """
+    if strategy == 'stratified':
+        return [([(0, bounds[i]), (bounds[i + 1], n_rows)], (bounds[i], bounds[i + 1])) for i in range(folds)]
+    n_batches = len(bounds) - 1
+    return [([(0, bounds[j])], (bounds[j], bounds[j + 1])) for j in range(max(1, n_batches - folds), n_batches)]
+
+
+def thread_counts(folds, cpus):
+    """
+    XGBoost threads per fold. At most cpus folds run at once, and the ones running
+    together use cpus threads between them.
+    """
+    workers = max(1, min(folds, cpus))
+    return workers, [cpus // workers + (1 if i % workers < cpus % workers else 0) for i in range(folds)]
+
+
+# --- Worker side ---
+
+_worker_state = {}
+
+
+def _init_worker(spec):
+    _worker_state['shared'] = SharedArrays.attach(spec)
+
+
+def _make_range_iter(X, y, ranges):
+    import xgboost as xgb
+
+    class RangeIter(xgb.DataIter):
+        # Feeds the given row ranges of the shared arrays as views, without copying
+        def __init__(self):
+            self._position = 0
+            super().__init__()
+
+        def next(self, input_data):
+            while self._position < len(ranges):
+                start, stop = ranges[self._position]
+                self._position += 1
+                if stop > start:
+                    input_data(data=X[start:stop], label=y[start:stop])
+                    return True
+            return False
+
+        def reset(self):
+            self._position = 0
+
+    return RangeIter()
+
+
+def _train_fold(fold, params, train_ranges, valid_range, num_round, early_stopping_rounds, nthread):
+    import xgboost as xgb
+
+    start_time = time.time()
+    X, y = _worker_state['shared']['X'], _worker_state['shared']['y']
+    # max_bin must match the booster's in both matrices, or xgb.train rejects them
+    max_bin = params.get('max_bin', 256)
+    dtrain = xgb.QuantileDMatrix(_make_range_iter(X, y, train_ranges), missing=MISSING_CODE, max_bin=max_bin, nthread=nthread)
+    start, stop = valid_range
+    dvalid = xgb.QuantileDMatrix(X[start:stop], y[start:stop], missing=MISSING_CODE, ref=dtrain, max_bin=max_bin, nthread=nthread)
+    booster = xgb.train(
+        dict(params, nthread=nthread),
+        dtrain,
+        num_boost_round=num_round,
+        evals=[(dvalid, 'validation')],
+        early_stopping_rounds=early_stopping_rounds or None,
+        verbose_eval=False,
+    )
+    best_iteration = booster.attr('best_iteration')
+    best_num_round = int(best_iteration) + 1 if best_iteration is not None else booster.num_boosted_rounds()
+    scores = booster.predict(dvalid, iteration_range=(0, best_num_round))
+    metrics, _ = binary_metrics.evaluate_scores(y[start:stop], scores)
+    return {
+        'fold': fold,
+        'train_rows': int(sum(stop - start for start, stop in train_ranges)),
+        'valid_rows': int(stop - start),
+        'best_num_round': best_num_round,
+        'seconds': round(time.time() - start_time, 3),
+        **{name: metrics[name] for name in SUMMARY_METRICS if name in metrics},
+    }
+
+
+# --- Driver side ---
+
+def summarize(fold_results):
+    """
+    {metric: {'mean', 'std', 'min', 'max'}} over the folds.
+    """
+    summary = {}
+    for name in SUMMARY_METRICS:
+        values = np.array([result[name] for result in fold_results], dtype=np.float64)
+        summary[name] = {'mean': float(values.mean()), 'std': float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+                         'min': float(values.min()), 'max': float(values.max())}
+    return summary
+
+
+def cross_validate(X_codes, y, params, num_round, early_stopping_rounds, folds=5, strategy='stratified',
+                   random_state=42, cpus=None, batches=None):
+    """
+    Trains one model per fold on the uint8 codes from load_codes() and returns
+    (per-fold results, summary). params are xgb.train() parameters without nthread.
+    The 'time' strategy needs batches, the arrival batch of every row (0 for the
+    oldest), with at least two distinct values.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown CV strategy '{strategy}'. Expected one of {STRATEGIES}.")
+    if folds < 2:
+        raise ValueError("Cross-validation needs at least 2 folds")
+    n_rows = len(y)
+    if strategy == 'stratified':
+        order, bounds = stratified_order(y, folds, random_state)
+    else:
+        if batches is None or len(np.unique(batches)) < 2:
+            raise ValueError("Time-ordered cross-validation needs rows from at least two arrival batches "
+                             "(e.g. the base files and an incremental refresh); use the stratified strategy.")
+        order, bounds = time_order(batches)
+    plan = fold_plan(strategy, n_rows, bounds, folds)
+    if len(plan) < folds:
+        logger.warning(f"Only {len(bounds) - 1} arrival batches: running {len(plan)} time-ordered fold(s) instead of {folds}.")
+        folds = len(plan)
+
+    # Rows are gathered in fold order straight into shared memory, so every fold is a
+    # contiguous block; the driver's X_codes is the only other copy
+    shared = SharedArrays.allocate({'X': (X_codes.shape, X_codes.dtype), 'y': (y.shape, y.dtype)})
+    np.take(X_codes, order, axis=0, out=shared['X'])
+    np.take(y, order, out=shared['y'])
+    workers, threads = thread_counts(folds, cpus or available_cpus())
+    logger.info(f"{folds}-fold {strategy} cross-validation on {n_rows} rows: {workers} worker(s), "
+                f"threads per fold {threads}.")
+
+    start_time = time.time()
+    try:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(shared.spec(),)) as executor:
+            futures = [
+                executor.submit(_train_fold, fold, params, train_ranges, valid_range, num_round,
+                                early_stopping_rounds, threads[fold])
+                for fold, (train_ranges, valid_range) in enumerate(plan)
+            ]
+            fold_results = [future.result() for future in futures]
+    finally:
+        shared.unlink()
+
+    summary = summarize(fold_results)
+    for result in fold_results:
+        logger.info(f"Fold {result['fold']}: {result['train_rows']} train / {result['valid_rows']} validation rows, "
+                    f"AUC {result['auc']:.4f}, {result['best_num_round']} rounds, {result['seconds']:.1f}s")
+    logger.info(f"Cross-validated AUC {summary['auc']['mean']:.4f} +/- {summary['auc']['std']:.4f} "
+                f"(min {summary['auc']['min']:.4f}) in {time.time() - start_time:.1f}s.")
+    return fold_results, summary
+
+
+def log_results(run, fold_results, summary, strategy):
+    """
+    Logs cv_<metric>_mean/_std/_min, per-fold cv_<metric> (step = fold) and the full results as JSON.
+    """
+    run.log_params({'cv_folds': len(fold_results), 'cv_strategy': strategy})
+    metrics = {}
+    for name, stats in summary.items():
+        metrics.update({f"cv_{name}_mean": stats['mean'], f"cv_{name}_std": stats['std'], f"cv_{name}_min": stats['min']})
+    run.log_metrics(metrics)
+    for result in fold_results:
+        run.log_metrics({f"cv_{name}": result[name] for name in ('auc', 'pr_auc', 'accuracy')}, step=result['fold'])
+    run.log_dict({'strategy': strategy, 'summary': summary, 'folds': fold_results}, "cross_validation/cv_results.json")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from xgboost_script import read_hyperparameters, booster_params
+
+    parser = argparse.ArgumentParser(description="Parallel k-fold cross-validation of the XGBoost model on the processed data.")
+    parser.add_argument('--data-paths', type=str, nargs='+',
+                        default=['/opt/ml/processing/output/train/train.parquet', '/opt/ml/processing/output/test/test.parquet'],
+                        help='Processed files to cross-validate on (all rows are used). With --strategy time each file is one arrival batch, oldest first.')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--strategy', type=str, choices=STRATEGIES, default='stratified')
+    parser.add_argument('--chunk-size', type=int, default=1000000, help='Rows read at a time while quantizing.')
+    parser.add_argument('--random-state', type=int, default=42)
+    parser.add_argument('--mlflow-experiment-name', type=str, default="Churn_Prediction_XGBoost", help="Name of the MLflow experiment.")
+    args = parser.parse_args()
+
+    hp = read_hyperparameters()
+    X_codes, y, sources = load_codes(args.data_paths, args.chunk_size, max_bin=hp['max_bin'])
+    fold_results, summary = cross_validate(X_codes, y, booster_params(hp), hp['num_round'], hp['early_stopping_rounds'],
+                                           args.folds, args.strategy, args.random_state, batches=sources)
+    with tracking.start_run(args.mlflow_experiment_name, run_name="xgboost_cv_run") as run:
+        run.log_params({'data_paths': ','.join(args.data_paths), **{k: v for k, v in hp.items() if k != 'nthread'}})
+        log_results(run, fold_results, summary, args.strategy)
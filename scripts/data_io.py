@@ -0,0 +1,264 @@
+"""
+Read/write helpers for the data handed between the preprocess, train and evaluate steps.
+
+CSV is kept as the fallback. Parquet and Arrow IPC files carry typed columns
+(int8 codes, float32 charges) and are memory-mapped on read instead of parsed.
+"""
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('csv', 'parquet', 'arrow')
+DMATRIX_EXTENSIONS = ('.dmatrix', '.buffer')
+
+_EXTENSIONS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+}
+_DEFAULT_EXTENSION = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+
+def format_from_path(path):
+    """
+    Infers the file format from the extension. Unknown extensions are treated as CSV.
+    """
+    return _EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+
+def with_format_extension(path, fmt):
+    """
+    Returns path with its extension swapped for fmt's, unless it already matches fmt.
+    """
+    if format_from_path(path) == fmt:
+        return path
+    return os.path.splitext(path)[0] + _DEFAULT_EXTENSION[fmt]
+
+
+# --- Column typing ---
+
+def column_ranges(df):
+    """
+    Returns {column: (kind, min, max)} for the numeric columns of df, where kind is 'i' or 'f'.
+    Ranges from several chunks can be combined with merge_column_ranges().
+    """
+    ranges = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_bool_dtype(values) or pd.api.types.is_integer_dtype(values):
+            kind = 'i'
+        elif pd.api.types.is_float_dtype(values):
+            kind = 'f'
+        else:
+            continue
+        if len(values) == 0:
+            continue
+        ranges[col] = (kind, values.min(), values.max())
+    return ranges
+
+
+def merge_column_ranges(left, right):
+    merged = dict(left)
+    for col, (kind, lo, hi) in right.items():
+        if col in merged:
+            prev_kind, prev_lo, prev_hi = merged[col]
+            kind = 'f' if 'f' in (kind, prev_kind) else 'i'
+            lo, hi = min(lo, prev_lo), max(hi, prev_hi)
+        merged[col] = (kind, lo, hi)
+    return merged
+
+
+def choose_dtypes(ranges):
+    """
+    Picks the narrowest dtype that holds every value seen: int8/int16/int32 for
+    integer columns (label codes, flags, tenure) and float32 for float columns.
+    """
+    dtypes = {}
+    for col, (kind, lo, hi) in ranges.items():
+        if kind == 'f':
+            dtypes[col] = np.float32
+            continue
+        for candidate in (np.int8, np.int16, np.int32, np.int64):
+            info = np.iinfo(candidate)
+            if info.min <= lo and hi <= info.max:
+                dtypes[col] = candidate
+                break
+    return dtypes
+
+
+def cast_frame(df, dtypes):
+    return df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+
+
+# --- Writing ---
+
+class FrameWriter:
+    """
+    Appends DataFrame chunks to a single CSV, Parquet or Arrow IPC file.
+    The schema of the first chunk is used for the whole file.
+    """
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.fmt = fmt or format_from_path(path)
+        if self.fmt not in FORMATS:
+            raise ValueError(f"Unsupported output format '{self.fmt}'. Expected one of {FORMATS}.")
+        self.rows_written = 0
+        self._writer = None
+        self._schema = None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, df):
+        if self.fmt == 'csv':
+            df.to_csv(self.path, mode='a', header=self.rows_written == 0, index=False)
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                if self.fmt == 'parquet':
+                    import pyarrow.parquet as pq
+                    self._writer = pq.ParquetWriter(self.path, self._schema)
+                else:
+                    self._writer = pa.ipc.new_file(self.path, self._schema)
+            else:
+                # Raises on overflow rather than silently wrapping a value
+                table = table.cast(self._schema)
+            self._writer.write_table(table)
+        self.rows_written += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        elif self.rows_written == 0 and self.fmt == 'csv':
+            # Keep the file present even if nothing was written
+            open(self.path, 'w').close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_frame(df, path, fmt=None):
+    with FrameWriter(path, fmt) as writer:
+        writer.write(df)
+
+
+# --- Reading ---
+
+def read_frame(path, columns=None):
+    """
+    Loads a whole file into a DataFrame. Parquet and Arrow files are memory-mapped
+    and keep their stored dtypes; CSV is parsed with pandas as before.
+    """
+    fmt = format_from_path(path)
+    if fmt == 'csv':
+        return pd.read_csv(path, usecols=columns)
+    import pyarrow as pa
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    return table.to_pandas()
+
+
+def iter_frames(path, chunk_size, columns=None):
+    """
+    Yields the file as DataFrames of at most chunk_size rows without loading it whole.
+    """
+    fmt = format_from_path(path)
+    if fmt == 'csv':
+        yield from pd.read_csv(path, chunksize=chunk_size, usecols=columns)
+        return
+    import pyarrow as pa
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    for offset in range(0, table.num_rows, chunk_size):
+        yield table.slice(offset, chunk_size).to_pandas()
+
+
+def resolve_data_files(path):
+    """
+    Expands a data location into a sorted list of files: a single file, every data
+    file in a directory (e.g. part-0000.parquet, part-0001.parquet), or a glob pattern.
+    """
+    import glob
+
+    if os.path.isdir(path):
+        files = sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if os.path.splitext(name)[1].lower() in _EXTENSIONS
+        )
+    elif os.path.exists(path):
+        files = [path]
+    else:
+        files = sorted(glob.glob(path))
+    if not files:
+        raise FileNotFoundError(f"No data files found at {path}")
+    return files
+
+
+def split_features_target(df):
+    """
+    The processed files store the target in the first column and the features after it.
+    """
+    return df.iloc[:, 1:], df.iloc[:, 0]
+
+
+def read_features_target(path):
+    """
+    path may also be a list of files, e.g. a base file and its increments, which are concatenated.
+    """
+    if isinstance(path, (list, tuple)):
+        return split_features_target(pd.concat([read_frame(p) for p in path], ignore_index=True))
+    return split_features_target(read_frame(path))
+
+
+# --- XGBoost binary cache ---
+
+def is_dmatrix_path(path):
+    return os.path.splitext(path)[1].lower() in DMATRIX_EXTENSIONS
+
+
+def load_dmatrix(data_path, cache_path=None, **dmatrix_kwargs):
+    """
+    Returns an xgboost.DMatrix for data_path. If cache_path is given, the binary DMatrix
+    saved there is reused while it is newer than data_path, and is (re)written otherwise.
+    """
+    import xgboost as xgb
+
+    if is_dmatrix_path(data_path):
+        return xgb.DMatrix(data_path)
+    if cache_path and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(data_path):
+        logger.info(f"Loading cached DMatrix from {cache_path}")
+        return xgb.DMatrix(cache_path)
+
+    X, y = read_features_target(data_path)
+    dmatrix = xgb.DMatrix(X, label=y, **dmatrix_kwargs)
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        dmatrix.save_binary(cache_path)
+        logger.info(f"Saved DMatrix cache to {cache_path}")
+    return dmatrix
@@ -0,0 +1,510 @@
+"""
+Data-drift and data-quality monitoring against the training data, in constant memory.
+
+preprocessing.py writes a baseline profile of the training rows next to the model:
+one fixed-size sketch per feature, over the encoded features the model sees.
+
+    numeric:     a histogram over bin edges taken from quantiles of the training data
+                 (tenure, MonthlyCharges, TotalCharges, SeniorCitizen), with open-ended
+                 first and last bins, plus a count of missing values.
+    categorical: a frequency table over the encoder's categories, plus a count of
+                 missing values, which includes categories the encoder has not seen.
+
+A sketch is just its counts, so profiles with the same edges merge by adding them:
+chunks, workers, serving windows and scoring runs are each profiled on their own and
+combined later. A rebuilt baseline keeps the edges of the one it replaces, so saved
+profiles stay comparable; profiles whose buckets differ anyway (e.g. the categories
+changed) are skipped. Drift is scored from the counts alone, at any time:
+
+    PSI:  sum((current - baseline) * ln(current / baseline)) over the bucket shares,
+          missing values included. Above 0.2 is the usual "significant shift".
+    KS:   the largest gap between the two CDFs, read at the bin edges (numeric only).
+    missing rate: the share of missing or unseen values, against the baseline's.
+
+batch_scoring.py and model_server.py update a profile as rows go by. On its own this
+script profiles raw records and/or saved profiles against the baseline, logs the
+scores to MLflow and, with --fail-on-drift, exits non-zero so the Argo step in front
+of deploy-seldon-model stops the deployment:
+
+    python3 scripts/drift_monitor.py --data-path new_customers.csv --fail-on-drift
+    python3 scripts/drift_monitor.py --profiles-dir /opt/ml/processing/drift/profiles
+"""
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BINS = 20
+DEFAULT_SAMPLE_ROWS = 1000000  # Rows kept for the bin edges: 8 bytes per numeric column each
+PSI_EPSILON = 1e-4  # Floor for empty buckets, which would make the log ratio infinite
+DEFAULT_THRESHOLDS = {'psi_threshold': 0.2, 'ks_threshold': 0.2, 'max_missing_increase': 0.05, 'min_rows': 500}
+
+
+# --- Sketches ---
+
+class NumericSketch:
+    """
+    Histogram of one numeric feature over fixed bin edges.
+    counts[i] holds the values v with edges[i - 1] <= v < edges[i] (open at both ends).
+    """
+    kind = 'numeric'
+
+    def __init__(self, edges, counts=None, missing=0):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(self.edges) + 1, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.missing = int(missing)
+
+    @classmethod
+    def from_sample(cls, values, bins=DEFAULT_BINS):
+        # Quantile edges give every bin about the same share of the baseline; ties collapse
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return cls([])
+        return cls(np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)[1:-1])))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        self.missing += int(missing.sum())
+        bins = np.searchsorted(self.edges, values[~missing], side='right')
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+
+    def empty(self):
+        return NumericSketch(self.edges)
+
+    def to_dict(self):
+        return {'kind': self.kind, 'edges': self.edges.tolist(), 'counts': self.counts.tolist(), 'missing': self.missing}
+
+
+class CategoricalSketch:
+    """
+    Frequency table of one label-encoded feature: counts[code] per category. Codes
+    outside the table (NaN for unseen or missing values) count as missing.
+    """
+    kind = 'categorical'
+
+    def __init__(self, categories, counts=None, missing=0):
+        self.categories = list(categories)
+        self.counts = np.zeros(len(self.categories), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.missing = int(missing)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        valid = (values >= 0) & (values < len(self.counts))  # False for NaN as well
+        self.missing += int(len(values) - valid.sum())
+        self.counts += np.bincount(values[valid].astype(np.int64), minlength=len(self.counts))
+
+    def empty(self):
+        return CategoricalSketch(self.categories)
+
+    def to_dict(self):
+        return {'kind': self.kind, 'categories': self.categories, 'counts': self.counts.tolist(), 'missing': self.missing}
+
+
+def sketch_from_dict(data):
+    if data['kind'] == 'numeric':
+        return NumericSketch(data['edges'], data['counts'], data['missing'])
+    return CategoricalSketch(data['categories'], data['counts'], data['missing'])
+
+
+def same_buckets(a, b):
+    if a.kind != b.kind or len(a.counts) != len(b.counts):
+        return False
+    if a.kind == 'numeric':
+        return np.array_equal(a.edges, b.edges)
+    return a.categories == b.categories
+
+
+def merge_sketches(a, b):
+    if not same_buckets(a, b):
+        raise ValueError("Only sketches with the same buckets can be merged")
+    merged = a.empty()
+    merged.counts = a.counts + b.counts
+    merged.missing = a.missing + b.missing
+    return merged
+
+
+# --- Profiles ---
+
+class Profile:
+    """
+    One sketch per feature column, updated with float32 feature matrices in the
+    encoder's feature order (the matrices the model is scored on).
+    """
+
+    def __init__(self, columns, sketches, rows=0):
+        self.columns = list(columns)
+        self.sketches = sketches
+        self.rows = int(rows)
+
+    @classmethod
+    def baseline(cls, encoder, samples, bins=DEFAULT_BINS, previous=None):
+        """
+        An empty profile with numeric bin edges from samples ({column: values} of the
+        training set). Numeric columns of the previous baseline keep its edges instead.
+        update() then counts the rows.
+        """
+        sketches = {}
+        for col in encoder.feature_columns:
+            old = previous.sketches.get(col) if previous is not None else None
+            if col in encoder.categories:
+                sketches[col] = CategoricalSketch(encoder.categories[col])
+            elif old is not None and old.kind == 'numeric' and len(old.edges):
+                sketches[col] = old.empty()
+            else:
+                sketches[col] = NumericSketch.from_sample(samples.get(col, []), bins)
+        return cls(encoder.feature_columns, sketches)
+
+    def update(self, features):
+        features = np.asarray(features)
+        if features.ndim != 2 or features.shape[1] != len(self.columns):
+            raise ValueError(f"Expected a matrix with {len(self.columns)} feature columns, got shape {list(features.shape)}")
+        for j, col in enumerate(self.columns):
+            self.sketches[col].update(features[:, j])
+        self.rows += len(features)
+
+    def empty(self):
+        """
+        A profile with the same buckets and no rows, to count a new window or batch in.
+        """
+        return Profile(self.columns, {col: sketch.empty() for col, sketch in self.sketches.items()})
+
+    def compatible(self, other):
+        """
+        True if other has the same columns and buckets, i.e. can be merged or compared.
+        """
+        return other.columns == self.columns and all(
+            same_buckets(self.sketches[col], other.sketches[col]) for col in self.columns)
+
+    def merge(self, other):
+        if other.columns != self.columns:
+            raise ValueError("Only profiles of the same feature columns can be merged")
+        return Profile(self.columns, {col: merge_sketches(self.sketches[col], other.sketches[col]) for col in self.columns},
+                       self.rows + other.rows)
+
+    def to_dict(self):
+        return {'rows': self.rows, 'columns': self.columns,
+                'sketches': {col: self.sketches[col].to_dict() for col in self.columns}}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['columns'], {col: sketch_from_dict(sketch) for col, sketch in data['sketches'].items()}, data['rows'])
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(self.to_dict(), created=time.strftime('%Y-%m-%dT%H:%M:%S')), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+class ValueSample:
+    """
+    Uniform reservoir sample of the numeric columns of a stream of frames, so the bin
+    edges of a chunked baseline come from the whole training set in bounded memory.
+    Holds every row (exact quantiles) while there are at most capacity of them.
+    """
+
+    def __init__(self, capacity=DEFAULT_SAMPLE_ROWS, seed=0):
+        self.capacity = capacity
+        self.rng = np.random.default_rng(seed)
+        self.columns = None
+        self.values = None
+        self.seen = 0
+
+    def update(self, frame):
+        if self.columns is None:
+            self.columns = list(frame.select_dtypes(include='number').columns)
+            self.values = np.empty((self.capacity, len(self.columns)), dtype=np.float64)
+        rows = frame[self.columns].to_numpy(dtype=np.float64)
+        positions = self.seen + np.arange(len(rows))
+        fill = positions < self.capacity
+        self.values[positions[fill]] = rows[fill]
+        if not fill.all():
+            # Algorithm R: row i replaces a random slot with probability capacity / (i + 1)
+            slots = self.rng.integers(0, positions[~fill] + 1)
+            keep = slots < self.capacity
+            self.values[slots[keep]] = rows[~fill][keep]
+        self.seen += len(rows)
+
+    def samples(self):
+        if self.columns is None:
+            return {}
+        n = min(self.seen, self.capacity)
+        return {col: self.values[:n, j] for j, col in enumerate(self.columns)}
+
+
+class BaselineBuilder:
+    """
+    Builds the baseline chunk by chunk. The numeric bin edges come from samples (e.g.
+    ValueSample.samples() over the whole training set) or, without them, from the
+    first frame, which must then be the whole training set (in-memory mode). Columns
+    of the previous baseline keep their edges. Starts from profile when one is given
+    (incremental runs).
+    """
+
+    def __init__(self, encoder, profile=None, samples=None, previous=None, bins=DEFAULT_BINS):
+        self.encoder = encoder
+        self.profile = profile
+        self.samples = samples
+        self.previous = previous
+        self.bins = bins
+
+    def update(self, frame):
+        # frame: encoded training rows in the handoff layout (target column first, if present)
+        features = frame[self.encoder.feature_columns].to_numpy(dtype=np.float32)
+        if len(features) == 0:
+            return
+        if self.profile is None:
+            samples = self.samples
+            if samples is None:
+                samples = {col: features[:, j] for j, col in enumerate(self.encoder.feature_columns)}
+            self.profile = Profile.baseline(self.encoder, samples, self.bins, self.previous)
+        self.profile.update(features)
+
+
+# --- Drift scores ---
+
+def _shares(counts):
+    total = counts.sum()
+    return counts / total if total else np.zeros(len(counts))
+
+
+def psi(baseline_counts, current_counts):
+    expected = np.maximum(_shares(np.asarray(baseline_counts, dtype=np.float64)), PSI_EPSILON)
+    actual = np.maximum(_shares(np.asarray(current_counts, dtype=np.float64)), PSI_EPSILON)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def ks(baseline_counts, current_counts):
+    expected = np.cumsum(_shares(np.asarray(baseline_counts, dtype=np.float64)))
+    actual = np.cumsum(_shares(np.asarray(current_counts, dtype=np.float64)))
+    return float(np.max(np.abs(actual - expected))) if len(expected) else 0.0
+
+
+def _missing_rate(sketch):
+    total = sketch.counts.sum() + sketch.missing
+    return sketch.missing / total if total else 0.0
+
+
+def compare(baseline, current, psi_threshold=0.2, ks_threshold=0.2, max_missing_increase=0.05, min_rows=500):
+    """
+    Scores current against baseline. Returns a report with per-column psi, ks (numeric
+    columns), missing rates and the reasons a column counts as drifted, plus the overall
+    status: 'drift', 'ok', or 'no_data' below min_rows rows (too few to judge).
+    """
+    columns = {}
+    for col in baseline.columns:
+        expected, actual = baseline.sketches[col], current.sketches[col]
+        entry = {
+            'kind': expected.kind,
+            'psi': psi(np.append(expected.counts, expected.missing), np.append(actual.counts, actual.missing)),
+            'missing_rate': _missing_rate(actual),
+            'baseline_missing_rate': _missing_rate(expected),
+        }
+        if expected.kind == 'numeric':
+            entry['ks'] = ks(expected.counts, actual.counts)
+        reasons = []
+        if entry['psi'] > psi_threshold:
+            reasons.append(f"PSI {entry['psi']:.3f} > {psi_threshold}")
+        if entry.get('ks', 0.0) > ks_threshold:
+            reasons.append(f"KS {entry['ks']:.3f} > {ks_threshold}")
+        if entry['missing_rate'] - entry['baseline_missing_rate'] > max_missing_increase:
+            reasons.append(f"missing rate {entry['missing_rate']:.3f} vs {entry['baseline_missing_rate']:.3f}")
+        entry['reasons'] = reasons
+        columns[col] = entry
+
+    drifted = [col for col, entry in columns.items() if entry['reasons']] if current.rows >= min_rows else []
+    if current.rows < min_rows:
+        status = 'no_data'
+    else:
+        status = 'drift' if drifted else 'ok'
+    return {
+        'status': status,
+        'rows': current.rows,
+        'baseline_rows': baseline.rows,
+        'drifted_columns': drifted,
+        'max_psi': max((entry['psi'] for entry in columns.values()), default=0.0),
+        'max_ks': max((entry.get('ks', 0.0) for entry in columns.values()), default=0.0),
+        'thresholds': {'psi_threshold': psi_threshold, 'ks_threshold': ks_threshold,
+                       'max_missing_increase': max_missing_increase, 'min_rows': min_rows},
+        'columns': columns,
+    }
+
+
+def log_report(run, report):
+    """
+    Logs drift_psi_<col> / drift_ks_<col> / drift_missing_rate_<col>, the maxima, the
+    status tag and the full report as drift/drift_report.json.
+    """
+    metrics = {'drift_rows': report['rows'], 'drift_max_psi': report['max_psi'], 'drift_max_ks': report['max_ks'],
+               'drifted_columns': len(report['drifted_columns'])}
+    for col, entry in report['columns'].items():
+        metrics[f"drift_psi_{col}"] = entry['psi']
+        metrics[f"drift_missing_rate_{col}"] = entry['missing_rate']
+        if 'ks' in entry:
+            metrics[f"drift_ks_{col}"] = entry['ks']
+    run.log_metrics(metrics)
+    run.set_tag("drift_status", report['status'])
+    run.log_dict(report, "drift/drift_report.json")
+
+
+def summarize(report):
+    if report['status'] == 'no_data':
+        return f"not enough rows to judge drift ({report['rows']} < {report['thresholds']['min_rows']})"
+    details = "; ".join(f"{col}: {', '.join(report['columns'][col]['reasons'])}" for col in report['drifted_columns'])
+    return (f"{report['status']} over {report['rows']} rows (max PSI {report['max_psi']:.3f}, max KS {report['max_ks']:.3f})"
+            + (f" - {details}" if details else ""))
+
+
+# --- Streaming ---
+
+class DriftMonitor:
+    """
+    Scores live traffic in windows of window_rows rows against the baseline. Memory
+    is one profile, whatever the traffic. Each finished window is scored and, with
+    output_dir, saved there so drift_monitor.py can merge the windows later.
+    """
+
+    def __init__(self, baseline, window_rows=10000, output_dir=None, thresholds=None):
+        self.baseline = baseline
+        self.window_rows = window_rows
+        self.output_dir = output_dir
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.current = baseline.empty()
+        self.windows = 0
+        self.last_report = None
+
+    def observe(self, features):
+        self.current.update(features)
+        if self.current.rows >= self.window_rows:
+            self.close_window()
+
+    def close_window(self):
+        window, self.current = self.current, self.baseline.empty()
+        report = compare(self.baseline, window, **self.thresholds)
+        self.windows += 1
+        self.last_report = report
+        if self.output_dir:
+            window.save(os.path.join(self.output_dir, f"window-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self.windows}.json"))
+        log = logger.warning if report['status'] == 'drift' else logger.info
+        log(f"Drift window {self.windows}: {summarize(report)}")
+        return report
+
+    def status(self):
+        return {
+            'window_rows': self.window_rows,
+            'windows': self.windows,
+            'current_window': compare(self.baseline, self.current, **self.thresholds),
+            'last_window': self.last_report,
+        }
+
+
+# --- Command line ---
+
+def profile_records(baseline, encoder, path, chunk_size):
+    """
+    Streams raw customer records through the encoder into a profile of baseline's buckets.
+    """
+    import data_io
+
+    profile = baseline.empty()
+    for chunk in data_io.iter_frames(path, chunk_size):
+        profile.update(encoder.transform_columns({col: chunk[col].to_numpy() for col in encoder.feature_columns}))
+    logger.info(f"Profiled {profile.rows} rows from {path}.")
+    return profile
+
+
+def load_profiles(baseline, directory, max_age_hours):
+    """
+    Merges the profiles saved in directory (serving windows, scoring runs) that are
+    at most max_age_hours old (0 for all) and have the baseline's buckets. Returns
+    (profile, number of files merged, number skipped).
+    """
+    profile = baseline.empty()
+    cutoff = time.time() - max_age_hours * 3600 if max_age_hours else 0
+    paths = [path for path in sorted(glob.glob(os.path.join(directory, '*.json'))) if os.path.getmtime(path) >= cutoff]
+    merged = skipped = 0
+    for path in paths:
+        saved = Profile.load(path)
+        if not baseline.compatible(saved):
+            # Built against an older baseline whose columns or categories differ
+            logger.warning(f"Skipping {path}: its buckets do not match the baseline.")
+            skipped += 1
+            continue
+        profile = profile.merge(saved)
+        merged += 1
+    logger.info(f"Merged {merged} profile(s) with {profile.rows} rows from {directory}"
+                + (f", skipped {skipped} built against another baseline." if skipped else "."))
+    return profile, merged, skipped
+
+
+def main(args):
+    import tracking
+    from feature_encoding import FeatureEncoder
+
+    baseline = Profile.load(args.baseline_path)
+    current = baseline.empty()
+    n_profiles = n_skipped = 0
+    if args.data_path:
+        current = current.merge(profile_records(baseline, FeatureEncoder.load(args.encoder_path), args.data_path, args.chunk_size))
+    if args.profiles_dir and os.path.isdir(args.profiles_dir):
+        profiles, n_profiles, n_skipped = load_profiles(baseline, args.profiles_dir, args.max_profile_age_hours)
+        current = current.merge(profiles)
+    report = compare(baseline, current, args.psi_threshold, args.ks_threshold, args.max_missing_increase, args.min_rows)
+
+    with tracking.start_run(args.mlflow_experiment_name, run_name="drift_monitor_run") as run:
+        run.log_params({'baseline_path': args.baseline_path, 'data_path': args.data_path, 'profiles_dir': args.profiles_dir,
+                        'profiles': n_profiles, 'profiles_skipped': n_skipped, **report['thresholds']})
+        log_report(run, report)
+
+    for path, content in ((args.report_output_path, json.dumps(report, indent=2)), (args.status_output_path, report['status'])):
+        if path:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+    if report['status'] == 'drift':
+        logger.warning(f"Data drift: {summarize(report)}")
+        if args.fail_on_drift:
+            return 1
+    else:
+        logger.info(f"Drift check: {summarize(report)}")
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Score data drift of new records or saved profiles against the training baseline.")
+    parser.add_argument('--baseline-path', type=str, default='/opt/ml/processing/model/drift_baseline.json',
+                        help='Baseline profile written by preprocessing.py.')
+    parser.add_argument('--data-path', type=str, default=None, help='Raw customer records (CSV, Parquet or Arrow IPC) to check.')
+    parser.add_argument('--encoder-path', type=str, default='/opt/ml/processing/model/feature_encoder.json',
+                        help='Feature encoder for --data-path.')
+    parser.add_argument('--profiles-dir', type=str, default=None,
+                        help='Directory of profiles saved by model_server.py and batch_scoring.py, merged into the check.')
+    parser.add_argument('--max-profile-age-hours', type=float, default=24.0, help='Ignore older profiles in --profiles-dir (0 keeps all).')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows read at a time from --data-path.')
+    parser.add_argument('--psi-threshold', type=float, default=DEFAULT_THRESHOLDS['psi_threshold'])
+    parser.add_argument('--ks-threshold', type=float, default=DEFAULT_THRESHOLDS['ks_threshold'])
+    parser.add_argument('--max-missing-increase', type=float, default=DEFAULT_THRESHOLDS['max_missing_increase'],
+                        help='Largest tolerated rise of a column\'s missing/unseen rate over the baseline.')
+    parser.add_argument('--min-rows', type=int, default=DEFAULT_THRESHOLDS['min_rows'],
+                        help='Below this many rows the status is no_data and nothing is flagged.')
+    parser.add_argument('--report-output-path', type=str, default=None, help='Where to write the drift report (JSON).')
+    parser.add_argument('--status-output-path', type=str, default=None, help='Where to write the status (ok, drift or no_data).')
+    parser.add_argument('--fail-on-drift', action='store_true', help='Exit with status 1 on drift, e.g. to stop a deployment.')
+    parser.add_argument('--mlflow-experiment-name', type=str, default="Churn_Prediction_Monitoring", help="Name of the MLflow experiment.")
+    sys.exit(main(parser.parse_args()))
@@ -1,131 +1,177 @@
 import xgboost as xgb
+import numpy as np
 import pandas as pd
 import os
 import logging
-from sklearn.metrics import accuracy_score, roc_auc_score, precision_score, recall_score, f1_score
 import json
 import argparse
-import mlflow
+
+import data_io
+import binary_metrics
+import stage_cache
+import tracking
+import instrumentation
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def evaluate_model(model_path, valid_data_path, metrics_output_path, mlflow_experiment_name, training_run_id=None):
+def predict_scores(model, valid_data_path, chunk_size=None, dmatrix_cache_path=None, valid_frame=None):
+    """
+    Runs the model once over the validation data and returns (y_true, y_score).
+    With chunk_size the file is streamed in chunks, so only the labels (int8) and
+    scores (float32) of the whole set are held in memory. If dmatrix_cache_path is given
+    (or valid_data_path is a saved DMatrix), the booster predicts on a cached binary DMatrix.
+    A processed valid_frame already in memory is used instead of the file.
+    """
+    if valid_frame is not None:
+        X_valid, y_valid = data_io.split_features_target(valid_frame)
+        with instrumentation.span('predict'):
+            return y_valid.to_numpy().astype(np.int8), model.predict_proba(X_valid)[:, 1].astype(np.float32)
+    if dmatrix_cache_path or data_io.is_dmatrix_path(valid_data_path):
+        with instrumentation.span('read'):
+            dvalid = data_io.load_dmatrix(valid_data_path, cache_path=dmatrix_cache_path)
+        with instrumentation.span('predict'):
+            return dvalid.get_label().astype(np.int8), model.get_booster().predict(dvalid).astype(np.float32)
+    if not chunk_size:
+        with instrumentation.span('read'):
+            X_valid, y_valid = data_io.read_features_target(valid_data_path)  # First column is the target
+        with instrumentation.span('predict'):
+            return y_valid.to_numpy().astype(np.int8), model.predict_proba(X_valid)[:, 1].astype(np.float32)
+
+    labels, scores = [], []
+    for chunk in instrumentation.iter_span('read', data_io.iter_frames(valid_data_path, chunk_size)):
+        X_chunk, y_chunk = data_io.split_features_target(chunk)
+        labels.append(y_chunk.to_numpy().astype(np.int8))
+        with instrumentation.span('predict'):
+            scores.append(model.predict_proba(X_chunk)[:, 1].astype(np.float32))
+    return np.concatenate(labels), np.concatenate(scores)
+
+def print_metrics(metrics):
+    # Print metrics for Argo logs / SageMaker HPO compatibility
+    print(f"validation:accuracy: {metrics['accuracy']}")
+    print(f"validation:auc: {metrics['auc']}")
+    print(f"validation:precision: {metrics['precision']}")
+    print(f"validation:recall: {metrics['recall']}")
+    print(f"validation:f1_score: {metrics['f1_score']}")
+    print(f"validation:pr_auc: {metrics['pr_auc']}")
+    if 'auc_ci_lower' in metrics:
+        print(f"validation:auc_ci: [{metrics['auc_ci_lower']}, {metrics['auc_ci_upper']}]")
+
+
+def evaluate_model(model_path, valid_data_path, metrics_output_path, mlflow_experiment_name, training_run_id=None, dmatrix_cache_path=None,
+                   chunk_size=None, threshold=0.5, n_bootstrap=200, cache=None,
+                   profile='none', perf_output_path=None, prometheus_path=None, model=None, valid_frame=None):
     """
     Loads a trained model, evaluates it on validation data, and logs metrics.
+    The model is run once; every metric (accuracy/precision/recall/F1 at threshold, AUC,
+    PR-AUC, the full threshold sweep and bootstrap confidence intervals) comes from
+    a single sort of the scores. See predict_scores() for the data options.
+    With a stage_cache.StageCache, an unchanged model and validation set reuse the
+    earlier evaluation run's metrics. profile, perf_output_path and prometheus_path
+    are passed to instrumentation.Profiler. A model and a processed valid_frame already
+    in memory (from run_pipeline.py) skip loading them; the stage cache then only
+    applies when both are not given.
     """
     logger.info(f"Starting model evaluation.")
     logger.info(f"MLflow Experiment Name: {mlflow_experiment_name}")
     if training_run_id:
         logger.info(f"Associated Training MLflow Run ID: {training_run_id}")
 
-    # --- MLflow Setup ---
-    # MLFLOW_TRACKING_URI and S3 credentials should be set as environment variables in the Argo workflow
-    try:
-        mlflow.set_experiment(mlflow_experiment_name)
-        logger.info(f"Using MLflow experiment: {mlflow_experiment_name}")
-    except Exception as e:
-        logger.error(f"Could not set MLflow experiment '{mlflow_experiment_name}': {e}")
-        # Attempt to create if not exists
-        try:
-            logger.info(f"Attempting to create MLflow experiment: {mlflow_experiment_name}")
-            mlflow.create_experiment(mlflow_experiment_name)
-            mlflow.set_experiment(mlflow_experiment_name)
-        except Exception as e_create:
-            logger.error(f"Failed to create or set MLflow experiment: {e_create}")
-            # Decide if you want to proceed without MLflow or raise error
-
-    # Start a new MLflow run for evaluation, or use the parent training run if ID is provided
-    # For simplicity here, we'll create a new run.
-    # To nest it under the training run, you'd use:
-    # with mlflow.start_run(run_id=training_run_id, nested=True, run_name="evaluation") if training_run_id else mlflow.start_run(run_name="evaluation_run") as run:
-    
-    # For now, let's create a distinct evaluation run, but tag it if training_run_id is available
-    with mlflow.start_run(run_name="model_evaluation_run") as run:
-        eval_run_id = run.info.run_id
+    # Skip evaluation when the model, the validation data and the settings match a cached run
+    sweep_path = os.path.join(os.path.dirname(metrics_output_path), "threshold_sweep.csv")
+    outputs = {'metrics': metrics_output_path, 'threshold_sweep': sweep_path}
+    cache_key = None
+    if model is not None or valid_frame is not None:
+        cache = None  # The cache key is computed from the model and data files
+    if cache:
+        cache_key = cache.key(
+            [model_path, valid_data_path],
+            stage_cache.module_paths('evaluation_script.py', 'data_io.py', 'binary_metrics.py'),
+            {'decision_threshold': threshold, 'n_bootstrap': n_bootstrap, 'xgboost_version': xgb.__version__},
+        )
+        manifest = cache.lookup(cache_key)
+        if manifest and cache.restore(manifest, outputs):
+            logger.info(f"Stage cache hit ({cache_key[:12]}): reusing the metrics of MLflow run {manifest['run_id']}.")
+            with open(metrics_output_path) as f:
+                metrics = json.load(f)
+            print_metrics(metrics)
+            return metrics
+
+    # A distinct evaluation run, tagged with the training run ID when available
+    # MLFLOW_TRACKING_URI and S3 credentials should be set as environment variables in the Argo workflow;
+    # without a reachable server the run is spooled locally (see tracking.py)
+    with tracking.start_run(mlflow_experiment_name, run_name="model_evaluation_run") as run, \
+            instrumentation.Profiler('evaluate', profile) as profiler:
+        eval_run_id = run.run_id
         logger.info(f"Evaluation MLflow Run ID: {eval_run_id}")
         if training_run_id:
-            mlflow.set_tag("training_run_id", training_run_id)
-        mlflow.log_param("model_path", model_path)
-        mlflow.log_param("validation_data_path", valid_data_path)
+            run.set_tag("training_run_id", training_run_id)
+        if cache_key:
+            run.set_tag("stage_cache_key", cache_key)
+        run.log_params({"model_path": model_path, "validation_data_path": valid_data_path,
+                        "chunk_size": chunk_size, "decision_threshold": threshold, "n_bootstrap": n_bootstrap})
 
         # Load the trained model
-        logger.info(f"Loading model from {model_path}")
-        try:
-            model = xgb.XGBClassifier()
-            model.load_model(model_path)
-            logger.info("Model loaded successfully.")
-        except Exception as e:
-            logger.error(f"Failed to load model from {model_path}: {e}")
-            mlflow.set_tag("evaluation_status", "failed_model_load")
-            raise
-
-        # Load validation data
-        logger.info(f"Loading validation data from {valid_data_path}")
+        if model is None:
+            logger.info(f"Loading model from {model_path}")
+            try:
+                with instrumentation.span('load_model'):
+                    model = xgb.XGBClassifier()
+                    model.load_model(model_path)
+                logger.info("Model loaded successfully.")
+            except Exception as e:
+                logger.error(f"Failed to load model from {model_path}: {e}")
+                run.set_tag("evaluation_status", "failed_model_load")
+                raise
+
+        # Load validation data and make predictions in one pass
+        logger.info(f"Loading validation data from {valid_data_path} and making predictions.")
         try:
-            valid_data = pd.read_csv(valid_data_path)
-            X_valid = valid_data.iloc[:, 1:]  # Assuming first column is target
-            y_valid = valid_data.iloc[:, 0]
-            logger.info(f"Validation data loaded. Shape: X_valid {X_valid.shape}, y_valid {y_valid.shape}")
+            y_valid, y_pred_proba = predict_scores(model, valid_data_path, chunk_size, dmatrix_cache_path, valid_frame)
+            logger.info(f"Validation predictions complete. Rows: {len(y_valid)}")
         except Exception as e:
-            logger.error(f"Failed to load validation data from {valid_data_path}: {e}")
-            mlflow.set_tag("evaluation_status", "failed_data_load")
-            raise
-
-        # Make predictions
-        logger.info("Making predictions on validation data.")
-        try:
-            y_pred_proba = model.predict_proba(X_valid)[:, 1]
-            y_pred = model.predict(X_valid)
-        except Exception as e:
-            logger.error(f"Error during prediction: {e}")
-            mlflow.set_tag("evaluation_status", "failed_prediction")
+            logger.error(f"Failed to load validation data or predict on {valid_data_path}: {e}")
+            run.set_tag("evaluation_status", "failed_prediction")
             raise
 
         # Calculate metrics
-        logger.info("Calculating evaluation metrics.")
+        logger.info(f"Calculating evaluation metrics (threshold {threshold}, {n_bootstrap} bootstrap resamples).")
         try:
-            accuracy = accuracy_score(y_valid, y_pred)
-            auc = roc_auc_score(y_valid, y_pred_proba)
-            precision = precision_score(y_valid, y_pred, zero_division=0)
-            recall = recall_score(y_valid, y_pred, zero_division=0)
-            f1 = f1_score(y_valid, y_pred, zero_division=0)
-
-            metrics = {
-                "accuracy": accuracy,
-                "auc": auc,
-                "precision": precision,
-                "recall": recall,
-                "f1_score": f1
-            }
+            with instrumentation.span('metrics'):
+                metrics, sweep = binary_metrics.evaluate_scores(y_valid, y_pred_proba, threshold=threshold, n_bootstrap=n_bootstrap)
             logger.info(f"Evaluation Metrics: {metrics}")
 
             # Log metrics to MLflow
             logger.info("Logging metrics to MLflow.")
-            mlflow.log_metrics(metrics)
-
-            # Print metrics for Argo logs / SageMaker HPO compatibility
-            print(f"validation:accuracy: {accuracy}")
-            print(f"validation:auc: {auc}")
-            print(f"validation:precision: {precision}")
-            print(f"validation:recall: {recall}")
-            print(f"validation:f1_score: {f1}")
+            run.log_metrics(metrics)
+            print_metrics(metrics)
 
             # Save metrics to JSON file
             logger.info(f"Saving evaluation metrics to {metrics_output_path}")
             os.makedirs(os.path.dirname(metrics_output_path), exist_ok=True)
-            with open(metrics_output_path, 'w') as f:
-                json.dump(metrics, f, indent=4)
+            with instrumentation.span('write'):
+                with open(metrics_output_path, 'w') as f:
+                    json.dump(metrics, f, indent=4)
+                # Precision/recall/F1 at every threshold, thinned for plotting
+                pd.DataFrame(binary_metrics.downsample_sweep(sweep)).to_csv(sweep_path, index=False)
             logger.info("Metrics saved successfully.")
-            mlflow.log_artifact(metrics_output_path, artifact_path="evaluation_results")
-            mlflow.set_tag("evaluation_status", "completed")
+            run.log_artifact(metrics_output_path, artifact_path="evaluation_results")
+            run.log_artifact(sweep_path, artifact_path="evaluation_results")
+            run.set_tag("evaluation_status", "completed")
+            if cache:
+                with instrumentation.span('cache_store'):
+                    cache.store(cache_key, outputs, run_id=eval_run_id)
 
         except Exception as e:
             logger.error(f"Error during metrics calculation or logging: {e}")
-            mlflow.set_tag("evaluation_status", "failed_metrics_calculation")
+            run.set_tag("evaluation_status", "failed_metrics_calculation")
             raise
 
+        with instrumentation.span('upload'):
+            run.wait()
+        profiler.report(run, perf_output_path, prometheus_path)
+
     logger.info("Model evaluation script finished.")
     return metrics
 
@@ -135,24 +181,42 @@ if __name__ == '__main__':
     parser.add_argument('--model-path', type=str, required=True,
                         help='Path to the trained XGBoost model file (e.g., /opt/ml/processing/model/xgboost-model).')
     parser.add_argument('--valid-data-path', type=str, required=True,
-                        help='Path to the validation data CSV file (e.g., /opt/ml/processing/output/test/test.csv).')
+                        help='Path to the validation data file: CSV, Parquet, Arrow IPC or a saved DMatrix (e.g., /opt/ml/processing/output/test/test.csv).')
     parser.add_argument('--metrics-output-path', type=str, required=True,
                         help='Path to save the evaluation metrics JSON file (e.g., /opt/ml/processing/output/evaluation_metrics.json).')
     parser.add_argument('--mlflow-experiment-name', type=str, default="Churn_Prediction_XGBoost", # Or a new one like "Churn_Model_Evaluation"
                         help='Name of the MLflow experiment to log metrics to.')
+    parser.add_argument('--dmatrix-cache-path', type=str, default=None, required=False,
+                        help='(Optional) Path of a binary XGBoost DMatrix cache for the validation data. Reused while newer than the data file.')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='Rows per prediction chunk. 0 (default) predicts on the whole file at once.')
+    parser.add_argument('--decision-threshold', type=float, default=0.5,
+                        help='Scores above this are predicted as churn for accuracy/precision/recall/F1.')
+    parser.add_argument('--bootstrap-samples', type=int, default=200,
+                        help='Bootstrap resamples for the confidence intervals. 0 disables them.')
     parser.add_argument('--training-run-id', type=str, default=None, required=False,
                         help='(Optional) MLflow Run ID of the training job to associate this evaluation with.')
-    
+    stage_cache.add_cache_arguments(parser)
+    instrumentation.add_profiling_arguments(parser)
+
     args = parser.parse_args()
 
     # Ensure MLFLOW_TRACKING_URI is set in the environment by Argo workflow
     if not os.environ.get("MLFLOW_TRACKING_URI"):
-        logger.warning("MLFLOW_TRACKING_URI environment variable not set. MLflow logging might fail or use local tracking.")
+        logger.warning("MLFLOW_TRACKING_URI environment variable not set. Using http://localhost:5000, or the local spool if it is unreachable.")
 
     evaluate_model(
         model_path=args.model_path,
         valid_data_path=args.valid_data_path,
         metrics_output_path=args.metrics_output_path,
         mlflow_experiment_name=args.mlflow_experiment_name,
-        training_run_id=args.training_run_id
+        training_run_id=args.training_run_id,
+        dmatrix_cache_path=args.dmatrix_cache_path,
+        chunk_size=args.chunk_size,
+        threshold=args.decision_threshold,
+        n_bootstrap=args.bootstrap_samples,
+        cache=stage_cache.open_cache(args.cache_dir, 'evaluate', args.cache_max_age_days, args.cache_max_size_gb),
+        profile=args.profile,
+        perf_output_path=args.perf_output_path,
+        prometheus_path=args.prometheus_path,
     )
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""
+Fitted feature encoding for the Telco churn data, shared by training and scoring.
+
+The encoder keeps one sorted category table per categorical column (so codes match
+sklearn's LabelEncoder) and the numeric coercion rules, e.g. blank 'TotalCharges' -> 0.
+It is saved as JSON next to the model and applied with vectorized NumPy lookups.
+"""
+import json
+import os
+import functools
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ID_COLUMN = 'customerID'
+TARGET_COLUMN = 'Churn'
+# Columns that arrive as text but are numeric, with the value used when they do not parse
+DEFAULT_NUMERIC_FILL_VALUES = {'TotalCharges': 0.0}
+# Below this many rows (online requests) categorical lookups skip pandas entirely
+_FACTORIZE_MIN_ROWS = 4096
+
+
+def _encode_values(values, categories):
+    """
+    Maps values to their index in the sorted categories array with np.searchsorted.
+    Values not in categories (including missing ones) become NaN, which XGBoost
+    routes down the learned default branch like any other missing value.
+    """
+    if len(categories) == 0:
+        return np.full(len(values), np.nan, dtype=np.float32)
+    if len(values) > _FACTORIZE_MIN_ROWS:
+        # Large batches: hash the column down to its few distinct values first, look
+        # those up, then broadcast back. Avoids converting every row to a fixed-width string.
+        import pandas as pd
+        codes, uniques = pd.factorize(values)
+        lookup = np.append(_encode_values(np.asarray(uniques), categories), np.float32(np.nan))
+        return lookup[codes]  # codes == -1 (missing) picks the trailing NaN
+    values = np.asarray(values).astype(str)
+    positions = np.searchsorted(categories, values)
+    clipped = np.minimum(positions, len(categories) - 1)
+    found = categories[clipped] == values
+    return np.where(found, clipped, np.nan).astype(np.float32)
+
+
+def _coerce_numeric(values, fill_value=np.nan):
+    values = np.asarray(values)
+    if values.dtype.kind in 'biuf':
+        result = values.astype(np.float64)
+    else:
+        try:
+            result = values.astype(np.float64)
+        except (TypeError, ValueError):
+            # Slow path only when some entries are not numbers (e.g. ' ' in TotalCharges)
+            import pandas as pd
+            result = pd.to_numeric(values, errors='coerce').astype(np.float64)
+    if fill_value is not None and not np.isnan(fill_value):
+        result = np.where(np.isnan(result), fill_value, result)
+    return result
+
+
+class FeatureEncoder:
+    """
+    Encodes raw Telco records into the numeric feature matrix the model was trained on.
+
+    categories:           {column: sorted list of category strings}
+    feature_columns:      model input columns, in training order
+    numeric_fill_values:  {column: fill value} for numeric columns that may arrive as text
+    target_categories:    sorted labels of the target column (['No', 'Yes'] for Churn)
+    """
+
+    def __init__(self, categories, feature_columns, numeric_fill_values=None, target_categories=None,
+                 target_column=TARGET_COLUMN, id_column=ID_COLUMN):
+        self.categories = {col: sorted(str(v) for v in values) for col, values in categories.items()}
+        self.feature_columns = list(feature_columns)
+        self.numeric_fill_values = dict(DEFAULT_NUMERIC_FILL_VALUES if numeric_fill_values is None else numeric_fill_values)
+        self.target_categories = sorted(str(v) for v in target_categories) if target_categories is not None else None
+        self.target_column = target_column
+        self.id_column = id_column
+        self._category_arrays = {col: np.array(values, dtype=str) for col, values in self.categories.items()}
+        self._target_array = np.array(self.target_categories, dtype=str) if self.target_categories is not None else None
+
+    # --- Fitting ---
+
+    @classmethod
+    def fit(cls, df, target_column=TARGET_COLUMN, id_column=ID_COLUMN, numeric_fill_values=None):
+        """
+        Learns the category tables from a raw DataFrame. Object columns other than the
+        id and the numeric-coercion columns are treated as categorical.
+        """
+        fill_values = dict(DEFAULT_NUMERIC_FILL_VALUES if numeric_fill_values is None else numeric_fill_values)
+        vocabularies = {}
+        for col in df.select_dtypes(include=['object']).columns:
+            if col == id_column or col in fill_values:
+                continue
+            vocabularies[col] = df[col].dropna().unique()
+        return cls.from_vocabularies(list(df.columns), vocabularies, target_column, id_column, fill_values)
+
+    @classmethod
+    def from_vocabularies(cls, columns, vocabularies, target_column=TARGET_COLUMN, id_column=ID_COLUMN,
+                          numeric_fill_values=None):
+        """
+        Builds an encoder from the raw column list and {column: iterable of values}, e.g.
+        as collected chunk by chunk in preprocessing.py's out-of-core mode.
+        """
+        vocabularies = {col: sorted(str(v) for v in values) for col, values in vocabularies.items()}
+        target_categories = vocabularies.pop(target_column, None)
+        feature_columns = [c for c in columns if c not in (id_column, target_column)]
+        return cls(vocabularies, feature_columns, numeric_fill_values, target_categories, target_column, id_column)
+
+    # --- Transforming ---
+
+    def encode_column(self, col, values):
+        if col in self._category_arrays:
+            return _encode_values(values, self._category_arrays[col])
+        return _coerce_numeric(values, self.numeric_fill_values.get(col))
+
+    def encode_target(self, values):
+        if self._target_array is None:
+            return _coerce_numeric(values)
+        return _encode_values(values, self._target_array)
+
+    def transform(self, df):
+        """
+        Encodes a raw DataFrame into the handoff layout: target first (if present),
+        then the feature columns in training order. Integer-valued columns are
+        returned as integers when no unseen categories occurred.
+        """
+        import pandas as pd
+
+        encoded = {}
+        if self.target_column in df.columns:
+            encoded[self.target_column] = self.encode_target(df[self.target_column].to_numpy())
+        for col in self.feature_columns:
+            if col not in self.categories and pd.api.types.is_integer_dtype(df[col]):
+                encoded[col] = df[col].to_numpy()  # Already numeric, e.g. tenure, SeniorCitizen
+            else:
+                encoded[col] = self.encode_column(col, df[col].to_numpy())
+        result = pd.DataFrame(encoded, index=df.index)
+        coded_columns = list(self.categories)
+        if self._target_array is not None:
+            coded_columns.append(self.target_column)
+        for col in coded_columns:
+            if col in result.columns and not result[col].isna().any():
+                result[col] = result[col].astype(np.int64)
+        return result
+
+    def transform_columns(self, columns):
+        """
+        Encodes {column: sequence of raw values} into a float32 matrix of shape
+        (n_rows, n_features). This is the pandas-free path used for online scoring.
+        """
+        n_rows = len(next(iter(columns.values()))) if columns else 0
+        matrix = np.empty((n_rows, len(self.feature_columns)), dtype=np.float32)
+        for j, col in enumerate(self.feature_columns):
+            if col not in columns:
+                raise KeyError(f"Missing feature column '{col}'")
+            matrix[:, j] = self.encode_column(col, columns[col])
+        return matrix
+
+    def transform_records(self, records):
+        """
+        Encodes a list of raw records (dicts keyed by column name) into a float32 matrix.
+        """
+        columns = {col: [record.get(col) for record in records] for col in self.feature_columns}
+        return self.transform_columns(columns)
+
+    def transform_rows(self, names, rows):
+        """
+        Encodes rows given as a list of value lists plus their column names, the shape
+        of a Seldon {"names": [...], "ndarray": [[...], ...]} payload.
+        """
+        rows = np.asarray(rows, dtype=object)
+        index = {name: i for i, name in enumerate(names)}
+        return self.transform_columns({col: rows[:, index[col]] for col in self.feature_columns if col in index})
+
+    # --- Persistence ---
+
+    def to_dict(self):
+        return {
+            'feature_columns': self.feature_columns,
+            'categories': self.categories,
+            'numeric_fill_values': self.numeric_fill_values,
+            'target_column': self.target_column,
+            'target_categories': self.target_categories,
+            'id_column': self.id_column,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            categories=data['categories'],
+            feature_columns=data['feature_columns'],
+            numeric_fill_values=data.get('numeric_fill_values'),
+            target_categories=data.get('target_categories'),
+            target_column=data.get('target_column', TARGET_COLUMN),
+            id_column=data.get('id_column', ID_COLUMN),
+        )
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        logger.info(f"Feature encoder saved to {path}")
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+@functools.lru_cache(maxsize=None)
+def load_encoder(path):
+    """
+    Loads the encoder at path once per process; later calls return the same object.
+    """
+    logger.info(f"Loading feature encoder from {path}")
+    return FeatureEncoder.load(path)
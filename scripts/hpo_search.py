@@ -0,0 +1,277 @@
+import os
+import json
+import math
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import data_io
+import tracking
+from pod_resources import available_cpus
+from shared_dataset import share_quantized, SharedArrays, MISSING_CODE
+from xgboost_script import read_hyperparameters, booster_params
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Search space: name -> (kind, low, high). 'log' samples uniformly in log space.
+DEFAULT_SEARCH_SPACE = {
+    'max_depth': ['int', 3, 10],
+    'eta': ['log', 0.01, 0.3],
+    'min_child_weight': ['log', 0.5, 10.0],
+    'subsample': ['float', 0.5, 1.0],
+}
+# Hyperparameter name -> SM_HP_* variable read by xgboost_script.py
+SM_HP_NAMES = {
+    'max_depth': 'SM_HP_MAX_DEPTH',
+    'eta': 'SM_HP_ETA',
+    'min_child_weight': 'SM_HP_MIN_CHILD_WEIGHT',
+    'subsample': 'SM_HP_SUBSAMPLE',
+    'num_round': 'SM_HP_NUM_ROUND',
+    'tree_method': 'SM_HP_TREE_METHOD',
+    'max_bin': 'SM_HP_MAX_BIN',
+    'early_stopping_rounds': 'SM_HP_EARLY_STOPPING_ROUNDS',
+}
+
+
+# --- Sampling ---
+
+class RandomSampler:
+    def __init__(self, search_space, seed):
+        self.search_space = search_space
+        self.rng = np.random.default_rng(seed)
+
+    def ask(self):
+        config = {}
+        for name, (kind, low, high) in self.search_space.items():
+            if kind == 'int':
+                config[name] = int(self.rng.integers(low, high + 1))
+            elif kind == 'log':
+                config[name] = float(math.exp(self.rng.uniform(math.log(low), math.log(high))))
+            else:
+                config[name] = float(self.rng.uniform(low, high))
+        return None, config
+
+    def tell(self, handle, score):
+        pass
+
+
+class TPESampler:
+    """
+    Bayesian (TPE) sampling through Optuna's ask/tell interface. Optuna is optional
+    and only imported when --sampler tpe is used.
+    """
+
+    def __init__(self, search_space, seed):
+        import optuna
+
+        self.search_space = search_space
+        self.study = optuna.create_study(direction='maximize', sampler=optuna.samplers.TPESampler(seed=seed))
+
+    def ask(self):
+        trial = self.study.ask()
+        config = {}
+        for name, (kind, low, high) in self.search_space.items():
+            if kind == 'int':
+                config[name] = trial.suggest_int(name, int(low), int(high))
+            else:
+                config[name] = trial.suggest_float(name, low, high, log=(kind == 'log'))
+        return trial, config
+
+    def tell(self, handle, score):
+        self.study.tell(handle, score)
+
+
+# --- Worker side ---
+
+_worker_state = {}
+
+
+def _init_worker(spec, nthread, max_bin):
+    """
+    Runs once per worker process: attaches to the shared quantized data and builds the
+    XGBoost matrices once, so every trial in this worker reuses them. max_bin is the
+    one the data was quantized with; the matrices and every trial's booster use it.
+    """
+    import xgboost as xgb
+
+    shared = SharedArrays.attach(spec)
+    dtrain = xgb.QuantileDMatrix(shared['X_train'], shared['y_train'], missing=MISSING_CODE, max_bin=max_bin, nthread=nthread)
+    dvalid = xgb.QuantileDMatrix(shared['X_valid'], shared['y_valid'], missing=MISSING_CODE, ref=dtrain,
+                                 max_bin=max_bin, nthread=nthread)
+    _worker_state.update(shared=shared, dtrain=dtrain, dvalid=dvalid, nthread=nthread, max_bin=max_bin)
+
+
+def _run_trial(params, num_round, early_stopping_rounds):
+    import xgboost as xgb
+
+    # A booster's max_bin must match its QuantileDMatrix, so it cannot vary between trials
+    params = dict(params, nthread=_worker_state['nthread'], max_bin=_worker_state['max_bin'])
+    booster = xgb.train(
+        params,
+        _worker_state['dtrain'],
+        num_boost_round=num_round,
+        evals=[(_worker_state['dvalid'], 'validation')],
+        early_stopping_rounds=early_stopping_rounds or None,
+        verbose_eval=False,
+    )
+    best_iteration = booster.attr('best_iteration')
+    best_score = booster.attr('best_score')
+    if best_score is None:
+        best_score = booster.eval(_worker_state['dvalid']).split(':')[-1]
+        best_iteration = booster.num_boosted_rounds() - 1
+    return float(best_score), int(best_iteration) + 1
+
+
+# --- Driver side ---
+
+def rung_budgets(min_rounds, max_rounds, reduction_factor):
+    budgets = []
+    budget = min_rounds
+    while budget < max_rounds:
+        budgets.append(budget)
+        budget *= reduction_factor
+    budgets.append(max_rounds)
+    return budgets
+
+
+def successive_halving(executor, configs, base_hp, budgets, reduction_factor):
+    """
+    Trains every config for the first budget, keeps the best 1/reduction_factor, trains
+    those for the next budget, and so on. All trials of a rung run concurrently.
+    Returns {trial index: [(num_round, validation_auc, best_num_round), ...]}.
+    """
+    history = {i: [] for i in range(len(configs))}
+    alive = list(range(len(configs)))
+    for rung, budget in enumerate(budgets):
+        futures = {
+            i: executor.submit(_run_trial, booster_params(dict(base_hp, **configs[i])), budget, base_hp['early_stopping_rounds'])
+            for i in alive
+        }
+        for i, future in futures.items():
+            score, best_num_round = future.result()
+            history[i].append((budget, score, best_num_round))
+        ranked = sorted(alive, key=lambda i: history[i][-1][1], reverse=True)
+        logger.info(f"Rung {rung} ({budget} rounds): best AUC {history[ranked[0]][-1][1]:.4f} over {len(alive)} trials.")
+        if rung < len(budgets) - 1:
+            alive = ranked[:max(1, len(alive) // reduction_factor)]
+    return history
+
+
+def log_trial(parent_run, config, trial_history, trial_number):
+    # Nested run; its values are batched and sent on the parent's background threads
+    with parent_run.child(f"hpo_trial_{trial_number}") as trial_run:
+        trial_run.log_params(config)
+        for num_round, score, _ in trial_history:
+            trial_run.log_metric("validation_auc", score, step=num_round)
+        trial_run.log_metric("final_validation_auc", trial_history[-1][1])
+        trial_run.set_tag("rungs_completed", len(trial_history))
+
+
+def run_search(args):
+    search_space = DEFAULT_SEARCH_SPACE
+    if args.search_space_path:
+        with open(args.search_space_path) as f:
+            search_space = json.load(f)
+    if 'max_bin' in search_space:
+        # The data is quantized once, with SM_HP_MAX_BIN bins, for every trial
+        logger.warning("max_bin cannot be searched (the data is quantized once); using SM_HP_MAX_BIN for every trial.")
+        search_space = {name: bounds for name, bounds in search_space.items() if name != 'max_bin'}
+    base_hp = read_hyperparameters()
+    budgets = rung_budgets(args.min_rounds, base_hp['num_round'], args.reduction_factor)
+
+    cpus = available_cpus()
+    threads_per_trial = max(1, min(args.threads_per_trial, cpus))
+    workers = args.workers or max(1, cpus // threads_per_trial)
+
+    with tracking.start_run(args.mlflow_experiment_name, run_name="xgboost_hpo_run") as run:
+        run.log_params({
+            'sampler': args.sampler,
+            'n_trials': args.n_trials,
+            'brackets': args.brackets,
+            'rung_budgets': ','.join(str(b) for b in budgets),
+            'workers': workers,
+            'threads_per_trial': threads_per_trial,
+            'train_data_path': args.train_data_path,
+            'valid_data_path': args.valid_data_path,
+        })
+        run.log_dict(search_space, "search_space.json")
+
+        # Load and quantize once; workers attach to the shared codes
+        logger.info(f"Loading training data from {args.train_data_path} and validation data from {args.valid_data_path}")
+        X_train, y_train = data_io.read_features_target(args.train_data_path)
+        X_valid, y_valid = data_io.read_features_target(args.valid_data_path)
+        shared = share_quantized(X_train, y_train, X_valid, y_valid, max_bin=base_hp['max_bin'])
+        feature_names = list(X_train.columns)
+        del X_train, y_train, X_valid, y_valid
+
+        sampler_cls = TPESampler if args.sampler == 'tpe' else RandomSampler
+        sampler = sampler_cls(search_space, args.random_state)
+        best = None
+        trial_number = 0
+        try:
+            logger.info(f"Starting {workers} workers with {threads_per_trial} thread(s) each; rung budgets {budgets}.")
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_worker, initargs=(shared.spec(), threads_per_trial, base_hp['max_bin'])) as executor:
+                trials_per_bracket = math.ceil(args.n_trials / args.brackets)
+                for bracket in range(args.brackets):
+                    asked = [sampler.ask() for _ in range(trials_per_bracket)]
+                    configs = [config for _, config in asked]
+                    history = successive_halving(executor, configs, base_hp, budgets, args.reduction_factor)
+                    for i, (handle, config) in enumerate(asked):
+                        trial_history = history[i]
+                        log_trial(run, config, trial_history, trial_number)
+                        trial_number += 1
+                        # Trials stopped early are scored at their last rung, which ranks them lower
+                        sampler.tell(handle, trial_history[-1][1])
+                        final_round, score, best_num_round = trial_history[-1]
+                        if final_round == budgets[-1] and (best is None or score > best['validation_auc']):
+                            best = {'hyperparameters': dict(config, num_round=best_num_round), 'validation_auc': score}
+                    logger.info(f"Bracket {bracket} done. Best validation AUC so far: {best['validation_auc']:.4f}")
+        finally:
+            shared.unlink()
+
+        best['hyperparameters'] = {
+            k: v for k, v in dict(base_hp, **best['hyperparameters']).items() if k in SM_HP_NAMES
+        }
+        best['sm_hp_env'] = {SM_HP_NAMES[k]: str(v) for k, v in best['hyperparameters'].items()}
+        best['feature_names'] = feature_names
+        logger.info(f"Best configuration: {best}")
+
+        run.log_metric("best_validation_auc", best['validation_auc'])
+        run.log_params({f"best_{k}": v for k, v in best['hyperparameters'].items()})
+        os.makedirs(os.path.dirname(args.best_config_output_path) or '.', exist_ok=True)
+        with open(args.best_config_output_path, 'w') as f:
+            json.dump(best, f, indent=4)
+        run.log_artifact(args.best_config_output_path, artifact_path="hpo")
+        logger.info(f"Best configuration written to {args.best_config_output_path}")
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Parallel XGBoost hyperparameter search with successive halving.")
+    parser.add_argument('--train-data-path', type=str, default='/opt/ml/processing/output/train/train.csv')
+    parser.add_argument('--valid-data-path', type=str, default='/opt/ml/processing/output/test/test.csv')
+    parser.add_argument('--best-config-output-path', type=str, default='/opt/ml/processing/output/hpo/best_config.json',
+                        help='Where to write the best hyperparameters (also as SM_HP_* values).')
+    parser.add_argument('--search-space-path', type=str, default=None,
+                        help='JSON file of {name: [kind, low, high]} with kind int, float or log. Defaults to DEFAULT_SEARCH_SPACE.')
+    parser.add_argument('--sampler', type=str, choices=['random', 'tpe'], default='random',
+                        help='random, or tpe for Bayesian sampling (requires optuna).')
+    parser.add_argument('--n-trials', type=int, default=27, help='Total number of configurations to try.')
+    parser.add_argument('--brackets', type=int, default=1,
+                        help='Successive-halving brackets run one after another; with tpe, later brackets learn from earlier ones.')
+    parser.add_argument('--min-rounds', type=int, default=10, help='Boosting rounds at the first rung. The last rung uses SM_HP_NUM_ROUND.')
+    parser.add_argument('--reduction-factor', type=int, default=3, help='Keep the best 1/reduction-factor trials at each rung.')
+    parser.add_argument('--threads-per-trial', type=int, default=1, help='XGBoost threads per trial.')
+    parser.add_argument('--workers', type=int, default=0, help='Worker processes. Defaults to pod CPUs / threads per trial.')
+    parser.add_argument('--random-state', type=int, default=42)
+    parser.add_argument('--mlflow-experiment-name', type=str, default="Churn_Prediction_XGBoost", help="Name of the MLflow experiment.")
+
+    args = parser.parse_args()
+    run_search(args)
@@ -0,0 +1,287 @@
+"""
+Per-stage performance spans: wall time, CPU time and peak RSS for named steps.
+
+    with instrumentation.Profiler('train', mode=args.profile) as profiler:
+        with instrumentation.span('read'):
+            ...
+        with instrumentation.span('fit'):
+            ...
+        profiler.report(run, json_path='/tmp/perf.json')
+
+instrumentation.span() is a no-op unless a Profiler is active, so library code can
+mark spans unconditionally. A span that runs more than once (e.g. per chunk) is
+aggregated. Peak RSS is measured per span by resetting the kernel's high-water mark
+(VmHWM) on entry; nested spans fold their peaks into the enclosing span.
+
+mode='cprofile' additionally profiles the whole stage with cProfile, and
+mode='tracemalloc' records the peak Python heap per span plus the top allocation
+sites. Both write a text report that is logged to MLflow next to the metrics.
+"""
+import os
+import json
+import time
+import logging
+import contextlib
+
+from pod_resources import available_cpus, memory_limit_bytes, peak_rss_bytes, reset_peak_rss
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ('none', 'cprofile', 'tracemalloc')
+MIB = 2**20
+
+_active = None
+
+
+class _SpanStats:
+    def __init__(self):
+        self.count = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes = 0
+        self.peak_python_bytes = 0
+
+    def to_dict(self):
+        stats = {
+            'count': self.count,
+            'wall_seconds': round(self.wall_seconds, 4),
+            'cpu_seconds': round(self.cpu_seconds, 4),
+            # Average cores busy during the span; compare with the pod's CPU limit
+            'cpu_cores': round(self.cpu_seconds / self.wall_seconds, 2) if self.wall_seconds else 0.0,
+            'peak_rss_mib': round(self.peak_rss_bytes / MIB, 1),
+        }
+        if self.peak_python_bytes:
+            stats['peak_python_heap_mib'] = round(self.peak_python_bytes / MIB, 1)
+        return stats
+
+
+class Profiler:
+    def __init__(self, stage, mode='none', output_dir=None):
+        mode = mode or 'none'
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}; expected one of {PROFILE_MODES}")
+        self.stage = stage
+        self.mode = mode
+        self.output_dir = output_dir or os.path.join('/tmp', f'profile_{stage}')
+        self.spans = {}
+        self._stack = []
+        self._can_reset_rss = False
+        self._cprofile = None
+
+    # --- Lifecycle ---
+
+    def __enter__(self):
+        global _active
+        if self.mode == 'cprofile':
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif self.mode == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.start()
+        self._can_reset_rss = reset_peak_rss()
+        self._total = self._open_frame('total')
+        self._previous, _active = _active, self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        global _active
+        self._finish()
+        _active = self._previous
+        return False
+
+    def _finish(self):
+        if self._total is not None:
+            self._close_frame(self._total)
+            self._total = None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.mode == 'tracemalloc':
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                self._tracemalloc_snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+
+    # --- Spans ---
+
+    def _heap_peak(self):
+        if self.mode != 'tracemalloc':
+            return 0
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1]
+
+    def _reset_peaks(self):
+        if self._can_reset_rss:
+            reset_peak_rss()
+        if self.mode == 'tracemalloc':
+            import tracemalloc
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                # Python 3.8 has no reset_peak(); restarting also drops the traces so far,
+                # so the final snapshot then only covers the last span
+                tracemalloc.stop()
+                tracemalloc.start()
+
+    def _open_frame(self, name):
+        # The enclosing span keeps the peak reached so far, then the counters restart for this span
+        if self._stack:
+            parent = self._stack[-1]
+            parent['peak_rss'] = max(parent['peak_rss'], peak_rss_bytes())
+            parent['peak_heap'] = max(parent['peak_heap'], self._heap_peak())
+        self._reset_peaks()
+        frame = {'name': name, 'wall': time.perf_counter(), 'cpu': time.process_time(), 'peak_rss': 0, 'peak_heap': 0}
+        self._stack.append(frame)
+        return frame
+
+    def _close_frame(self, frame):
+        # Close any spans left open by an exception first
+        while self._stack and self._stack[-1] is not frame:
+            self._close_frame(self._stack[-1])
+        self._stack.pop()
+        peak_rss = max(frame['peak_rss'], peak_rss_bytes())
+        peak_heap = max(frame['peak_heap'], self._heap_peak())
+        stats = self.spans.setdefault(frame['name'], _SpanStats())
+        stats.count += 1
+        stats.wall_seconds += time.perf_counter() - frame['wall']
+        stats.cpu_seconds += time.process_time() - frame['cpu']
+        stats.peak_rss_bytes = max(stats.peak_rss_bytes, peak_rss)
+        stats.peak_python_bytes = max(stats.peak_python_bytes, peak_heap)
+        if self._stack:
+            parent = self._stack[-1]
+            parent['peak_rss'] = max(parent['peak_rss'], peak_rss)
+            parent['peak_heap'] = max(parent['peak_heap'], peak_heap)
+
+    @contextlib.contextmanager
+    def span(self, name):
+        frame = self._open_frame(name)
+        try:
+            yield
+        finally:
+            self._close_frame(frame)
+
+    # --- Reporting ---
+
+    def summary(self):
+        """
+        Stage summary: per-span statistics plus the pod's CPU and memory limits.
+        The 'total' span, which covers the profiler's whole lifetime, appears once it has stopped.
+        """
+        limit = memory_limit_bytes()
+        return {
+            'stage': self.stage,
+            'profile_mode': self.mode,
+            'cpu_limit': available_cpus(),
+            'memory_limit_mib': round(limit / MIB, 1) if limit else None,
+            'spans': {name: stats.to_dict() for name, stats in self.spans.items()},
+        }
+
+    def metrics(self, summary=None):
+        """
+        Flat MLflow metrics, e.g. perf_fit_wall_seconds and perf_total_peak_rss_mib.
+        """
+        summary = summary or self.summary()
+        metrics = {}
+        for name, stats in summary['spans'].items():
+            for key, value in stats.items():
+                if key != 'count':
+                    metrics[f"perf_{name}_{key}"] = value
+        return metrics
+
+    def prometheus_text(self, summary=None):
+        """
+        The span statistics in Prometheus text exposition format, e.g. for the
+        node-exporter textfile collector or a Pushgateway.
+        """
+        summary = summary or self.summary()
+        lines = []
+        for key, help_text in (('wall_seconds', 'Wall-clock time spent in the span.'),
+                               ('cpu_seconds', 'CPU time (all threads) spent in the span.'),
+                               ('peak_rss_mib', 'Peak resident set size during the span, in MiB.'),
+                               ('count', 'Number of times the span ran.')):
+            metric = f"churn_pipeline_span_{key}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for name, stats in summary['spans'].items():
+                lines.append(f'{metric}{{stage="{self.stage}",span="{name}"}} {stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+    def _write_profile_report(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{self.stage}_{self.mode}.txt")
+        if self.mode == 'cprofile':
+            import io
+            import pstats
+            self._cprofile.dump_stats(os.path.join(self.output_dir, f"{self.stage}.pstats"))
+            out = io.StringIO()
+            pstats.Stats(self._cprofile, stream=out).sort_stats('cumulative').print_stats(40)
+            report = out.getvalue()
+        else:
+            top = self._tracemalloc_snapshot.statistics('lineno')[:30]
+            report = '\n'.join(str(stat) for stat in top)
+        with open(path, 'w') as f:
+            f.write(report)
+        return path
+
+    def report(self, run=None, json_path=None, prometheus_path=None):
+        """
+        Stops the profiler and publishes the results: MLflow metrics (and the profile
+        report as an artifact) on run, a JSON summary at json_path (for an Argo output
+        parameter) and Prometheus text at prometheus_path. Returns the summary.
+        """
+        self._finish()
+        summary = self.summary()
+        for name, stats in summary['spans'].items():
+            logger.info(f"[perf] {self.stage}/{name}: {stats['wall_seconds']:.2f}s wall, {stats['cpu_seconds']:.2f}s CPU "
+                        f"({stats['cpu_cores']:.1f} cores), peak RSS {stats['peak_rss_mib']:.0f} MiB, {stats['count']}x")
+
+        if json_path:
+            os.makedirs(os.path.dirname(json_path) or '.', exist_ok=True)
+            with open(json_path, 'w') as f:
+                json.dump(summary, f)
+        if prometheus_path:
+            os.makedirs(os.path.dirname(prometheus_path) or '.', exist_ok=True)
+            tmp_path = f"{prometheus_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(self.prometheus_text(summary))
+            os.replace(tmp_path, prometheus_path)  # Collectors must never read a half-written file
+        if run is not None:
+            run.log_metrics(self.metrics(summary))
+            if self.mode != 'none':
+                run.log_artifact(self._write_profile_report(), artifact_path="profiling")
+        elif self.mode != 'none':
+            logger.info(f"Profile report written to {self._write_profile_report()}")
+        return summary
+
+
+def span(name):
+    """
+    Times name under the active Profiler; does nothing when none is active.
+    """
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.span(name)
+
+
+def iter_span(name, iterable):
+    """
+    Yields from iterable, timing each step under span name, e.g. to separate reading
+    chunks from processing them in a streaming loop.
+    """
+    iterator = iter(iterable)
+    done = object()
+    while True:
+        with span(name):
+            item = next(iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+def add_profiling_arguments(parser):
+    parser.add_argument('--profile', type=str, choices=PROFILE_MODES, default='none',
+                        help='Also profile the stage with cProfile or tracemalloc (report logged to MLflow).')
+    parser.add_argument('--perf-output-path', type=str, default=None,
+                        help='Write the per-span timings and memory as JSON here (e.g. for an Argo output parameter).')
+    parser.add_argument('--prometheus-path', type=str, default=None,
+                        help='Write the per-span metrics in Prometheus text format here.')
@@ -0,0 +1,428 @@
+"""
+Lightweight churn model server speaking the Seldon REST protocol.
+
+Serves POST /api/v1.0/predictions with the Seldon request and response envelope
+({"data": {"names": ..., "ndarray" or "tensor": ...}}), loading the model saved by
+xgboost_script.py directly from the PVC or a local path. Unlike the Seldon
+MLFLOW_SERVER deployment, whose xgboost pyfunc returns one class label per row, the
+payload is predict_proba output: [[P(no churn), P(churn)], ...] named t:0 and t:1. Concurrent requests are merged into micro-batches so each
+batch costs one vectorized prediction call. Each batch also updates a drift profile
+against the training baseline (see drift_monitor.py), reported at GET /health/drift.
+Only the standard library, NumPy and XGBoost are needed, so it can be run and tested
+locally without a cluster:
+
+    python3 scripts/model_server.py --model-path /opt/ml/processing/model/xgboost-model --port 9000
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+import numpy as np
+
+import drift_monitor
+from feature_encoding import load_encoder
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+PREDICTIONS_PATH = '/api/v1.0/predictions'
+MAX_BODY_BYTES = 16 * 2**20
+
+
+class BadRequest(Exception):
+    pass
+
+
+# --- Model loading ---
+
+def resolve_model_file(model_path):
+    """
+    Accepts the model file itself or a directory holding it (e.g. a downloaded
+    MLflow model directory with model.ubj / model.xgb / model.json).
+    """
+    if not os.path.isdir(model_path):
+        return model_path
+    for name in ('xgboost-model', 'model.ubj', 'model.xgb', 'model.json'):
+        candidate = os.path.join(model_path, name)
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f"No XGBoost model file found in {model_path}")
+
+
+def load_predictor(model_path, nthread=1):
+    """
+    Returns predict(features) -> churn probabilities for a float32 (n_rows, n_features) matrix.
+    """
+    import xgboost as xgb
+
+    booster = xgb.Booster()
+    booster.load_model(resolve_model_file(model_path))
+    booster.set_param({'nthread': nthread})
+    n_features = booster.num_features()
+
+    def predict(features):
+        return booster.inplace_predict(features).astype(np.float32)
+
+    predict.n_features = n_features
+    return predict
+
+
+def load_compiled_predictor(compiled_model_path):
+    """
+    Same as load_predictor() but backed by the array-based trees exported by
+    xgboost_script.py, which avoids XGBoost's per-call overhead on small batches.
+    """
+    from compiled_trees import CompiledTrees
+
+    compiled = CompiledTrees.load(compiled_model_path)
+
+    def predict(features):
+        return compiled.predict(features)
+
+    predict.n_features = compiled.n_features
+    return predict
+
+
+# --- Micro-batching ---
+
+class MicroBatcher:
+    """
+    Collects feature matrices from concurrent requests and runs them through predict
+    together. A batch is dispatched when it reaches max_batch_size rows or when the
+    oldest request has waited max_wait_ms, whichever comes first. observe, if given,
+    is called with every batch after its prediction, off the event loop.
+    """
+
+    def __init__(self, predict, max_batch_size=256, max_wait_ms=2.0, observe=None):
+        self.predict = predict
+        self.observe = observe
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.rows = 0
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, features):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((features, future))
+        return await future
+
+    def _predict_batch(self, batch):
+        probabilities = self.predict(batch)
+        if self.observe is not None:
+            # Batches run one at a time, so observe never runs concurrently with itself
+            self.observe(batch)
+        return probabilities
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            rows = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                rows += len(item[0])
+
+            batch = np.concatenate([features for features, _ in items]) if len(items) > 1 else items[0][0]
+            try:
+                # XGBoost releases the GIL, so the event loop keeps accepting requests meanwhile
+                probabilities = await loop.run_in_executor(None, self._predict_batch, batch)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.rows += len(batch)
+            offset = 0
+            for features, future in items:
+                if not future.done():
+                    future.set_result(probabilities[offset:offset + len(features)])
+                offset += len(features)
+
+
+# --- Seldon protocol ---
+
+def parse_seldon_request(payload, encoder, n_features):
+    """
+    Turns a Seldon {"data": {"names": [...], "ndarray": [...]}} or {"data": {"tensor":
+    {"shape": [...], "values": [...]}}} payload into a float32 feature matrix.
+    Rows holding any strings are treated as raw records and encoded with the feature
+    encoder; numeric rows are used as already-encoded features.
+    Returns (features, response_kind) where response_kind is 'ndarray' or 'tensor'.
+    """
+    data = payload.get('data') if isinstance(payload, dict) else None
+    if not isinstance(data, dict):
+        raise BadRequest("Request must be a JSON object with a 'data' field")
+    names = data.get('names')
+
+    if 'tensor' in data:
+        tensor = data['tensor']
+        try:
+            features = np.asarray(tensor['values'], dtype=np.float32).reshape(tensor['shape'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise BadRequest(f"Invalid tensor: {e}")
+        kind = 'tensor'
+    elif 'ndarray' in data:
+        rows = data['ndarray']
+        if not isinstance(rows, list) or (rows and not isinstance(rows[0], list)):
+            raise BadRequest("'ndarray' must be a list of rows")
+        if any(isinstance(value, str) for row in rows for value in row):
+            if encoder is None:
+                raise BadRequest("Raw (string) features need the server to be started with a feature encoder")
+            try:
+                features = encoder.transform_rows(names or encoder.feature_columns, rows)
+            except (KeyError, IndexError) as e:
+                raise BadRequest(f"Missing feature in request: {e}")
+            return features, 'ndarray'
+        features = np.asarray(rows, dtype=np.float32)
+        kind = 'ndarray'
+    else:
+        raise BadRequest("'data' must contain 'ndarray' or 'tensor'")
+
+    if features.ndim == 1 and features.size == 0:
+        # An empty ndarray or tensor holds no rows, not one row without features
+        features = features.reshape(0, n_features)
+    elif features.ndim == 1:
+        features = features.reshape(1, -1)
+    if names and encoder is not None and list(names) != encoder.feature_columns:
+        # Reorder named, already-encoded columns into training order
+        index = {name: i for i, name in enumerate(names)}
+        try:
+            features = features[:, [index[col] for col in encoder.feature_columns]]
+        except KeyError as e:
+            raise BadRequest(f"Missing feature in request: {e}")
+    if features.ndim != 2 or features.shape[1] != n_features:
+        raise BadRequest(f"Expected {n_features} features per row, got shape {list(features.shape)}")
+    return features, kind
+
+
+def seldon_response(probabilities, kind):
+    # Same layout as predict_proba from the MLflow/SKLearn servers: [P(no churn), P(churn)] per row
+    proba = np.column_stack([1.0 - probabilities, probabilities]).astype(np.float64)
+    if kind == 'tensor':
+        data = {'names': ['t:0', 't:1'], 'tensor': {'shape': list(proba.shape), 'values': proba.ravel().tolist()}}
+    else:
+        data = {'names': ['t:0', 't:1'], 'ndarray': proba.tolist()}
+    return {'data': data, 'meta': {}}
+
+
+def seldon_error(code, message):
+    return {'status': {'code': code, 'info': message, 'reason': 'MICROSERVICE_BAD_DATA' if code == 400 else 'MICROSERVICE_INTERNAL_ERROR', 'status': 'FAILURE'}}
+
+
+# --- HTTP ---
+
+class ModelServer:
+    """
+    Minimal HTTP/1.1 server (keep-alive, Content-Length bodies) on asyncio streams.
+    """
+
+    def __init__(self, predict, encoder=None, max_batch_size=256, max_wait_ms=2.0, drift=None):
+        self.predict = predict
+        self.encoder = encoder
+        self.drift = drift
+        self.batcher = MicroBatcher(predict, max_batch_size, max_wait_ms, drift.observe if drift is not None else None)
+        self.requests = 0
+        self.started = time.time()
+        self._server = None
+
+    async def start(self, host, port):
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.batcher.stop()
+
+    async def handle_predictions(self, body):
+        try:
+            payload = json.loads(body or b'null')
+        except ValueError as e:
+            return 400, seldon_error(400, f"Invalid JSON: {e}")
+        try:
+            features, kind = parse_seldon_request(payload, self.encoder, self.predict.n_features)
+        except BadRequest as e:
+            return 400, seldon_error(400, str(e))
+        if len(features) == 0:
+            return 200, seldon_response(np.empty(0, dtype=np.float32), kind)
+        probabilities = await self.batcher.submit(features)
+        return 200, seldon_response(probabilities, kind)
+
+    async def route(self, method, path, body):
+        path = path.split('?', 1)[0]
+        if method == 'POST' and path in (PREDICTIONS_PATH, '/predict'):
+            self.requests += 1
+            return await self.handle_predictions(body)
+        if method == 'GET' and path in ('/health/ping', '/ping'):
+            return 200, 'pong'
+        if method == 'GET' and path in ('/health/status', '/ready'):
+            return 200, {
+                'status': 'ok',
+                'requests': self.requests,
+                'batches': self.batcher.batches,
+                'rows': self.batcher.rows,
+                'uptime_seconds': time.time() - self.started,
+            }
+        if method == 'GET' and path in ('/health/drift', '/drift'):
+            if self.drift is None:
+                return 404, seldon_error(404, "Drift monitoring is off (no drift baseline)")
+            return 200, self.drift.status()
+        return 404, seldon_error(404, f"No route for {method} {path}")
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                # The body is left unread after an error here, so the connection is closed
+                body = None
+                if length < 0:
+                    status, response = 400, seldon_error(400, "Invalid Content-Length header")
+                elif length > MAX_BODY_BYTES:
+                    status, response = 413, seldon_error(413, "Request body too large")
+                else:
+                    body = await reader.readexactly(length) if length else b''
+                    try:
+                        status, response = await self.route(method.upper(), path, body)
+                    except Exception as e:
+                        logger.exception("Error handling request")
+                        status, response = 500, seldon_error(500, str(e))
+
+                keep_alive = (body is not None and headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1')
+                if isinstance(response, str):
+                    content, content_type = response.encode(), 'text/plain'
+                else:
+                    content, content_type = json.dumps(response).encode(), 'application/json'
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + content
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def build_server(args):
+    start = time.time()
+    compiled_model_path = args.compiled_model_path
+    if compiled_model_path and not os.path.exists(compiled_model_path):
+        # Training removes the export when it disagrees with the booster (see xgboost_script.py)
+        logger.warning(f"No compiled trees at {compiled_model_path}; serving the XGBoost model instead.")
+        compiled_model_path = None
+    if compiled_model_path:
+        predict = load_compiled_predictor(compiled_model_path)
+    else:
+        predict = load_predictor(args.model_path, nthread=args.predict_threads)
+    model_dir = args.model_path if os.path.isdir(args.model_path) else os.path.dirname(args.model_path)
+    encoder_path = args.encoder_path
+    if encoder_path is None:
+        # Default: the encoder saved next to the model (PVC) or inside the MLflow model directory
+        encoder_path = os.path.join(model_dir, 'feature_encoder.json')
+    encoder = load_encoder(encoder_path) if os.path.exists(encoder_path) else None
+    if encoder is None:
+        logger.warning(f"No feature encoder at {encoder_path}; only already-encoded numeric features are accepted.")
+    logger.info(f"Model loaded from {compiled_model_path or args.model_path} in {time.time() - start:.2f}s ({predict.n_features} features).")
+
+    drift = None
+    baseline_path = args.drift_baseline_path
+    if baseline_path is None:
+        baseline_path = os.path.join(model_dir, 'drift_baseline.json')
+    if baseline_path and os.path.exists(baseline_path):
+        baseline = drift_monitor.Profile.load(baseline_path)
+        if len(baseline.columns) == predict.n_features:
+            drift = drift_monitor.DriftMonitor(baseline, args.drift_window_rows, args.drift_output_dir)
+            logger.info(f"Drift monitoring against {baseline_path} in windows of {args.drift_window_rows} rows.")
+        else:
+            logger.warning(f"Drift baseline {baseline_path} has {len(baseline.columns)} features, the model "
+                           f"{predict.n_features}; drift monitoring is off.")
+    return ModelServer(predict, encoder, args.max_batch_size, args.max_wait_ms, drift)
+
+
+async def serve(args):
+    server = build_server(args)
+    await server.start(args.host, args.port)
+    logger.info(f"Serving {PREDICTIONS_PATH} on {args.host}:{args.port} "
+                f"(max batch {args.max_batch_size} rows, max wait {args.max_wait_ms} ms)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the churn model over the Seldon REST protocol with micro-batching.")
+    parser.add_argument('--model-path', type=str, default='/opt/ml/processing/model/xgboost-model',
+                        help='Model saved by xgboost_script.py, or a directory containing it.')
+    parser.add_argument('--compiled-model-path', type=str, default=None,
+                        help='Serve the compiled_trees.npz exported by xgboost_script.py instead of the XGBoost model '
+                             '(which is still served if the file is missing).')
+    parser.add_argument('--encoder-path', type=str, default=None,
+                        help='Feature encoder JSON for raw records. Defaults to feature_encoder.json next to the model.')
+    parser.add_argument('--host', type=str, default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=9000, help='9000 matches the Seldon REST port.')
+    parser.add_argument('--max-batch-size', type=int, default=256, help='Maximum rows per prediction call.')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help='Maximum time a request waits for others to join its batch.')
+    parser.add_argument('--predict-threads', type=int, default=1, help='XGBoost threads per prediction call.')
+    parser.add_argument('--drift-baseline-path', type=str, default=None,
+                        help='Drift baseline from preprocessing.py. Defaults to drift_baseline.json next to the model; empty string turns drift monitoring off.')
+    parser.add_argument('--drift-window-rows', type=int, default=10000, help='Rows per drift window.')
+    parser.add_argument('--drift-output-dir', type=str, default=None,
+                        help='Save the profile of every finished window here, for drift_monitor.py --profiles-dir.')
+
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
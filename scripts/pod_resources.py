@@ -0,0 +1,96 @@
+"""
+Helpers for sizing work to the resources the pod actually has.
+
+os.cpu_count() reports the node's cores, not the pod's `resources.limits.cpu`,
+so thread and process pools sized from it oversubscribe the container.
+"""
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _cgroup_cpu_limit():
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    # cgroup v1
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus():
+    """
+    Number of CPUs this process may use: the cgroup CPU quota (the pod's CPU limit)
+    if one is set, capped by the CPU affinity mask. Always at least 1.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    limit = _cgroup_cpu_limit()
+    if limit is not None:
+        cpus = min(cpus, max(1, int(limit)))
+    return max(1, cpus)
+
+
+def peak_rss_bytes(pid=None):
+    """
+    Peak resident set size (VmHWM) of a process, by default the current one.
+    Falls back to getrusage() where /proc is not available.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+    return 0
+
+
+def reset_peak_rss():
+    """
+    Resets this process's peak RSS (VmHWM) to its current RSS, so peak_rss_bytes()
+    then covers only what runs afterwards. Returns False where this is not supported
+    (needs Linux 4.0+).
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def memory_limit_bytes():
+    """
+    The pod's memory limit from the cgroup (v2, then v1), or None when unlimited.
+    """
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value == 'max' or int(value) >= 2**60:  # v1 reports "unlimited" as a huge number
+            return None
+        return int(value)
+    return None
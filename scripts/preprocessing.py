@@ -1,95 +1,386 @@
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import LabelEncoder # Keep if used, though current script doesn't use it for final encoding
 from sklearn.model_selection import train_test_split
 import argparse
 import os
-import mlflow
 import logging
 
+import data_io
+import drift_monitor
+import instrumentation
+import stage_cache
+import tracking
+import watermark
+from feature_encoding import FeatureEncoder, ID_COLUMN
+
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def main(args):
-    # --- MLflow Setup ---
-    # It's good practice to set the tracking URI via an environment variable
-    # or have it configured globally for your MLflow server.
-    # Defaulting here for standalone script execution, but override in your Argo workflow.
-    mlflow_tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", "http://localhost:5000") # Replace with your MLflow server URI
-    mlflow.set_tracking_uri(mlflow_tracking_uri)
+def _coerce_total_charges(df):
+    # 'TotalCharges' arrives as text with blanks for new customers; treat those as 0.
+    df['TotalCharges'] = pd.to_numeric(df['TotalCharges'], errors='coerce').fillna(0)
+    return df
+
+def open_input(path, end=None):
+    """
+    The input CSV for pd.read_csv: the whole file, or only its first end bytes when the
+    run records a watermark, so rows appended while it runs are left for the next one.
+    """
+    return watermark.open_range(path, 0, end) if end is not None else open(path, 'rb')
+
+def learn_category_vocabularies(input_data_path, chunk_size, train_sample=None, split=None, end=None):
+    """
+    First pass of the chunked mode: streams the input once and collects the sorted
+    set of values for every object column. Sorting matches LabelEncoder, so the codes
+    are identical to the in-memory path. The value ranges of the numeric columns are
+    collected as well so the output dtypes can be fixed before pass 2. With
+    train_sample (a drift_monitor.ValueSample) and split ((test_split_ratio,
+    random_state)), the numeric values of the training rows are sampled too. Reading
+    stops at byte end if given (see open_input).
+    """
+    vocabularies = {}
+    ranges = {}
+    columns = None
+    n_rows = 0
+    with open_input(input_data_path, end) as f:
+        for chunk in pd.read_csv(f, chunksize=chunk_size):
+            if columns is None:
+                columns = list(chunk.columns)
+            n_rows += len(chunk)
+            is_test = hash_split_mask(chunk[ID_COLUMN], *split) if train_sample is not None else None
+            chunk = _coerce_total_charges(chunk.drop([ID_COLUMN], axis=1))
+            if train_sample is not None:
+                train_sample.update(chunk[~is_test])
+            for col in chunk.select_dtypes(include=['object']).columns:
+                vocabularies.setdefault(col, set()).update(chunk[col].dropna().unique())
+            ranges = data_io.merge_column_ranges(ranges, data_io.column_ranges(chunk))
+    vocabularies = {col: sorted(values) for col, values in vocabularies.items()}
+    for col, vocabulary in vocabularies.items():
+        ranges[col] = ('i', 0, max(len(vocabulary) - 1, 0))
+    return columns, vocabularies, ranges, n_rows
+
+def hash_split_mask(customer_ids, test_split_ratio, random_state):
+    """
+    Deterministic train/test assignment keyed on customerID and random_state.
+    Returns a boolean array that is True for rows that belong to the test set.
+    The same customer always lands on the same side, independent of chunking.
+    """
+    keys = str(random_state) + ':' + customer_ids.astype(str)
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy(dtype=np.uint64)
+    # Top 53 bits give a uniform float in [0, 1)
+    fractions = (hashes >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+    return fractions < test_split_ratio
+
+def preprocess_chunked(args, baseline=None, end=None):
+    """
+    Out-of-core preprocessing. Memory is bounded by --chunk-size rather than the
+    input size: pass 1 learns the category vocabularies, pass 2 encodes each chunk,
+    assigns it to train/test with hash_split_mask() and appends it to the outputs.
+    The training rows of each chunk also go into baseline (a drift_monitor.BaselineBuilder).
+    Both passes stop at byte end if given (see open_input).
+    Returns (encoder, n_train_rows, n_test_rows).
+    """
+    logger.info(f"Chunked mode: learning category vocabularies from {args.input_data_path} (chunk size {args.chunk_size}).")
+    with instrumentation.span('vocabulary'):
+        train_sample = drift_monitor.ValueSample() if baseline is not None else None
+        columns, vocabularies, ranges, n_rows = learn_category_vocabularies(
+            args.input_data_path, args.chunk_size, train_sample, (args.test_split_ratio, args.random_state), end)
+    logger.info(f"Pass 1 complete: {n_rows} rows, {len(vocabularies)} categorical columns.")
+
+    encoder = FeatureEncoder.from_vocabularies(columns, vocabularies)
+    if baseline is not None:
+        # Bin edges from the whole training set rather than the first chunk
+        baseline.encoder = encoder
+        baseline.samples = train_sample.samples()
+    dtypes = data_io.choose_dtypes(ranges) if args.output_format != 'csv' else {}
+
+    n_train = n_test = 0
+    logger.info(f"Pass 2: encoding and hash-splitting with test_size={args.test_split_ratio} and random_state={args.random_state}")
+    with data_io.FrameWriter(args.output_train_path, args.output_format) as train_writer, \
+            data_io.FrameWriter(args.output_test_path, args.output_format) as test_writer, \
+            open_input(args.input_data_path, end) as f:
+        for chunk in instrumentation.iter_span('read', pd.read_csv(f, chunksize=args.chunk_size)):
+            with instrumentation.span('split'):
+                is_test = hash_split_mask(chunk[ID_COLUMN], args.test_split_ratio, args.random_state)
+            with instrumentation.span('encode'):
+                chunk = data_io.cast_frame(encoder.transform(chunk), dtypes)
+
+            with instrumentation.span('write'):
+                test_writer.write(chunk[is_test])
+                train_writer.write(chunk[~is_test])
+            if baseline is not None:
+                with instrumentation.span('profile'):
+                    baseline.update(chunk[~is_test])
+        n_train, n_test = train_writer.rows_written, test_writer.rows_written
+
+    logger.info(f"Pass 2 complete: {n_train} training rows, {n_test} test rows.")
+    return encoder, n_train, n_test
+
+def preprocess_in_memory(args, end=None):
+    """
+    Original in-memory path: loads the whole CSV (up to byte end if given), label-encodes
+    and uses train_test_split.
+    Returns (encoder, train_df, test_df); the frames are written to the output paths
+    unless those are empty.
+    """
+    # --- Original Data Processing Logic (with minor adjustments for paths) ---
+    logger.info(f"Reading data from: {args.input_data_path}")
+    with instrumentation.span('read'), open_input(args.input_data_path, end) as f:
+        df = pd.read_csv(f)
+
+    # The encoder drops 'customerID', converts 'TotalCharges' to numeric (blanks -> 0)
+    # and label-encodes the object columns with sorted per-column tables, which gives
+    # the same codes as fitting a LabelEncoder on each column.
+    logger.info("Fitting feature encoder and label encoding object type columns.")
+    with instrumentation.span('encode'):
+        encoder = FeatureEncoder.fit(df)
+        df = encoder.transform(df)
+
+    X = df.drop('Churn', axis=1)
+    y = df['Churn']
     
-    try:
-        mlflow.set_experiment(args.mlflow_experiment_name)
-        logger.info(f"Using MLflow experiment: {args.mlflow_experiment_name}")
-    except Exception as e:
-        logger.error(f"Could not set MLflow experiment '{args.mlflow_experiment_name}': {e}")
-        # Fallback or create if not exists (more robust)
-        try:
-            logger.info(f"Attempting to create MLflow experiment: {args.mlflow_experiment_name}")
-            mlflow.create_experiment(args.mlflow_experiment_name)
-            mlflow.set_experiment(args.mlflow_experiment_name)
-        except Exception as e_create:
-            logger.error(f"Failed to create or set MLflow experiment: {e_create}")
-            # Decide if you want to proceed without MLflow or raise error
-            # For now, we'll try to proceed, but logging might fail.
-
-    with mlflow.start_run(run_name="preprocessing_run") as run:
-        run_id = run.info.run_id
-        logger.info(f"MLflow Run ID: {run_id}")
-        logger.info(f"MLflow Tracking URI: {mlflow.get_tracking_uri()}")
-        logger.info(f"MLflow Artifact URI: {mlflow.get_artifact_uri()}")
-
-        # Log parameters
-        mlflow.log_param("input_data_path", args.input_data_path)
-        mlflow.log_param("test_split_ratio", args.test_split_ratio)
-        mlflow.log_param("random_state", args.random_state)
-        mlflow.log_param("output_train_path", args.output_train_path)
-        mlflow.log_param("output_test_path", args.output_test_path)
-
-        # --- Original Data Processing Logic (with minor adjustments for paths) ---
-        logger.info(f"Reading data from: {args.input_data_path}")
-        df = pd.read_csv(args.input_data_path)
-        
-        logger.info("Dropping 'customerID' column.")
-        df = df.drop(['customerID'], axis=1)
-        
-        logger.info("Converting 'TotalCharges' to numeric and filling NaNs with 0.")
-        df['TotalCharges'] = pd.to_numeric(df['TotalCharges'], errors='coerce').fillna(0)
-
-        # Original script's LabelEncoder loop - this encodes all object columns.
-        # This is different from the one-hot encoding in the more detailed script I provided earlier.
-        # Sticking to the user's original logic here.
-        le = LabelEncoder()
-        logger.info("Label encoding object type columns.")
-        for col in df.select_dtypes(include=['object']).columns:
-            df[col] = le.fit_transform(df[col])
-
-        X = df.drop('Churn', axis=1)
-        y = df['Churn']
-        
-        logger.info(f"Splitting data with test_size={args.test_split_ratio} and random_state={args.random_state}")
+    logger.info(f"Splitting data with test_size={args.test_split_ratio} and random_state={args.random_state}")
+    with instrumentation.span('split'):
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=args.test_split_ratio, random_state=args.random_state)
 
         train_df = pd.concat([y_train.reset_index(drop=True), X_train.reset_index(drop=True)], axis=1)
         test_df = pd.concat([y_test.reset_index(drop=True), X_test.reset_index(drop=True)], axis=1)
-        
+
+        if args.output_format != 'csv':
+            # Typed columns (int8 codes, float32 charges) instead of int64/float64
+            dtypes = data_io.choose_dtypes(data_io.column_ranges(df))
+            train_df = data_io.cast_frame(train_df, dtypes)
+            test_df = data_io.cast_frame(test_df, dtypes)
+
+    if args.output_train_path:
+        with instrumentation.span('write'):
+            logger.info(f"Saving training data to: {args.output_train_path} ({args.output_format})")
+            data_io.write_frame(train_df, args.output_train_path, args.output_format)
+
+            logger.info(f"Saving test data to: {args.output_test_path} ({args.output_format})")
+            data_io.write_frame(test_df, args.output_test_path, args.output_format)
+    return encoder, train_df, test_df
+
+def preprocess_increment(args, state, baseline=None):
+    """
+    Incremental mode: encodes only the rows appended to the input since the watermark,
+    with the saved encoder, so the codes match the base files and the deployed model.
+    Categories the encoder has not seen become NaN. The rows are hash-split like the
+    chunked mode and written as the next increment files next to the base outputs.
+    The new training rows are added to baseline, the profile of the earlier ones.
+    Returns (encoder, n_train, n_test, state) with the watermark moved past the new rows.
+    """
+    encoder = FeatureEncoder.load(args.encoder_output_path)
+    end = watermark.complete_size(args.input_data_path)
+    index = len(state['increments']) + 1
+    train_path = watermark.increment_path(state['base']['train'], index)
+    test_path = watermark.increment_path(state['base']['test'], index)
+    logger.info(f"Incremental mode: reading {args.input_data_path} from byte {state['byte_offset']} to {end} "
+                f"(after {state['rows']} rows).")
+
+    n_rows = n_dropped = 0
+    with data_io.FrameWriter(train_path, args.output_format) as train_writer, \
+         data_io.FrameWriter(test_path, args.output_format) as test_writer:
+        chunks = watermark.iter_new_rows(args.input_data_path, state, end, args.chunk_size or 100000)
+        for chunk in instrumentation.iter_span('read', chunks):
+            n_rows += len(chunk)
+            with instrumentation.span('split'):
+                is_test = hash_split_mask(chunk[ID_COLUMN], args.test_split_ratio, args.random_state)
+            with instrumentation.span('encode'):
+                chunk = encoder.transform(chunk)
+                # One schema for every chunk, whatever unseen categories (NaN codes) it holds
+                labelled = chunk[encoder.target_column].notna().to_numpy()
+                n_dropped += int((~labelled).sum())
+                chunk = chunk[labelled].astype(np.float32).astype({encoder.target_column: np.int8})
+                is_test = is_test[labelled]
+            with instrumentation.span('write'):
+                test_writer.write(chunk[is_test])
+                train_writer.write(chunk[~is_test])
+            if baseline is not None:
+                with instrumentation.span('profile'):
+                    baseline.update(chunk[~is_test])
+        n_train, n_test = train_writer.rows_written, test_writer.rows_written
+    if n_dropped:
+        logger.warning(f"Dropped {n_dropped} new rows with an unknown or missing {encoder.target_column} value.")
+
+    if n_rows == 0:
+        logger.info("No new rows since the watermark.")
+        for path in (train_path, test_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return encoder, 0, 0, state
+    increment = {'train': train_path, 'test': test_path, 'rows': n_rows, 'train_rows': n_train, 'test_rows': n_test,
+                 'byte_range': [state['byte_offset'], end]}
+    state = dict(state, byte_offset=end, rows=state['rows'] + n_rows, increments=state['increments'] + [increment])
+    logger.info(f"Increment {index}: {n_train} training rows to {train_path}, {n_test} test rows to {test_path}.")
+    return encoder, n_train, n_test, state
+
+def main(args):
+    """
+    Runs the preprocess stage. Returns (encoder, train_df, test_df) so run_pipeline.py
+    can hand the frames to training without reading the files back. The frames are
+    None in chunked mode and on a stage cache hit, where the files hold the data.
+    With empty output paths (in-memory mode only) the processed data is not written.
+    With --refresh-mode incremental only the rows appended since the watermark are
+    processed, into increment files next to the base outputs (see watermark.py).
+    """
+    write_outputs = bool(args.output_train_path)
+    if not write_outputs and args.chunk_size:
+        raise ValueError("Chunked preprocessing needs --output-train-path and --output-test-path")
+
+    # Resolve the handoff format; explicit --output-format wins over the path extension
+    if args.output_format:
+        if write_outputs:
+            args.output_train_path = data_io.with_format_extension(args.output_train_path, args.output_format)
+            args.output_test_path = data_io.with_format_extension(args.output_test_path, args.output_format)
+    else:
+        args.output_format = data_io.format_from_path(args.output_train_path or '')
+
+    # Incremental refresh: only the rows appended since the watermark, encoded with the saved encoder
+    incremental = args.refresh_mode == 'incremental'
+    state = None
+    if incremental:
+        if not (write_outputs and args.watermark_path):
+            raise ValueError("Incremental preprocessing needs --watermark-path and the output paths")
+        state = watermark.load(args.watermark_path)
+        reason = watermark.check(state, args.input_data_path)
+        if reason is None and not os.path.exists(args.encoder_output_path):
+            reason = f"No saved encoder at {args.encoder_output_path}"
+        if reason:
+            logger.warning(f"{reason}; running a full preprocess instead.")
+            incremental = False
+    # A full run covers the input up to its last complete line as it is now; rows appended
+    # while it runs are left for the next one
+    input_size = watermark.complete_size(args.input_data_path) if args.watermark_path else None
+
+    # Skip the stage when the input file, the code and the parameters match a cached run
+    outputs = {'train': args.output_train_path, 'test': args.output_test_path, 'encoder': args.encoder_output_path}
+    if args.watermark_path:
+        outputs['watermark'] = args.watermark_path
+    if args.drift_baseline_path:
+        outputs['drift_baseline'] = args.drift_baseline_path
+    cache = None
+    if write_outputs and not incremental:
+        cache = stage_cache.open_cache(args.cache_dir, 'preprocess', args.cache_max_age_days, args.cache_max_size_gb)
+    cache_key = None
+    if cache:
+        cache_key = cache.key(
+            [args.input_data_path],
+            stage_cache.module_paths('preprocessing.py', 'data_io.py', 'feature_encoding.py', 'drift_monitor.py'),
+            {'test_split_ratio': args.test_split_ratio, 'random_state': args.random_state,
+             'chunk_size': args.chunk_size, 'output_format': args.output_format,
+             'watermark': bool(args.watermark_path), 'drift_baseline': bool(args.drift_baseline_path)},
+        )
+        manifest = cache.lookup(cache_key)
+        previous_state = watermark.load(args.watermark_path)
+        if manifest and cache.restore(manifest, outputs):
+            watermark.remove_increment_files(previous_state)
+            logger.info(f"Stage cache hit ({cache_key[:12]}): reusing the outputs of MLflow run {manifest['run_id']}.")
+            return FeatureEncoder.load(args.encoder_output_path), None, None
+
+    # Set MLFLOW_TRACKING_URI in your Argo workflow; without a reachable server the run is spooled locally
+    with tracking.start_run(args.mlflow_experiment_name, run_name="preprocessing_run") as run, \
+            instrumentation.Profiler('preprocess', args.profile) as profiler:
+        run_id = run.run_id
+        logger.info(f"MLflow Artifact URI: {run.get_artifact_uri()}")
+
+        # Log parameters (sent together in one batch)
+        run.log_params({
+            "input_data_path": args.input_data_path,
+            "test_split_ratio": args.test_split_ratio,
+            "random_state": args.random_state,
+            "output_train_path": args.output_train_path,
+            "output_test_path": args.output_test_path,
+            "chunk_size": args.chunk_size,
+            "output_format": args.output_format,
+            "refresh_mode": 'incremental' if incremental else 'full',
+        })
+        if cache_key:
+            run.set_tag("stage_cache_key", cache_key)
+
         # Ensure output directories exist
-        os.makedirs(os.path.dirname(args.output_train_path), exist_ok=True)
-        os.makedirs(os.path.dirname(args.output_test_path), exist_ok=True)
+        if write_outputs:
+            os.makedirs(os.path.dirname(args.output_train_path), exist_ok=True)
+            os.makedirs(os.path.dirname(args.output_test_path), exist_ok=True)
+
+        # Drift baseline: sketches of the training rows, for drift_monitor.py
+        baseline = None
+        if args.drift_baseline_path:
+            previous = None
+            if os.path.exists(args.drift_baseline_path):
+                previous = drift_monitor.Profile.load(args.drift_baseline_path)
+            if incremental and previous is None:
+                logger.warning(f"No drift baseline at {args.drift_baseline_path} to add the new rows to; "
+                               "it is written again by the next full run.")
+            elif incremental:
+                baseline = drift_monitor.BaselineBuilder(None, profile=previous)
+            else:
+                # A full run counts afresh but keeps the previous bin edges, so the profiles
+                # saved by scoring and serving stay comparable with the new baseline
+                baseline = drift_monitor.BaselineBuilder(None, previous=previous)
 
-        logger.info(f"Saving training data to: {args.output_train_path}")
-        train_df.to_csv(args.output_train_path, index=False)
-        
-        logger.info(f"Saving test data to: {args.output_test_path}")
-        test_df.to_csv(args.output_test_path, index=False)
+        train_df = test_df = None
+        if incremental:
+            if baseline is not None:
+                baseline.encoder = FeatureEncoder.load(args.encoder_output_path)
+            encoder, n_train, n_test, state = preprocess_increment(args, state, baseline)
+            run.log_metrics({"total_rows": state['rows'], "increments": len(state['increments'])})
+        elif args.chunk_size:
+            encoder, n_train, n_test = preprocess_chunked(args, baseline, input_size)
+        else:
+            encoder, train_df, test_df = preprocess_in_memory(args, input_size)
+            n_train, n_test = len(train_df), len(test_df)
+            if baseline is not None:
+                baseline.encoder = encoder
+                with instrumentation.span('profile'):
+                    baseline.update(train_df)
+        run.log_metrics({"train_rows": n_train, "test_rows": n_test})
+
+        # Persist the encodings so scoring can reproduce them from raw records.
+        # Incremental runs keep the saved encoder, which the deployed model was trained with.
+        if not incremental:
+            with instrumentation.span('write'):
+                encoder.save(args.encoder_output_path)
+        run.log_artifact(args.encoder_output_path, artifact_path="feature_encoder")
+        if baseline is not None and baseline.profile is not None:
+            with instrumentation.span('write'):
+                baseline.profile.save(args.drift_baseline_path)
+            logger.info(f"Drift baseline of {baseline.profile.rows} training rows saved to {args.drift_baseline_path}")
+            run.log_artifact(args.drift_baseline_path, artifact_path="drift_baseline")
 
         # --- Log processed data as MLflow artifacts ---
-        logger.info("Logging processed train.csv and test.csv as MLflow artifacts.")
-        mlflow.log_artifact(args.output_train_path, artifact_path="processed_data")
-        mlflow.log_artifact(args.output_test_path, artifact_path="processed_data")
-        
-        mlflow.set_tag("preprocessing_status", "completed")
+        # Uploads run in the background; the stage cache copy below overlaps with them
+        if incremental:
+            if n_train or n_test:
+                increment = state['increments'][-1]
+                logger.info("Logging the new train and test increment files as MLflow artifacts.")
+                run.log_artifact(increment['train'], artifact_path="processed_data")
+                run.log_artifact(increment['test'], artifact_path="processed_data")
+        elif write_outputs:
+            logger.info("Logging processed train and test files as MLflow artifacts.")
+            run.log_artifact(args.output_train_path, artifact_path="processed_data")
+            run.log_artifact(args.output_test_path, artifact_path="processed_data")
+
+        # Move the watermark past the rows processed in this run
+        if args.watermark_path:
+            if not incremental:
+                watermark.remove_increment_files(watermark.load(args.watermark_path))
+                state = watermark.full_state(args.input_data_path, input_size, n_train + n_test,
+                                             args.output_train_path, args.output_test_path)
+            state = watermark.save(args.watermark_path, state)
+            logger.info(f"Watermark {args.watermark_path}: {state['rows']} rows up to byte {state['byte_offset']}, "
+                        f"{len(state['increments'])} increment(s).")
+
+        run.set_tag("preprocessing_status", "completed")
+        if cache:
+            with instrumentation.span('cache_store'):
+                cache.store(cache_key, outputs, run_id=run_id)
+        with instrumentation.span('upload'):
+            run.wait()
+        profiler.report(run, args.perf_output_path, args.prometheus_path)
         logger.info("Preprocessing script finished successfully.")
+    return encoder, train_df, test_df
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Preprocess churn data and log to MLflow.")
@@ -99,6 +390,17 @@ if __name__ == '__main__':
     parser.add_argument('--test-split-ratio', type=float, default=0.2, help='Ratio for train-test split.')
     parser.add_argument('--random-state', type=int, default=42, help='Random state for train-test split.')
     parser.add_argument('--mlflow-experiment-name', type=str, default="Churn_Prediction_Experiment", help="Name of the MLflow experiment.")
+    parser.add_argument('--output-format', type=str, choices=data_io.FORMATS, default=None, help='Format of the processed train/test files. Defaults to the output path extension (CSV if unknown).')
+    parser.add_argument('--encoder-output-path', type=str, default='/opt/ml/processing/model/feature_encoder.json', help='Path to save the fitted feature encoder (JSON), next to the model.')
+    parser.add_argument('--chunk-size', type=int, default=0, help='Rows per chunk for out-of-core preprocessing. 0 (default) loads the whole file into memory.')
+    parser.add_argument('--refresh-mode', type=str, choices=['full', 'incremental'], default='full',
+                        help='incremental: preprocess only the rows appended to the input since --watermark-path, with the saved encoder.')
+    parser.add_argument('--watermark-path', type=str, default=None,
+                        help='Watermark of the rows already preprocessed (JSON), e.g. /opt/ml/processing/model/watermark.json. Written by every run when set.')
+    parser.add_argument('--drift-baseline-path', type=str, default='/opt/ml/processing/model/drift_baseline.json',
+                        help='Where to save the drift baseline of the training rows (see drift_monitor.py). Empty string to skip.')
+    stage_cache.add_cache_arguments(parser)
+    instrumentation.add_profiling_arguments(parser)
     
     args = parser.parse_args()
     main(args)
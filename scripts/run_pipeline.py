@@ -0,0 +1,118 @@
+"""
+Runs preprocess, train and evaluate in one process.
+
+The Argo workflow runs each stage in its own pod, which pays for the pip install, the
+pandas/xgboost/mlflow imports and a round trip of the processed data through the PVC
+three times. This runner imports everything once and hands the processed frames from
+preprocessing.main() to train_model() and the trained model to evaluate_model()
+directly, so small and medium data sets go through the whole pipeline in seconds.
+Each stage still logs its own MLflow run, as in the workflow.
+
+    python3 scripts/run_pipeline.py --input-data-path data/telco.csv --output-dir /tmp/churn
+
+With --chunk-size the data is larger than memory: preprocessing streams it to files
+and training reads them back in iterator mode, but the imports are still shared.
+"""
+import os
+import time
+import logging
+import argparse
+
+import data_io
+import preprocessing
+import stage_cache
+import instrumentation
+from xgboost_script import train_model
+from evaluation_script import evaluate_model
+
+logger = logging.getLogger(__name__)
+
+
+def run_pipeline(args):
+    """
+    Runs the three stages and returns the evaluation metrics.
+    """
+    timings = {}
+    output_dir = args.output_dir
+    train_path = test_path = ''
+    in_memory = not args.chunk_size
+    if args.write_processed_data or not in_memory:
+        ext = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}[args.output_format]
+        train_path = os.path.join(output_dir, 'output', 'train', f'train{ext}')
+        test_path = os.path.join(output_dir, 'output', 'test', f'test{ext}')
+    encoder_path = os.path.join(output_dir, 'model', 'feature_encoder.json')
+    model_path = os.path.join(output_dir, 'model', 'xgboost-model')
+    os.makedirs(os.path.dirname(encoder_path), exist_ok=True)
+    cache_args = {'cache_dir': args.cache_dir, 'cache_max_age_days': args.cache_max_age_days,
+                  'cache_max_size_gb': args.cache_max_size_gb}
+
+    start = time.time()
+    preprocess_args = argparse.Namespace(
+        input_data_path=args.input_data_path, output_train_path=train_path, output_test_path=test_path,
+        test_split_ratio=args.test_split_ratio, random_state=args.random_state,
+        mlflow_experiment_name=args.preprocess_experiment_name, output_format=args.output_format,
+        encoder_output_path=encoder_path, chunk_size=args.chunk_size, refresh_mode='full', watermark_path=None,
+        drift_baseline_path=os.path.join(output_dir, 'model', 'drift_baseline.json'),
+        profile=args.profile, perf_output_path=None, prometheus_path=None, **cache_args,
+    )
+    _, train_df, test_df = preprocessing.main(preprocess_args)
+    timings['preprocess'] = time.time() - start
+
+    start = time.time()
+    model, training_run_id = train_model(
+        train_path or None, test_path or None, model_path,
+        os.path.join(output_dir, 'output', 'metrics.json'),
+        args.mlflow_experiment_name,
+        dict(cache_args, training_mode=args.training_mode if not in_memory else 'in-memory',
+             chunk_size=args.chunk_size or 100000, hyperparameters_path=args.hyperparameters_path,
+             encoder_path=encoder_path, profile=args.profile, cv_folds=args.cv_folds, cv_strategy=args.cv_strategy,
+             random_state=args.random_state,
+             compiled_model_output_path=os.path.join(output_dir, 'model', 'compiled_trees.npz') if args.compile_trees else None),
+        train_frame=train_df, valid_frame=test_df,
+    )
+    del train_df  # Only the test frame is needed from here on
+    timings['train'] = time.time() - start
+
+    start = time.time()
+    metrics = evaluate_model(
+        model_path, test_path or None, os.path.join(output_dir, 'output', 'eval_metrics.json'),
+        args.mlflow_experiment_name, training_run_id=training_run_id,
+        chunk_size=args.chunk_size or None, threshold=args.decision_threshold, n_bootstrap=args.bootstrap_samples,
+        profile=args.profile, model=model, valid_frame=test_df,  # The model is in memory, so no stage cache
+    )
+    timings['evaluate'] = time.time() - start
+
+    logger.info("Pipeline finished: " + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in timings.items())
+                + f" (total {sum(timings.values()):.1f}s). Outputs in {output_dir}.")
+    return metrics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run preprocess, train and evaluate in one process.")
+    parser.add_argument('--input-data-path', type=str, default='/opt/ml/processing/input/WA_Fn-UseC_-Telco-Customer-Churn.csv', help='Path to the input CSV file.')
+    parser.add_argument('--output-dir', type=str, default='/opt/ml/processing',
+                        help='Model files go to <dir>/model and metrics (and processed data, if written) to <dir>/output, as on the PVC.')
+    parser.add_argument('--test-split-ratio', type=float, default=0.2, help='Ratio for train-test split.')
+    parser.add_argument('--random-state', type=int, default=42, help='Random state for train-test split.')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='Rows per chunk for data larger than memory (chunked preprocessing, iterator training). 0 keeps everything in memory.')
+    parser.add_argument('--training-mode', type=str, choices=['iterator', 'external-memory'], default='iterator',
+                        help='Training mode used with --chunk-size.')
+    parser.add_argument('--write-processed-data', action='store_true',
+                        help='Also write the processed train/test files (and log them to MLflow) in in-memory mode.')
+    parser.add_argument('--output-format', type=str, choices=data_io.FORMATS, default='parquet',
+                        help='Format of the processed files; also fixes the in-memory dtypes, so results match the workflow.')
+    parser.add_argument('--hyperparameters-path', type=str, default=None, help='Optional best_config.json written by hpo_search.py.')
+    parser.add_argument('--no-compile-trees', action='store_false', dest='compile_trees',
+                        help='Skip exporting compiled_trees.npz for model_server.py.')
+    parser.add_argument('--cv-folds', type=int, default=0, help='Cross-validate with this many folds before training (see cross_validation.py).')
+    parser.add_argument('--cv-strategy', type=str, choices=['stratified'], default='stratified',
+                        help='The time strategy needs the increment files of an incremental refresh, which this runner does not make.')
+    parser.add_argument('--decision-threshold', type=float, default=0.5)
+    parser.add_argument('--bootstrap-samples', type=int, default=200)
+    parser.add_argument('--preprocess-experiment-name', type=str, default="Churn_Prediction_Experiment")
+    parser.add_argument('--mlflow-experiment-name', type=str, default="Churn_Prediction_XGBoost", help="Experiment for the train and evaluate runs.")
+    parser.add_argument('--profile', type=str, choices=instrumentation.PROFILE_MODES, default='none',
+                        help='Profile each stage with cProfile or tracemalloc (reports logged to MLflow).')
+    stage_cache.add_cache_arguments(parser)
+    run_pipeline(parser.parse_args())
@@ -0,0 +1,135 @@
+"""
+Load-once, quantize-once datasets shared across worker processes.
+
+The parent process bins every feature into uint8 codes (at most 255 bins per feature,
+with 255 reserved for missing values) and places the arrays in POSIX shared memory.
+Workers attach to them without copying and build their XGBoost matrices from the codes.
+Because the binning is monotone, a split on a code is a split on the original value,
+so hyperparameters tuned on the codes carry over to training on the raw features.
+"""
+import logging
+from multiprocessing import shared_memory
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MISSING_CODE = 255
+MAX_BINS = 255
+
+
+def compute_cuts(X, max_bin=MAX_BINS):
+    """
+    Per-feature cut points from quantiles of the training data.
+    Features with few distinct values (label codes, flags) get one bin per value.
+    """
+    max_bin = min(max_bin, MAX_BINS)
+    X = np.asarray(X, dtype=np.float32)
+    cuts = []
+    for j in range(X.shape[1]):
+        column = X[:, j]
+        column = column[~np.isnan(column)]
+        distinct = np.unique(column)
+        if len(distinct) <= max_bin:
+            # Midpoints keep every distinct value in its own bin
+            feature_cuts = (distinct[:-1] + distinct[1:]) / 2
+        else:
+            feature_cuts = np.unique(np.quantile(column, np.linspace(0, 1, max_bin + 1)[1:-1]))
+        cuts.append(feature_cuts.astype(np.float32))
+    return cuts
+
+
+def quantize(X, cuts):
+    """
+    Maps raw feature values to uint8 bin codes using cuts from compute_cuts().
+    """
+    X = np.asarray(X, dtype=np.float32)
+    codes = np.empty(X.shape, dtype=np.uint8)
+    for j, feature_cuts in enumerate(cuts):
+        column = X[:, j]
+        feature_codes = np.searchsorted(feature_cuts, column, side='right')
+        feature_codes[np.isnan(column)] = MISSING_CODE
+        codes[:, j] = feature_codes
+    return codes
+
+
+class SharedArrays:
+    """
+    A named set of NumPy arrays in shared memory.
+
+    The creating process calls SharedArrays.create({...}) and hands spec() (a small,
+    picklable dict) to the workers, which call SharedArrays.attach(spec) to get
+    zero-copy views. The creator must call unlink() when the workers are done.
+    """
+
+    def __init__(self, blocks, arrays, owner):
+        self._blocks = blocks
+        self.arrays = arrays
+        self._owner = owner
+
+    @classmethod
+    def create(cls, arrays):
+        shared = cls.allocate({name: (np.shape(array), np.asarray(array).dtype) for name, array in arrays.items()})
+        for name, array in arrays.items():
+            shared[name][...] = array
+        return shared
+
+    @classmethod
+    def allocate(cls, layout):
+        """
+        Uninitialized shared arrays from {name: (shape, dtype)}, for callers that fill
+        them in place (e.g. np.take(..., out=shared[name])) instead of copying them in.
+        """
+        blocks, views = {}, {}
+        for name, (shape, dtype) in layout.items():
+            dtype = np.dtype(dtype)
+            block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+            blocks[name], views[name] = block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        logger.info(f"Placed {sum(v.nbytes for v in views.values()) / 2**20:.1f} MiB in shared memory.")
+        return cls(blocks, views, owner=True)
+
+    def spec(self):
+        return {
+            name: {'shm_name': self._blocks[name].name, 'shape': view.shape, 'dtype': view.dtype.str}
+            for name, view in self.arrays.items()
+        }
+
+    @classmethod
+    def attach(cls, spec):
+        blocks, views = {}, {}
+        for name, info in spec.items():
+            block = shared_memory.SharedMemory(name=info['shm_name'])
+            blocks[name] = block
+            views[name] = np.ndarray(tuple(info['shape']), dtype=np.dtype(info['dtype']), buffer=block.buf)
+        return cls(blocks, views, owner=False)
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def close(self):
+        self.arrays = {}
+        for block in self._blocks.values():
+            block.close()
+
+    def unlink(self):
+        self.close()
+        if self._owner:
+            for block in self._blocks.values():
+                block.unlink()
+        self._blocks = {}
+
+
+def share_quantized(X_train, y_train, X_valid=None, y_valid=None, max_bin=MAX_BINS):
+    """
+    Quantizes the training (and optional validation) features with cuts learned on the
+    training data and places codes and labels in shared memory. Returns SharedArrays.
+    """
+    cuts = compute_cuts(X_train, max_bin)
+    arrays = {
+        'X_train': quantize(X_train, cuts),
+        'y_train': np.asarray(y_train, dtype=np.float32),
+    }
+    if X_valid is not None:
+        arrays['X_valid'] = quantize(X_valid, cuts)
+        arrays['y_valid'] = np.asarray(y_valid, dtype=np.float32)
+    return SharedArrays.create(arrays)
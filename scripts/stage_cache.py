@@ -0,0 +1,257 @@
+"""
+Content-addressed cache for pipeline stages, kept on the PVC.
+
+A stage's cache key is the SHA-256 of its input data files, the source of the scripts
+it runs and its parameters. When a manifest for that key exists, the stage copies the
+cached outputs back into place and reuses the MLflow run that produced them instead of
+recomputing. Entries are evicted by age (since last use) and by total size.
+
+Layout under --cache-dir:
+    file_hashes.json                   digests of large inputs keyed by path, size and mtime
+    <stage>/<key>/manifest.json        run id, outputs, extra values, timestamps
+    <stage>/<key>/outputs/<name>/...   cached copies of the stage outputs
+
+    python3 scripts/stage_cache.py --cache-dir /opt/ml/processing/cache --list
+"""
+import os
+import glob
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_BYTES = 4 * 2**20
+MANIFEST_NAME = 'manifest.json'
+FILE_HASHES_NAME = 'file_hashes.json'
+
+
+def module_paths(*names):
+    """
+    Paths of the given sibling scripts, e.g. module_paths('preprocessing.py', 'data_io.py').
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    return [os.path.join(here, name) for name in names]
+
+
+def _expand(path):
+    # A file, every file under a directory, or a glob pattern
+    if os.path.isdir(path):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    if os.path.exists(path):
+        return [path]
+    matches = sorted(glob.glob(path))
+    if not matches:
+        raise FileNotFoundError(f"No files found for {path}")
+    return matches
+
+
+def _write_json(path, content):
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(content, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+class StageCache:
+    def __init__(self, cache_dir, stage, max_age_days=30.0, max_size_gb=20.0):
+        self.cache_dir = cache_dir
+        self.stage = stage
+        self.stage_dir = os.path.join(cache_dir, stage)
+        self.max_age_seconds = max_age_days * 86400
+        self.max_size_bytes = int(max_size_gb * 2**30)
+        os.makedirs(self.stage_dir, exist_ok=True)
+        self._hashes_path = os.path.join(cache_dir, FILE_HASHES_NAME)
+        self._hashes = None
+
+    # --- Fingerprinting ---
+
+    def file_digest(self, path):
+        """
+        Streaming SHA-256 of a file. Digests are remembered by (path, size, mtime) so an
+        unchanged multi-GB input is not re-read on every run.
+        """
+        if self._hashes is None:
+            try:
+                with open(self._hashes_path) as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError):
+                self._hashes = {}
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self._hashes.get(path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_BYTES), b''):
+                digest.update(block)
+        self._hashes[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        _write_json(self._hashes_path, self._hashes)
+        return digest.hexdigest()
+
+    def key(self, data_paths, code_paths, params):
+        """
+        Cache key for a stage run. Data files contribute their content only, so moving
+        an unchanged file does not invalidate the cache.
+        """
+        digest = hashlib.sha256(self.stage.encode())
+        for path in data_paths:
+            for file_path in _expand(path):
+                digest.update(b'data:' + self.file_digest(file_path).encode())
+        for path in code_paths:
+            digest.update(f"code:{os.path.basename(path)}:{self.file_digest(path)}".encode())
+        digest.update(b'params:' + json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    # --- Lookup / store ---
+
+    def lookup(self, key):
+        """
+        Returns the manifest for key if all of its cached outputs are present, else None.
+        """
+        entry_dir = os.path.join(self.stage_dir, key)
+        try:
+            with open(os.path.join(entry_dir, MANIFEST_NAME)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        for output in manifest['outputs'].values():
+            if not os.path.exists(os.path.join(entry_dir, output['file'])):
+                logger.warning(f"Stage cache entry {key[:12]} is incomplete; ignoring it.")
+                return None
+        manifest['last_used'] = time.time()
+        manifest['hits'] = manifest.get('hits', 0) + 1
+        _write_json(os.path.join(entry_dir, MANIFEST_NAME), manifest)
+        return manifest
+
+    def restore(self, manifest, destinations):
+        """
+        Copies cached outputs to destinations ({output name: path}). Files that already
+        hold the cached content are left alone. Returns False, without copying anything,
+        if the entry lacks one of the outputs (a cache miss), True otherwise.
+        """
+        entry_dir = os.path.join(self.stage_dir, manifest['key'])
+        missing = sorted(set(destinations) - set(manifest['outputs']))
+        if missing:
+            logger.warning(f"Stage cache entry {manifest['key'][:12]} has no {', '.join(missing)}; ignoring it.")
+            return False
+        for name, path in destinations.items():
+            output = manifest['outputs'][name]
+            if os.path.exists(path) and self.file_digest(path) == output['sha256']:
+                continue
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            shutil.copyfile(os.path.join(entry_dir, output['file']), tmp_path)
+            os.replace(tmp_path, path)
+            logger.info(f"Restored {name} from the stage cache to {path}")
+        return True
+
+    def store(self, key, outputs, run_id=None, extra=None):
+        """
+        Copies outputs ({output name: path}) into a new cache entry and evicts old
+        entries. Returns the manifest.
+        """
+        entry_dir = os.path.join(self.stage_dir, key)
+        tmp_dir = f"{entry_dir}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        now = time.time()
+        manifest = {'key': key, 'stage': self.stage, 'run_id': run_id, 'extra': extra or {},
+                    'created': now, 'last_used': now, 'hits': 0, 'outputs': {}, 'size_bytes': 0}
+        for name, path in outputs.items():
+            file_name = os.path.join('outputs', name, os.path.basename(path))
+            os.makedirs(os.path.join(tmp_dir, 'outputs', name))
+            shutil.copyfile(path, os.path.join(tmp_dir, file_name))
+            size = os.path.getsize(path)
+            manifest['outputs'][name] = {'file': file_name, 'source_path': path, 'size': size, 'sha256': self.file_digest(path)}
+            manifest['size_bytes'] += size
+        _write_json(os.path.join(tmp_dir, MANIFEST_NAME), manifest)
+
+        if os.path.exists(entry_dir):
+            # Another run stored the same key first; its outputs are equivalent
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        else:
+            os.rename(tmp_dir, entry_dir)
+        logger.info(f"Stored {len(outputs)} output(s) of stage '{self.stage}' in the cache under {key[:12]}")
+        self.evict(keep=key)
+        return manifest
+
+    # --- Eviction ---
+
+    def entries(self):
+        """
+        Manifests of all complete entries across stages.
+        """
+        manifests = []
+        for manifest_path in glob.glob(os.path.join(self.cache_dir, '*', '*', MANIFEST_NAME)):
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            manifest['entry_dir'] = os.path.dirname(manifest_path)
+            if '.tmp' in os.path.basename(manifest['entry_dir']):
+                continue  # Being written by store()
+            manifests.append(manifest)
+        return manifests
+
+    def evict(self, keep=None):
+        """
+        Removes entries unused for longer than max_age_days, then the least recently
+        used entries until the cache fits in max_size_gb. Returns the removed manifests.
+        """
+        now = time.time()
+        manifests = sorted(self.entries(), key=lambda m: m['last_used'])
+        removed = []
+        total = sum(m['size_bytes'] for m in manifests)
+        for manifest in manifests:
+            if manifest['key'] == keep:
+                continue
+            if now - manifest['last_used'] > self.max_age_seconds or total > self.max_size_bytes:
+                shutil.rmtree(manifest['entry_dir'], ignore_errors=True)
+                total -= manifest['size_bytes']
+                removed.append(manifest)
+        if removed:
+            logger.info(f"Evicted {len(removed)} stage cache entr{'y' if len(removed) == 1 else 'ies'}; "
+                        f"{total / 2**30:.2f} GiB remain.")
+        return removed
+
+
+def open_cache(cache_dir, stage, max_age_days=30.0, max_size_gb=20.0):
+    """
+    StageCache for stage, or None when caching is disabled (no cache_dir).
+    """
+    if not cache_dir:
+        return None
+    return StageCache(cache_dir, stage, max_age_days, max_size_gb)
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='Stage cache directory (e.g. on the PVC). Unchanged inputs reuse earlier outputs. Disabled by default.')
+    parser.add_argument('--cache-max-age-days', type=float, default=30.0, help='Evict cache entries unused for this many days.')
+    parser.add_argument('--cache-max-size-gb', type=float, default=20.0, help='Evict least recently used entries beyond this total size.')
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="List or evict stage cache entries.")
+    add_cache_arguments(parser)
+    parser.add_argument('--list', action='store_true', help='List the cache entries.')
+    parser.add_argument('--evict', action='store_true', help='Apply the age and size limits now.')
+    args = parser.parse_args()
+    if not args.cache_dir:
+        parser.error("--cache-dir is required")
+
+    cache = StageCache(args.cache_dir, '', args.cache_max_age_days, args.cache_max_size_gb)
+    if args.evict:
+        cache.evict()
+    if args.list:
+        for manifest in sorted(cache.entries(), key=lambda m: m['last_used'], reverse=True):
+            print(f"{manifest['stage']:<12} {manifest['key'][:12]}  run {manifest['run_id']}  "
+                  f"{manifest['size_bytes'] / 2**20:9.1f} MiB  {manifest.get('hits', 0)} hit(s)  "
+                  f"last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(manifest['last_used']))}")
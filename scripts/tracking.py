@@ -0,0 +1,454 @@
+"""
+Batched, asynchronous MLflow logging with an offline spool.
+
+Params, metrics and tags are buffered and sent with one log_batch call instead of a
+round-trip each, and artifacts are uploaded on a background thread pool while the
+script keeps computing. If the tracking server cannot be reached (at start-up or
+mid-run), everything is written to a local spool directory instead, so an MLflow
+outage never fails or stalls a pipeline step, and the scripts run locally with no
+server at all. Spooled runs are sent to the server later with:
+
+    python3 scripts/tracking.py --replay [--spool-dir /opt/ml/processing/mlflow_spool]
+
+Usage in the scripts:
+
+    with tracking.start_run("Churn_Prediction_XGBoost", run_name="xgboost_training_run") as run:
+        run.log_params({...})
+        run.log_metric("validation_auc", auc)
+        run.log_artifact(path, artifact_path="processed_data")
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import mlflow
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.tracking import MlflowClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACKING_URI = "http://localhost:5000"
+# MLflow's log_batch limits
+MAX_PARAMS_PER_BATCH = 100
+MAX_TAGS_PER_BATCH = 100
+MAX_METRICS_PER_BATCH = 1000
+# Buffered values are sent in the background once this many are pending or this much time has passed
+FLUSH_PENDING = 200
+FLUSH_INTERVAL_SECONDS = 10.0
+# Tag set on runs created by replay, so a replay that is interrupted and rerun finds them again
+SPOOL_ID_TAG = "spool_id"
+
+# Keep the MLflow client from retrying a dead server for minutes before the spool takes over
+os.environ.setdefault("MLFLOW_HTTP_REQUEST_MAX_RETRIES", "2")
+os.environ.setdefault("MLFLOW_HTTP_REQUEST_TIMEOUT", "30")
+
+_server_status = {}
+
+
+def default_spool_dir():
+    # On the PVC inside the pipeline pods, so spooled runs survive the pod
+    if os.path.isdir('/opt/ml/processing'):
+        return '/opt/ml/processing/mlflow_spool'
+    return os.path.join(os.getcwd(), 'mlflow_spool')
+
+
+def server_available(tracking_uri, timeout=2.0):
+    """
+    Quick health probe of an HTTP tracking server (GET /health). Local file/database
+    tracking URIs are always available. Cached per process.
+    """
+    if not tracking_uri.startswith(('http://', 'https://')):
+        return True
+    if tracking_uri not in _server_status:
+        try:
+            with urllib.request.urlopen(tracking_uri.rstrip('/') + '/health', timeout=timeout) as response:
+                _server_status[tracking_uri] = response.status == 200
+        except Exception as e:
+            logger.warning(f"MLflow tracking server {tracking_uri} is not reachable ({e}).")
+            _server_status[tracking_uri] = False
+    return _server_status[tracking_uri]
+
+
+def _experiment_id(client, experiment_name):
+    experiment = client.get_experiment_by_name(experiment_name)
+    if experiment is not None:
+        return experiment.experiment_id
+    logger.info(f"Creating MLflow experiment: {experiment_name}")
+    return client.create_experiment(experiment_name)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Run:
+    """
+    One MLflow run. Online, values go to the server through log_batch and artifact
+    uploads run on a thread pool; offline (or after a failed call), they are appended
+    to <spool_dir>/<spool_id>/events.jsonl and artifacts are copied next to it.
+    Files passed to log_artifact must not be modified until the run ends.
+    """
+
+    def __init__(self, experiment_name, run_name, tags=None, parent=None, spool_dir=None):
+        self.experiment_name = experiment_name
+        self.run_name = run_name
+        self.parent = parent
+        self.tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", DEFAULT_TRACKING_URI)
+        self.spool_dir = spool_dir or (parent.spool_dir if parent else os.environ.get("MLFLOW_SPOOL_DIR") or default_spool_dir())
+        self.client = None
+        self.run_id = None
+        self.offline = True
+        self._lock = threading.Lock()
+        self._params, self._metrics, self._tags = [], [], {}
+        self._last_flush = time.time()
+        self._futures = []
+        self._staging_dir = None
+        self._spool_path = None
+        self.counts = {'params': 0, 'metrics': 0, 'tags': 0, 'artifacts': 0}
+        # Children (nested runs) share the parent's upload threads
+        if parent is not None:
+            self._batch_pool, self._artifact_pool = parent._batch_pool, parent._artifact_pool
+        else:
+            self._batch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mlflow-batch')
+            self._artifact_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='mlflow-artifacts')
+
+        tags = dict(tags or {})
+        if server_available(self.tracking_uri) and (parent is None or not parent.offline):
+            try:
+                mlflow.set_tracking_uri(self.tracking_uri)
+                self.client = MlflowClient(self.tracking_uri)
+                experiment_id = _experiment_id(self.client, experiment_name)
+                if parent is not None:
+                    tags['mlflow.parentRunId'] = parent.run_id
+                run = self.client.create_run(experiment_id, run_name=run_name, tags=tags)
+                self.run_id = run.info.run_id
+                self.artifact_root = run.info.artifact_uri
+                self.offline = False
+            except Exception as e:
+                logger.warning(f"Could not start an MLflow run on {self.tracking_uri} ({e}); spooling locally.")
+        if self.offline:
+            # The parent link is restored from run.json on replay
+            tags.pop('mlflow.parentRunId', None)
+            self.run_id = f"offline-{uuid.uuid4().hex}"
+            self.artifact_root = os.path.join(self._spool(), 'artifacts')
+            self._tags.update(tags)
+        logger.info(f"MLflow Run ID: {self.run_id}{' (offline, spooled to ' + self._spool() + ')' if self.offline else ''}")
+
+    # --- Spool ---
+
+    def _spool(self):
+        # Created on first use; online runs only get one if a call fails
+        if self._spool_path is None:
+            self._spool_path = os.path.join(self.spool_dir, self.run_id)
+            os.makedirs(os.path.join(self._spool_path, 'artifacts'), exist_ok=True)
+            with open(os.path.join(self._spool_path, 'run.json'), 'w') as f:
+                json.dump({
+                    'experiment_name': self.experiment_name,
+                    'run_name': self.run_name,
+                    # A real run id when the server went away mid-run; replay then appends to that run
+                    'run_id': None if self.run_id.startswith('offline-') else self.run_id,
+                    'parent_spool_id': self.parent.run_id if self.parent else None,
+                    'created': time.time(),
+                }, f)
+        return self._spool_path
+
+    def _spool_event(self, event):
+        with self._lock:
+            with open(os.path.join(self._spool(), 'events.jsonl'), 'a') as f:
+                f.write(json.dumps(event) + '\n')
+
+    def _go_offline(self, error):
+        if not self.offline:
+            logger.warning(f"MLflow call failed ({error}); spooling the rest of run {self.run_id} to {self._spool()}.")
+            self.offline = True
+
+    # --- Params, metrics, tags ---
+
+    def log_param(self, key, value):
+        self.log_params({key: value})
+
+    def log_params(self, params):
+        with self._lock:
+            self._params.extend((str(key), str(value)) for key, value in params.items())
+        self._maybe_flush()
+
+    def log_metric(self, key, value, step=None):
+        self.log_metrics({key: value}, step=step)
+
+    def log_metrics(self, metrics, step=None):
+        timestamp = int(time.time() * 1000)
+        with self._lock:
+            self._metrics.extend((key, float(value), timestamp, step or 0) for key, value in metrics.items())
+        self._maybe_flush()
+
+    def set_tag(self, key, value):
+        self.set_tags({key: value})
+
+    def set_tags(self, tags):
+        with self._lock:
+            self._tags.update((str(key), str(value)) for key, value in tags.items())
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        pending = len(self._params) + len(self._metrics) + len(self._tags)
+        if pending >= FLUSH_PENDING or time.time() - self._last_flush >= FLUSH_INTERVAL_SECONDS:
+            self._last_flush = time.time()
+            self._futures.append(self._batch_pool.submit(self.flush))
+
+    def flush(self):
+        """
+        Sends all buffered params, metrics and tags (blocking).
+        """
+        with self._lock:
+            params, metrics, tags = self._params, self._metrics, self._tags
+            self._params, self._metrics, self._tags = [], [], {}
+        if not (params or metrics or tags):
+            return
+        self.counts['params'] += len(params)
+        self.counts['metrics'] += len(metrics)
+        self.counts['tags'] += len(tags)
+        if not self.offline:
+            try:
+                for batch in _chunks([Param(k, v) for k, v in params], MAX_PARAMS_PER_BATCH):
+                    self.client.log_batch(self.run_id, params=batch)
+                for batch in _chunks([RunTag(k, v) for k, v in tags.items()], MAX_TAGS_PER_BATCH):
+                    self.client.log_batch(self.run_id, tags=batch)
+                for batch in _chunks([Metric(*metric) for metric in metrics], MAX_METRICS_PER_BATCH):
+                    self.client.log_batch(self.run_id, metrics=batch)
+                return
+            except Exception as e:
+                self._go_offline(e)
+        # Re-sending values that did reach the server is harmless on replay
+        self._spool_event({'type': 'batch', 'params': params, 'metrics': metrics, 'tags': tags})
+
+    # --- Artifacts ---
+
+    def log_artifact(self, local_path, artifact_path=None):
+        self.counts['artifacts'] += 1
+        self._futures.append(self._artifact_pool.submit(self._upload, local_path, artifact_path, False))
+
+    def log_artifacts(self, local_dir, artifact_path=None):
+        self.counts['artifacts'] += 1
+        self._futures.append(self._artifact_pool.submit(self._upload, local_dir, artifact_path, True))
+
+    def log_dict(self, dictionary, artifact_file):
+        path = os.path.join(self._staging(), artifact_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(dictionary, f, indent=2)
+        self.log_artifact(path, os.path.dirname(artifact_file) or None)
+
+    def log_model(self, flavor, model, artifact_path):
+        """
+        Saves model with an MLflow flavor module (e.g. mlflow.xgboost) into a local
+        MLmodel directory and uploads it as run artifacts under artifact_path, which is
+        what Seldon's MLFLOW_SERVER loads. Both happen in the background, so model must
+        not be changed afterwards.
+        """
+        local_dir = os.path.join(self._staging(), artifact_path)
+        self.counts['artifacts'] += 1
+
+        def save_and_upload():
+            # save_model also infers pip requirements, which takes seconds; keep it off the main thread
+            flavor.save_model(model, local_dir)
+            self._upload(local_dir, artifact_path, True)
+
+        self._futures.append(self._artifact_pool.submit(save_and_upload))
+
+    def _staging(self):
+        if self._staging_dir is None:
+            import tempfile
+            self._staging_dir = tempfile.mkdtemp(prefix='mlflow-staging-')
+        return self._staging_dir
+
+    def _upload(self, local_path, artifact_path, is_dir):
+        if not self.offline:
+            try:
+                if is_dir:
+                    self.client.log_artifacts(self.run_id, local_path, artifact_path)
+                else:
+                    self.client.log_artifact(self.run_id, local_path, artifact_path)
+                return
+            except Exception as e:
+                self._go_offline(e)
+        destination = os.path.join(self._spool(), 'artifacts', artifact_path or '')
+        if is_dir:
+            shutil.copytree(local_path, destination, dirs_exist_ok=True)
+        else:
+            os.makedirs(destination, exist_ok=True)
+            shutil.copy2(local_path, destination)
+        self._spool_event({'type': 'artifact', 'path': artifact_path})
+
+    def get_artifact_uri(self, artifact_path=None):
+        # Offline this is the local spool directory, not a location the server or Seldon can read
+        return f"{self.artifact_root}/{artifact_path}" if artifact_path else self.artifact_root
+
+    # --- Lifecycle ---
+
+    def child(self, run_name, tags=None):
+        """
+        A nested run (mlflow.parentRunId = this run) sharing this run's upload threads.
+        """
+        return Run(self.experiment_name, run_name, tags=tags, parent=self)
+
+    def wait(self):
+        """
+        Blocks until every buffered value is sent and every artifact upload has finished.
+        """
+        self.flush()
+        for future in list(self._futures):
+            future.result()
+        self._futures = [future for future in self._futures if not future.done()]
+        self.flush()  # Values logged while waiting
+
+    def end(self, status='FINISHED'):
+        start = time.time()
+        self.wait()
+        if not self.offline:
+            try:
+                self.client.set_terminated(self.run_id, status)
+            except Exception as e:
+                self._go_offline(e)
+        if self.offline:
+            self._spool_event({'type': 'end', 'status': status, 'end_time': int(time.time() * 1000)})
+        if self.parent is None:
+            self._batch_pool.shutdown()
+            self._artifact_pool.shutdown()
+        if self._staging_dir:
+            shutil.rmtree(self._staging_dir, ignore_errors=True)
+        logger.info(f"MLflow run {self.run_id} {status.lower()}: {self.counts['params']} params, "
+                    f"{self.counts['metrics']} metrics, {self.counts['tags']} tags, {self.counts['artifacts']} artifact uploads "
+                    f"({time.time() - start:.2f}s waiting at the end)"
+                    f"{'; spooled to ' + self._spool_path if self._spool_path else ''}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end('FAILED' if exc_type else 'FINISHED')
+        return False
+
+
+def start_run(experiment_name, run_name, tags=None, spool_dir=None):
+    """
+    Starts a top-level run in experiment_name (created if missing) on the server in
+    MLFLOW_TRACKING_URI (default http://localhost:5000), or offline if it is unreachable.
+    """
+    return Run(experiment_name, run_name, tags=tags, spool_dir=spool_dir)
+
+
+# --- Replay ---
+
+def _find_replayed_run(client, experiment_id, spool_id):
+    runs = client.search_runs([experiment_id], filter_string=f"tags.{SPOOL_ID_TAG} = '{spool_id}'", max_results=1)
+    return runs[0].info.run_id if runs else None
+
+
+def _write_run_info(path, info):
+    tmp_path = os.path.join(path, 'run.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(info, f)
+    os.replace(tmp_path, os.path.join(path, 'run.json'))
+
+
+def replay_spool(spool_dir, tracking_uri=None):
+    """
+    Sends every spooled run in spool_dir to the tracking server and deletes it once
+    accepted. Parents are replayed before their nested runs. Returns the number of
+    runs replayed. Safe to rerun after a failure: the created run id and the number of
+    events sent are saved in run.json as replay goes, and runs are tagged with their
+    spool id so one created just before a crash is found instead of created again.
+    """
+    tracking_uri = tracking_uri or os.environ.get("MLFLOW_TRACKING_URI", DEFAULT_TRACKING_URI)
+    if not server_available(tracking_uri):
+        raise RuntimeError(f"MLflow tracking server {tracking_uri} is not reachable")
+    client = MlflowClient(tracking_uri)
+
+    spooled = []
+    for name in os.listdir(spool_dir) if os.path.isdir(spool_dir) else []:
+        try:
+            with open(os.path.join(spool_dir, name, 'run.json')) as f:
+                spooled.append((name, json.load(f)))
+        except (OSError, ValueError):
+            continue
+    spooled.sort(key=lambda item: item[1]['created'])
+
+    run_ids = {}
+    for spool_id, info in spooled:
+        path = os.path.join(spool_dir, spool_id)
+        run_id = info['run_id']
+        if run_id is None:
+            experiment_id = _experiment_id(client, info['experiment_name'])
+            run_id = _find_replayed_run(client, experiment_id, spool_id)
+            if run_id is None:
+                tags = {SPOOL_ID_TAG: spool_id}
+                parent_spool_id = info.get('parent_spool_id')
+                if parent_spool_id:
+                    # The parent may have been replayed (and its spool deleted) by an earlier call
+                    tags['mlflow.parentRunId'] = (run_ids.get(parent_spool_id)
+                                                  or _find_replayed_run(client, experiment_id, parent_spool_id)
+                                                  or parent_spool_id)
+                run = client.create_run(experiment_id, start_time=int(info['created'] * 1000),
+                                        tags=tags, run_name=info['run_name'])
+                run_id = run.info.run_id
+            info['run_id'] = run_id
+            _write_run_info(path, info)
+        run_ids[spool_id] = run_id
+
+        status, end_time = 'FINISHED', None
+        events_path = os.path.join(path, 'events.jsonl')
+        events = []
+        if os.path.exists(events_path):
+            with open(events_path) as f:
+                events = [json.loads(line) for line in f if line.strip()]
+        replayed = info.get('replayed_events', 0)
+        for number, event in enumerate(events, start=1):
+            if event['type'] == 'batch' and number > replayed:
+                params = [Param(k, v) for k, v in event['params']]
+                tags = [RunTag(k, v) for k, v in event['tags'].items()]
+                metrics = [Metric(*metric) for metric in event['metrics']]
+                for batch in _chunks(params, MAX_PARAMS_PER_BATCH):
+                    client.log_batch(run_id, params=batch)
+                for batch in _chunks(tags, MAX_TAGS_PER_BATCH):
+                    client.log_batch(run_id, tags=batch)
+                for batch in _chunks(metrics, MAX_METRICS_PER_BATCH):
+                    client.log_batch(run_id, metrics=batch)
+                # Metrics would be logged twice if a rerun sent this batch again
+                info['replayed_events'] = number
+                _write_run_info(path, info)
+            elif event['type'] == 'end':
+                status, end_time = event['status'], event['end_time']
+        artifacts_dir = os.path.join(path, 'artifacts')
+        if os.path.isdir(artifacts_dir) and os.listdir(artifacts_dir):
+            client.log_artifacts(run_id, artifacts_dir)
+        client.set_terminated(run_id, status, end_time=end_time)
+        shutil.rmtree(path)
+        logger.info(f"Replayed spooled run {spool_id} ({info['run_name']}) as MLflow run {run_id}.")
+    return len(spooled)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Replay MLflow runs spooled while the tracking server was unreachable.")
+    parser.add_argument('--replay', action='store_true', help='Send the spooled runs to MLFLOW_TRACKING_URI.')
+    parser.add_argument('--spool-dir', type=str, default=None, help='Spool directory (default: MLFLOW_SPOOL_DIR or the PVC/working directory).')
+    parser.add_argument('--tracking-uri', type=str, default=None, help='Overrides MLFLOW_TRACKING_URI.')
+    args = parser.parse_args()
+
+    spool_dir = args.spool_dir or os.environ.get("MLFLOW_SPOOL_DIR") or default_spool_dir()
+    if args.replay:
+        count = replay_spool(spool_dir, args.tracking_uri)
+        logger.info(f"Replayed {count} run(s) from {spool_dir}.")
+    else:
+        runs = sorted(os.listdir(spool_dir)) if os.path.isdir(spool_dir) else []
+        print(f"{len(runs)} spooled run(s) in {spool_dir}")
+        for name in runs:
+            print(name)
@@ -22,6 +22,22 @@ kubectl create configmap "${CONFIGMAP_NAME}" \
   --from-file=preprocessing.py=scripts/preprocessing.py \
   --from-file=xgboost_script.py=scripts/xgboost_script.py \
   --from-file=evaluation_script.py=scripts/evaluation_script.py \
+  --from-file=data_io.py=scripts/data_io.py \
+  --from-file=binary_metrics.py=scripts/binary_metrics.py \
+  --from-file=feature_encoding.py=scripts/feature_encoding.py \
+  --from-file=pod_resources.py=scripts/pod_resources.py \
+  --from-file=shared_dataset.py=scripts/shared_dataset.py \
+  --from-file=hpo_search.py=scripts/hpo_search.py \
+  --from-file=batch_scoring.py=scripts/batch_scoring.py \
+  --from-file=compiled_trees.py=scripts/compiled_trees.py \
+  --from-file=model_server.py=scripts/model_server.py \
+  --from-file=stage_cache.py=scripts/stage_cache.py \
+  --from-file=tracking.py=scripts/tracking.py \
+  --from-file=instrumentation.py=scripts/instrumentation.py \
+  --from-file=run_pipeline.py=scripts/run_pipeline.py \
+  --from-file=watermark.py=scripts/watermark.py \
+  --from-file=cross_validation.py=scripts/cross_validation.py \
+  --from-file=drift_monitor.py=scripts/drift_monitor.py \
   --namespace="${NAMESPACE}" \
   --dry-run=client -o yaml | \
   grep -v "creationTimestamp" > "${OUTPUT_YAML}"
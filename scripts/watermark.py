@@ -0,0 +1,205 @@
+"""
+Watermark of the input rows already preprocessed, for incremental refreshes.
+
+The input CSV is treated as append-only history. After a full preprocess the
+watermark records how far into the file the processed data goes (as a byte offset
+at a line boundary and a row count) and where the processed train/test files are.
+An incremental preprocess reads only the bytes after the offset, writes the new rows
+as numbered increment files next to the base files and moves the offset forward.
+The train step records how many increments its model has seen and the model's URI,
+so the next run knows what is new and which model to continue from.
+
+The watermark is a JSON file next to the model on the PVC:
+    {"input_data_path": ..., "byte_offset": 123456, "rows": 7043, "header": "customerID,...",
+     "head_bytes": 1048576, "head_sha256": "...", "base": {"train": ..., "test": ...},
+     "increments": [{"train": ..., "test": ..., "rows": 500, "byte_range": [123456, 140000]}],
+     "trained_increments": 1, "model_uri": "s3://...", "run_id": "..."}
+A head_sha256 that no longer matches the start of the input means the file was
+rewritten rather than appended to, and the next run falls back to a full preprocess.
+"""
+import io
+import os
+import csv
+import json
+import time
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+HEAD_HASH_BYTES = 2**20  # Enough of the file start to notice a rewrite without reading all of it
+SCAN_BLOCK_BYTES = 2**16
+
+
+def load(path):
+    """
+    Returns the watermark at path, or None if there is none.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(path, state):
+    state = dict(state, updated=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+    return state
+
+
+def complete_size(path):
+    """
+    Size of the file up to and including its last newline, so a line that is still
+    being appended is left for the next run.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        position = size
+        while position > 0:
+            start = max(0, position - SCAN_BLOCK_BYTES)
+            f.seek(start)
+            block = f.read(position - start)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+def head_digest(path, length):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read(length))
+    return digest.hexdigest()
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        return f.readline().decode().rstrip('\r\n')
+
+
+def full_state(input_data_path, byte_offset, rows, train_path, test_path):
+    """
+    The watermark after a full preprocess of the first byte_offset bytes of the input.
+    """
+    head_bytes = min(byte_offset, HEAD_HASH_BYTES)
+    return {
+        'input_data_path': input_data_path,
+        'byte_offset': byte_offset,
+        'rows': rows,
+        'header': read_header(input_data_path),
+        'head_bytes': head_bytes,
+        'head_sha256': head_digest(input_data_path, head_bytes),
+        'base': {'train': train_path, 'test': test_path},
+        'increments': [],
+        'trained_increments': 0,
+    }
+
+
+def check(state, input_data_path):
+    """
+    Returns None if the rows after the watermark can be preprocessed incrementally,
+    else the reason why not.
+    """
+    if state is None:
+        return "No watermark from an earlier run"
+    if os.path.abspath(state['input_data_path']) != os.path.abspath(input_data_path):
+        return f"The watermark is for {state['input_data_path']}, not {input_data_path}"
+    if os.path.getsize(input_data_path) < state['byte_offset']:
+        return f"{input_data_path} is shorter than the watermark offset"
+    if read_header(input_data_path) != state['header']:
+        return f"The columns of {input_data_path} changed"
+    if head_digest(input_data_path, state['head_bytes']) != state['head_sha256']:
+        return f"The start of {input_data_path} changed since the watermark"
+    for path in history_paths(state, 'train') + history_paths(state, 'test'):
+        if not os.path.exists(path):
+            return f"Processed file {path} is missing"
+    return None
+
+
+def increment_path(path, index):
+    """
+    The file for increment index next to the base file, e.g. train.parquet -> train-00003.parquet.
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}-{index:05d}{ext}"
+
+
+def history_paths(state, split):
+    """
+    The base file and every increment file of split ('train' or 'test'), oldest first.
+    """
+    return [state['base'][split]] + [increment[split] for increment in state['increments']]
+
+
+def pending_increments(state):
+    """
+    Increments the last trained model has not seen yet.
+    """
+    return state['increments'][state.get('trained_increments', 0):]
+
+
+def remove_increment_files(state):
+    # The data of a superseded watermark; a full preprocess rewrites the base files itself
+    for increment in (state or {}).get('increments', []):
+        for split in ('train', 'test'):
+            if os.path.exists(increment[split]):
+                os.remove(increment[split])
+
+
+class _RangeReader(io.RawIOBase):
+    # Reads bytes [start, end) of a file, so pandas sees exactly the new lines
+    def __init__(self, path, start, end):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._file.read(min(len(buffer), self._remaining))
+        self._remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def open_range(path, start, end):
+    """
+    Buffered binary file object over bytes [start, end) of path, for pd.read_csv.
+    """
+    return io.BufferedReader(_RangeReader(path, start, end), SCAN_BLOCK_BYTES)
+
+
+def iter_new_rows(path, state, end, chunk_size):
+    """
+    Yields the rows between the watermark and byte offset end as raw DataFrames of at
+    most chunk_size rows, with the column names from the watermark's header line.
+    """
+    import pandas as pd
+
+    if end <= state['byte_offset']:
+        return
+    columns = next(csv.reader([state['header']]))
+    with open_range(path, state['byte_offset'], end) as reader:
+        yield from pd.read_csv(reader, header=None, names=columns, chunksize=chunk_size)
+
+
+def record_training(path, model_uri, run_id):
+    """
+    Marks every increment in the watermark at path as seen by the model at model_uri.
+    """
+    state = load(path)
+    if state is None:
+        return None
+    state.update(trained_increments=len(state['increments']), model_uri=model_uri, run_id=run_id)
+    logger.info(f"Watermark {path}: model {model_uri} covers {state['rows']} input rows.")
+    return save(path, state)
@@ -1,157 +1,513 @@
 import xgboost as xgb
-import pandas as pd
+import numpy as np
 import os
 import logging
-from sklearn.metrics import accuracy_score, roc_auc_score
 import json
 import argparse # Added for MLflow experiment name
-import mlflow # Added for MLflow
-import mlflow.xgboost
+import mlflow.xgboost # Added for MLflow
+
+import data_io
+import binary_metrics
+import stage_cache
+import tracking
+import watermark
+import instrumentation
+import cross_validation
+from compiled_trees import export_compiled_trees
+from pod_resources import available_cpus
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def train_model(train_data_path, valid_data_path, model_output_path, metrics_output_path, mlflow_experiment_name, args_dict):
-    logger.info("Starting XGBoost training script.")
+def read_hyperparameters(environ=None):
+    """
+    Reads the hyperparameters from the SageMaker-style SM_HP_* environment variables.
+    SM_HP_NTHREAD defaults to the pod's CPU limit, and SM_HP_EARLY_STOPPING_ROUNDS=0
+    disables early stopping on the validation AUC.
+    """
+    env = os.environ if environ is None else environ
+    return {
+        'max_depth': int(float(env.get('SM_HP_MAX_DEPTH', 5))),
+        'eta': float(env.get('SM_HP_ETA', 0.2)),
+        'min_child_weight': float(env.get('SM_HP_MIN_CHILD_WEIGHT', 1)),
+        'subsample': float(env.get('SM_HP_SUBSAMPLE', 0.8)),
+        'num_round': int(env.get('SM_HP_NUM_ROUND', 100)), # SageMaker often passes num_round
+        'tree_method': env.get('SM_HP_TREE_METHOD', 'hist'),
+        'max_bin': int(env.get('SM_HP_MAX_BIN', 256)),
+        'early_stopping_rounds': int(env.get('SM_HP_EARLY_STOPPING_ROUNDS', 10)),
+        'nthread': int(env.get('SM_HP_NTHREAD', 0)) or available_cpus(),
+    }
+
+def booster_params(hp):
+    """
+    Translates read_hyperparameters() output into xgb.train() parameters.
+    """
+    return {
+        'max_depth': hp['max_depth'],
+        'eta': hp['eta'],
+        'min_child_weight': hp['min_child_weight'],
+        'subsample': hp['subsample'],
+        'objective': 'binary:logistic',
+        'eval_metric': 'auc',
+        'tree_method': hp['tree_method'],
+        'max_bin': hp['max_bin'],
+        'nthread': hp['nthread'],
+    }
+
+def truncate_to_best_iteration(booster):
+    """
+    After early stopping the booster still holds the rounds past the best one.
+    Drop them so every consumer of the saved model predicts with the best round.
+    """
+    best_iteration = booster.attr('best_iteration')
+    if best_iteration is None:
+        return booster
+    best_iteration = int(best_iteration)
+    logger.info(f"Best validation round: {best_iteration} of {booster.num_boosted_rounds()}")
+    if best_iteration + 1 < booster.num_boosted_rounds():
+        booster = booster[: best_iteration + 1]
+    return booster
+
+class ChunkedDataIter(xgb.DataIter):
+    """
+    Feeds XGBoost one chunk of the processed training files at a time, so only the
+    quantized matrix (or the on-disk external-memory cache) is ever fully materialized.
+    """
+
+    def __init__(self, paths, chunk_size, cache_prefix=None):
+        self._paths = paths
+        self._chunk_size = chunk_size
+        self._chunks = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def _iter_chunks(self):
+        for path in self._paths:
+            yield from data_io.iter_frames(path, self._chunk_size)
+
+    def next(self, input_data):
+        if self._chunks is None:
+            self._chunks = self._iter_chunks()
+        with instrumentation.span('read'):
+            chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        X, y = data_io.split_features_target(chunk)
+        input_data(data=X, label=y)
+        return True
+
+    def reset(self):
+        self._chunks = None
+
+def train_booster_from_batches(train_data_path, X_valid, y_valid, hp, training_mode, chunk_size, cache_dir=None,
+                               xgb_model=None):
+    """
+    Trains with the native API from a ChunkedDataIter over train_data_path (a file,
+    a directory of part files, a glob or a list of these), always with early stopping
+    on the validation set. With xgb_model, boosting continues from that booster.
 
-    # --- MLflow Setup ---
-    mlflow_tracking_uri = os.environ.get("MLFLOW_TRACKING_URI", "http://localhost:5000") # Replace with your MLflow server URI
-    mlflow.set_tracking_uri(mlflow_tracking_uri)
-    
+    'iterator':        batches are quantized into an in-memory QuantileDMatrix.
+    'external-memory': pages are cached under cache_dir and streamed from disk each round.
+    """
+    locations = train_data_path if isinstance(train_data_path, (list, tuple)) else [train_data_path]
+    paths = [path for location in locations for path in data_io.resolve_data_files(location)]
+    logger.info(f"Training from {len(paths)} file(s) in chunks of {chunk_size} rows.")
+    if training_mode == 'iterator':
+        dtrain = xgb.QuantileDMatrix(ChunkedDataIter(paths, chunk_size), max_bin=hp['max_bin'], nthread=hp['nthread'])
+    elif training_mode == 'external-memory':
+        cache_dir = cache_dir or os.path.join(os.path.dirname(paths[0]), 'xgb-cache')
+        os.makedirs(cache_dir, exist_ok=True)
+        data_iter = ChunkedDataIter(paths, chunk_size, cache_prefix=os.path.join(cache_dir, 'train'))
+        if hasattr(xgb, 'ExtMemQuantileDMatrix'):
+            dtrain = xgb.ExtMemQuantileDMatrix(data_iter, max_bin=hp['max_bin'], nthread=hp['nthread'])
+        else:
+            dtrain = xgb.DMatrix(data_iter, nthread=hp['nthread'])
+    else:
+        raise ValueError(f"Unknown training mode '{training_mode}'")
+    logger.info(f"Training matrix built: {dtrain.num_row()} rows, {dtrain.num_col()} columns.")
+
+    dvalid = xgb.QuantileDMatrix(X_valid, y_valid, ref=dtrain, nthread=hp['nthread'])
+    return xgb.train(
+        booster_params(hp),
+        dtrain,
+        num_boost_round=hp['num_round'],
+        evals=[(dvalid, 'validation')],
+        early_stopping_rounds=hp['early_stopping_rounds'] or None,
+        verbose_eval=False,
+        xgb_model=xgb_model,
+    )
+
+def load_previous_model(model_output_path, previous_model_uri=None, state=None):
+    """
+    Finds the model an incremental run continues from: --previous-model-uri if given,
+    else the xgboost-model file on the PVC (the model the last train step wrote and
+    deploy-seldon-model deployed), else the MLflow model URI the last train step wrote
+    to /tmp/mlflow_model_uri.txt, as recorded in the watermark. Returns (booster, where
+    it came from), or (None, None) if no model was trained since the last full preprocess.
+    """
+    if not previous_model_uri and not (state or {}).get('model_uri'):
+        return None, None
+    if not previous_model_uri and os.path.exists(model_output_path):
+        return xgb.Booster(model_file=model_output_path), model_output_path
+    uri = previous_model_uri or state['model_uri']
+    logger.info(f"Loading the previous model from {uri}")
+    model = mlflow.xgboost.load_model(uri)
+    return (model.get_booster() if hasattr(model, 'get_booster') else model), uri
+
+def continue_booster(previous_booster, train_data_path, X_valid, y_valid, hp, rounds, training_mode, chunk_size,
+                     cache_dir=None):
+    """
+    Warm start: adds up to rounds trees to a copy of previous_booster, fitted on
+    train_data_path (the new rows only), with early stopping on the new validation rows.
+    """
+    previous_booster = previous_booster.copy()
+    # A best_iteration saved with the previous model would cut the new trees off again
+    previous_booster.set_attr(best_iteration=None, best_score=None)
+    hp = dict(hp, num_round=rounds)
+    if training_mode != 'in-memory':
+        return train_booster_from_batches(train_data_path, X_valid, y_valid, hp, training_mode, chunk_size,
+                                          cache_dir=cache_dir, xgb_model=previous_booster)
+    X_train, y_train = data_io.read_features_target(train_data_path)
+    dtrain = xgb.QuantileDMatrix(X_train, y_train, max_bin=hp['max_bin'], nthread=hp['nthread'])
+    dvalid = xgb.QuantileDMatrix(X_valid, y_valid, ref=dtrain, nthread=hp['nthread'])
+    return xgb.train(
+        booster_params(hp),
+        dtrain,
+        num_boost_round=rounds,
+        evals=[(dvalid, 'validation')],
+        early_stopping_rounds=hp['early_stopping_rounds'] or None,
+        verbose_eval=False,
+        xgb_model=previous_booster,
+    )
+
+def booster_auc(booster, X, y):
+    _, tps, fps = binary_metrics.score_curve(y.to_numpy(), booster.predict(xgb.DMatrix(X)))
+    return binary_metrics.roc_auc_from_curve(tps, fps)
+
+def write_model_uri(model_uri):
+    """
+    Writes the absolute model URI where the Argo train step reads its mlflow_model_uri output.
+    """
     try:
-        mlflow.set_experiment(mlflow_experiment_name)
-        logger.info(f"Using MLflow experiment: {mlflow_experiment_name}")
+        with open("/tmp/mlflow_model_uri.txt", "w") as f:
+            f.write(model_uri) # Write the S3 URI
+        logger.info(f"Absolute S3 model URI written to /tmp/mlflow_model_uri.txt: {model_uri}")
     except Exception as e:
-        logger.error(f"Could not set MLflow experiment '{mlflow_experiment_name}': {e}")
-        try:
-            logger.info(f"Attempting to create MLflow experiment: {mlflow_experiment_name}")
-            mlflow.create_experiment(mlflow_experiment_name)
-            mlflow.set_experiment(mlflow_experiment_name)
-        except Exception as e_create:
-            logger.error(f"Failed to create or set MLflow experiment: {e_create}")
-
-
-    with mlflow.start_run(run_name="xgboost_training_run") as run:
-        run_id = run.info.run_id # Get the run ID
-        logger.info(f"MLflow Run ID: {run_id}")
-        logger.info(f"MLflow Tracking URI: {mlflow.get_tracking_uri()}")
-        logger.info(f"MLflow Artifact URI: {mlflow.get_artifact_uri()}")
-
-        # Load training data
-        logger.info(f"Loading training data from {train_data_path}")
-        train_data = pd.read_csv(train_data_path)
-        X_train = train_data.iloc[:, 1:]
-        y_train = train_data.iloc[:, 0]
-        logger.info(f"Training data loaded. Shape: {train_data.shape}")
-
-        # Load validation data
-        logger.info(f"Loading validation data from {valid_data_path}")
-        valid_data = pd.read_csv(valid_data_path)
-        X_valid = valid_data.iloc[:, 1:]
-        y_valid = valid_data.iloc[:, 0]
-        logger.info(f"Validation data loaded. Shape: {valid_data.shape}")
-
-        # Define hyperparameters, reading from SageMaker env vars or defaults
-        hp_max_depth = int(float(os.environ.get('SM_HP_MAX_DEPTH', 5)))
-        hp_eta = float(os.environ.get('SM_HP_ETA', 0.2))
-        hp_min_child_weight = float(os.environ.get('SM_HP_MIN_CHILD_WEIGHT', 1))
-        hp_subsample = float(os.environ.get('SM_HP_SUBSAMPLE', 0.8))
-        hp_num_round = int(os.environ.get('SM_HP_NUM_ROUND', 100)) # SageMaker often passes num_round
-
-        model_params = {
-            'max_depth': hp_max_depth,
-            'eta': hp_eta,
-            'min_child_weight': hp_min_child_weight,
-            'subsample': hp_subsample,
-            'objective': 'binary:logistic',
-            'n_estimators': hp_num_round, # XGBClassifier uses n_estimators
-            'use_label_encoder': False # Suppress warning for newer XGBoost
-        }
-        
-        # Log parameters to MLflow
-        logger.info(f"Logging parameters to MLflow: {model_params}")
-        mlflow.log_params({
-            'max_depth': hp_max_depth,
-            'eta': hp_eta,
-            'min_child_weight': hp_min_child_weight,
-            'subsample': hp_subsample,
-            'num_round': hp_num_round, # Logged as num_round for consistency with SM
-            'objective': 'binary:logistic'
-        })
-        mlflow.log_param("train_data_path", train_data_path)
-        mlflow.log_param("valid_data_path", valid_data_path)
-
-
-        # Initialize XGBoost model
-        logger.info("Initializing XGBoost model with hyperparameters.")
-        # XGBClassifier uses n_estimators instead of num_round directly in constructor
-        model = xgb.XGBClassifier(
-            max_depth=hp_max_depth,
-            eta=hp_eta,
-            min_child_weight=hp_min_child_weight,
-            subsample=hp_subsample,
-            objective='binary:logistic',
-            n_estimators=hp_num_round, # Use n_estimators here
-            use_label_encoder=False # Suppress warning
+        logger.error(f"Failed to write mlflow_model_uri.txt: {e}")
+
+def train_model(train_data_path, valid_data_path, model_output_path, metrics_output_path, mlflow_experiment_name, args_dict,
+                train_frame=None, valid_frame=None):
+    """
+    Trains the model and returns (model, MLflow run ID). train_frame and valid_frame
+    (processed frames, target first, as returned by preprocessing.main()) replace
+    reading the data paths; they imply in-memory training and bypass the stage cache,
+    whose key is computed from the data files. With args_dict['refresh_mode'] set to
+    'incremental' the data paths come from the watermark instead (see watermark.py).
+    """
+    logger.info("Starting XGBoost training script.")
+
+    # Define hyperparameters, reading from SageMaker env vars or defaults.
+    # A best_config.json from hpo_search.py supplies defaults; explicit SM_HP_* env vars still win.
+    hp_environ = dict(os.environ)
+    hyperparameters_path = args_dict.get('hyperparameters_path')
+    if hyperparameters_path:
+        logger.info(f"Reading tuned hyperparameters from {hyperparameters_path}")
+        with open(hyperparameters_path) as f:
+            hp_environ = dict(json.load(f)['sm_hp_env'], **os.environ)
+    hp = read_hyperparameters(hp_environ)
+    training_mode = args_dict.get('training_mode') or 'in-memory'
+    if train_frame is not None and training_mode != 'in-memory':
+        logger.info(f"Training data is already in memory; using in-memory training instead of {training_mode}.")
+        training_mode = 'in-memory'
+    encoder_path = args_dict.get('encoder_path')
+    compiled_model_output_path = args_dict.get('compiled_model_output_path')
+
+    # Incremental refresh: continue boosting the previous model on the increments it has not
+    # seen yet (see watermark.py). A full retrain then covers the base files plus every increment.
+    refresh_mode = args_dict.get('refresh_mode') or 'full'
+    watermark_path = args_dict.get('watermark_path')
+    state = watermark.load(watermark_path)
+    incremental_rounds = args_dict.get('incremental_rounds') or 20
+    max_trees = args_dict.get('max_trees') or 0
+    cv_folds = args_dict.get('cv_folds') or 0
+    cv_strategy = args_dict.get('cv_strategy') or 'stratified'
+    if cv_folds and cv_strategy == 'time' and not (refresh_mode == 'incremental' and state and state['increments']):
+        # Fail before any work: the only time order the processed files have is their arrival batch
+        raise ValueError("--cv-strategy time needs an incremental refresh with at least one increment; "
+                         "the rows of a single preprocess run are not in time order.")
+    previous_booster = previous_source = None
+    pending = []
+    if refresh_mode == 'incremental':
+        if train_frame is not None or valid_frame is not None:
+            raise ValueError("Incremental training reads the increment files listed in the watermark, not frames")
+        if state is None:
+            logger.warning(f"No watermark at {watermark_path}; training on {train_data_path} from scratch.")
+        else:
+            train_data_path = watermark.history_paths(state, 'train')
+            valid_data_path = watermark.history_paths(state, 'test')
+            pending = watermark.pending_increments(state)
+            previous_booster, previous_source = load_previous_model(model_output_path, args_dict.get('previous_model_uri'), state)
+            if previous_booster is None:
+                logger.info("No model trained since the last full preprocess; training on the full history.")
+            elif not pending:
+                logger.info(f"No new rows since the last training; keeping the model from {previous_source}.")
+                if not os.path.exists(model_output_path):
+                    os.makedirs(os.path.dirname(model_output_path), exist_ok=True)
+                    previous_booster.save_model(model_output_path)
+                if state.get('model_uri'):
+                    write_model_uri(state['model_uri'])
+                model = xgb.XGBClassifier()
+                model.load_model(model_output_path)
+                return model, state.get('run_id')
+            elif max_trees and previous_booster.num_boosted_rounds() + incremental_rounds > max_trees:
+                logger.info(f"The previous model has {previous_booster.num_boosted_rounds()} trees; retraining on the "
+                            f"full history to stay under --max-trees {max_trees}.")
+                previous_booster = None
+
+    # Skip training when the data, the code, the encoder and the hyperparameters match a cached run
+    outputs = {'model': model_output_path, 'metrics': metrics_output_path}
+    if compiled_model_output_path:
+        outputs['compiled_model'] = compiled_model_output_path
+    cache = None
+    if train_frame is None and valid_frame is None and refresh_mode != 'incremental':
+        cache = stage_cache.open_cache(args_dict.get('cache_dir'), 'train',
+                                       args_dict.get('cache_max_age_days', 30.0), args_dict.get('cache_max_size_gb', 20.0))
+    cache_key = None
+    if cache:
+        cache_key = cache.key(
+            [train_data_path, valid_data_path] + [path for path in (encoder_path, hyperparameters_path) if path and os.path.exists(path)],
+            stage_cache.module_paths('xgboost_script.py', 'data_io.py', 'binary_metrics.py', 'compiled_trees.py'),
+            # nthread only changes the speed, so a pod with a different CPU limit still hits the cache
+            {'hyperparameters': {name: value for name, value in hp.items() if name != 'nthread'},
+             'training_mode': training_mode, 'chunk_size': args_dict.get('chunk_size') if training_mode != 'in-memory' else None,
+             'xgboost_version': xgb.__version__, 'outputs': sorted(outputs),
+             **({'cv': [cv_folds, cv_strategy]} if cv_folds else {})},
         )
-        logger.info("XGBoost model initialized.")
+        manifest = cache.lookup(cache_key)
+        if manifest and cache.restore(manifest, outputs):
+            logger.info(f"Stage cache hit ({cache_key[:12]}): reusing the model of MLflow run {manifest['run_id']}.")
+            write_model_uri(manifest['extra']['model_uri'])
+            if state is not None and not state['increments']:
+                watermark.record_training(watermark_path, manifest['extra']['model_uri'], manifest['run_id'])
+            with open(metrics_output_path) as f:
+                cached_metrics = json.load(f)
+            print(f"validation:accuracy: {cached_metrics['accuracy']}")
+            print(f"validation:auc: {cached_metrics['auc']}")
+            model = xgb.XGBClassifier()
+            model.load_model(model_output_path)
+            return model, manifest['run_id']
+
+    # Params, metrics and tags are sent in batches and artifacts upload in the background;
+    # without a reachable MLflow server the run is spooled locally (see tracking.py)
+    with tracking.start_run(mlflow_experiment_name, run_name="xgboost_training_run") as run, \
+            instrumentation.Profiler('train', args_dict.get('profile') or 'none') as profiler:
+        run_id = run.run_id # Get the run ID
+        logger.info(f"MLflow Artifact URI: {run.get_artifact_uri()}")
+        if hyperparameters_path:
+            run.log_param("hyperparameters_path", hyperparameters_path)
+        if cache_key:
+            run.set_tag("stage_cache_key", cache_key)
+
+        # Log parameters to MLflow
+        logger.info(f"Logging parameters to MLflow: {hp}")
+        run.log_params(dict(hp, objective='binary:logistic')) # num_round logged as num_round for consistency with SM
+        run.log_params({"train_data_path": train_data_path, "valid_data_path": valid_data_path, "training_mode": training_mode,
+                        "refresh_mode": refresh_mode})
+
+        # Cross-validate on every processed row (train and test) before training the final model
+        if cv_folds:
+            logger.info(f"Quantizing the data for {cv_folds}-fold {cv_strategy} cross-validation.")
+            with instrumentation.span('cv_read'):
+                if train_frame is not None and valid_frame is not None:
+                    cv_batches = [0, 0]
+                    X_codes, y_codes, sources = cross_validation.load_codes(None, None, frames=[train_frame, valid_frame], max_bin=hp['max_bin'])
+                else:
+                    # A file's position in the watermark history (base 0, increment i) is its arrival batch
+                    cv_paths, cv_batches = [], []
+                    for location in (train_data_path, valid_data_path):
+                        location = location if isinstance(location, (list, tuple)) else [location]
+                        cv_paths += location
+                        cv_batches += range(len(location))
+                    X_codes, y_codes, sources = cross_validation.load_codes(cv_paths, args_dict.get('chunk_size') or 100000, max_bin=hp['max_bin'])
+            with instrumentation.span('cv'):
+                fold_results, cv_summary = cross_validation.cross_validate(
+                    X_codes, y_codes, booster_params(hp), hp['num_round'], hp['early_stopping_rounds'],
+                    cv_folds, cv_strategy, args_dict.get('random_state', 42), cpus=hp['nthread'],
+                    batches=np.asarray(cv_batches, dtype=np.int32)[sources])
+            del X_codes, y_codes, sources
+            cross_validation.log_results(run, fold_results, cv_summary, cv_strategy)
+
+        booster = None
+        strategy = 'full'
+        increment_metrics = {}
+        if previous_booster is not None:
+            new_train_paths = [increment['train'] for increment in pending]
+            new_test_paths = [increment['test'] for increment in pending]
+            logger.info(f"Continuing the model from {previous_source} ({previous_booster.num_boosted_rounds()} trees) "
+                        f"for up to {incremental_rounds} rounds on {sum(increment['rows'] for increment in pending)} "
+                        f"new rows in {len(pending)} increment(s).")
+            with instrumentation.span('read'):
+                X_valid, y_valid = data_io.read_features_target(new_test_paths)
+                scored_new_rows = y_valid.nunique() >= 2
+                if not scored_new_rows:
+                    # Too few new validation rows for an AUC; compare on the whole history's instead
+                    X_valid, y_valid = data_io.read_features_target(valid_data_path)
+            with instrumentation.span('fit'):
+                booster = continue_booster(previous_booster, new_train_paths, X_valid, y_valid, hp, incremental_rounds,
+                                           training_mode, chunk_size=args_dict.get('chunk_size') or 100000,
+                                           cache_dir=args_dict.get('external_memory_cache_dir'))
+            booster = truncate_to_best_iteration(booster)
+
+            # Both models scored on the same rows, so the difference is the effect of the new trees
+            previous_auc = booster_auc(previous_booster, X_valid, y_valid)
+            incremental_auc = booster_auc(booster, X_valid, y_valid)
+            run.log_metrics({"previous_model_auc": previous_auc, "incremental_auc": incremental_auc,
+                             "new_trees": booster.num_boosted_rounds() - previous_booster.num_boosted_rounds()})
+            logger.info(f"Validation AUC: {previous_auc:.4f} before, {incremental_auc:.4f} after "
+                        f"{booster.num_boosted_rounds() - previous_booster.num_boosted_rounds()} new trees.")
+            max_auc_drop = args_dict.get('max_auc_drop', 0.005)
+            if incremental_auc < previous_auc - max_auc_drop:
+                logger.warning(f"Validation AUC dropped by more than {max_auc_drop}; falling back to a full retrain "
+                               f"on {len(train_data_path)} file(s).")
+                booster = None
+                strategy = 'full_retrain_fallback'
+            else:
+                strategy = 'incremental'
+                # Report the new rows' AUC separately; the final metrics cover the whole validation
+                # history (base test file plus every increment), the same rows as a full retrain
+                if scored_new_rows:
+                    increment_metrics = {'increment_auc': incremental_auc}
+                    with instrumentation.span('read'):
+                        X_valid, y_valid = data_io.read_features_target(valid_data_path)
+        run.set_tag("training_strategy", strategy)
+
+        if booster is None:
+            # Load validation data. It is used for early stopping and evaluation, and is kept in memory in every mode.
+            if valid_frame is not None:
+                X_valid, y_valid = data_io.split_features_target(valid_frame)
+            else:
+                logger.info(f"Loading validation data from {valid_data_path}")
+                with instrumentation.span('read'):
+                    X_valid, y_valid = data_io.read_features_target(valid_data_path)
+            logger.info(f"Validation data loaded. Shape: {X_valid.shape}")
+
+            if training_mode == 'in-memory':
+                # Load training data
+                if train_frame is not None:
+                    X_train, y_train = data_io.split_features_target(train_frame)
+                else:
+                    logger.info(f"Loading training data from {train_data_path}")
+                    with instrumentation.span('read'):
+                        X_train, y_train = data_io.read_features_target(train_data_path)
+                logger.info(f"Training data loaded. Shape: {X_train.shape}")
 
-        # Train the model
-        logger.info("Starting model training.")
-        model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+                # Initialize XGBoost model
+                logger.info("Initializing XGBoost model with hyperparameters.")
+                # XGBClassifier uses n_estimators instead of num_round directly in constructor
+                model = xgb.XGBClassifier(
+                    max_depth=hp['max_depth'],
+                    eta=hp['eta'],
+                    min_child_weight=hp['min_child_weight'],
+                    subsample=hp['subsample'],
+                    objective='binary:logistic',
+                    n_estimators=hp['num_round'], # Use n_estimators here
+                    tree_method=hp['tree_method'],
+                    max_bin=hp['max_bin'],
+                    n_jobs=hp['nthread'],
+                    eval_metric='auc',
+                    early_stopping_rounds=hp['early_stopping_rounds'] or None,
+                )
+                logger.info("XGBoost model initialized.")
+
+                # Train the model
+                logger.info("Starting model training.")
+                with instrumentation.span('fit'):
+                    model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+                booster = model.get_booster()
+            else:
+                logger.info(f"Starting batched model training ({training_mode}) from {train_data_path}.")
+                # Chunk reads happen inside the fit and show up as a nested 'read' span
+                with instrumentation.span('fit'):
+                    booster = train_booster_from_batches(train_data_path, X_valid, y_valid, hp, training_mode,
+                                                         chunk_size=args_dict.get('chunk_size') or 100000,
+                                                         cache_dir=args_dict.get('external_memory_cache_dir'))
         logger.info("Model training completed.")
 
+        # Keep only the trees up to the best validation round
+        if booster.attr('best_iteration') is not None:
+            run.log_metric("best_iteration", int(booster.attr('best_iteration')))
+        booster = truncate_to_best_iteration(booster)
+        run.log_metric("num_trees", booster.num_boosted_rounds())
+
         # Save the model (SageMaker conventional path) - kept for compatibility
         logger.info(f"Saving the trained model to SageMaker path: {model_output_path}")
         os.makedirs(os.path.dirname(model_output_path), exist_ok=True)
-        model.save_model(model_output_path)
+        with instrumentation.span('save'):
+            booster.save_model(model_output_path)
+            model = xgb.XGBClassifier()
+            model.load_model(model_output_path)
         logger.info("Model saved to SageMaker path successfully.")
 
         # Log model with MLflow
         logger.info("Logging XGBoost model to MLflow.")
         artifact_sub_path = "xgboost_model_dir" # Define a clear artifact sub-path for the model
         
-        mlflow.xgboost.log_model(
-            xgb_model=model,
-            artifact_path=artifact_sub_path 
-        )
+        # Saved as an MLmodel directory and uploaded as run artifacts while training continues
+        run.log_model(mlflow.xgboost, model, artifact_sub_path)
+
+        # Ship the feature encoder inside the model directory so scoring can encode raw records
+        if encoder_path and os.path.exists(encoder_path):
+            logger.info(f"Logging feature encoder {encoder_path} next to the model.")
+            run.log_artifact(encoder_path, artifact_path=artifact_sub_path)
+        else:
+            logger.warning(f"Feature encoder not found at {encoder_path}; raw records cannot be encoded at scoring time.")
         
         # Construct the absolute S3 URI for the logged model
-        # mlflow.get_artifact_uri() returns the root artifact URI for the current run
+        # run.get_artifact_uri() returns the root artifact URI for the current run
         # This should be like s3://<your-bucket>/<experiment_id>/<run_id>/artifacts
-        absolute_model_s3_uri = f"{mlflow.get_artifact_uri(artifact_sub_path)}"
+        absolute_model_s3_uri = f"{run.get_artifact_uri(artifact_sub_path)}"
         
         logger.info(f"MLflow internal model URI (runs:/): runs:/{run_id}/{artifact_sub_path}")
         logger.info(f"Absolute S3 Model URI for Seldon: {absolute_model_s3_uri}")
 
-        # Save the ABSOLUTE S3 model URI for Argo to pick up
-        try:
-            with open("/tmp/mlflow_model_uri.txt", "w") as f:
-                f.write(absolute_model_s3_uri) # Write the S3 URI
-            logger.info(f"Absolute S3 model URI written to /tmp/mlflow_model_uri.txt: {absolute_model_s3_uri}")
-        except Exception as e:
-            logger.error(f"Failed to write mlflow_model_uri.txt: {e}")
-
-
         # Save the trained model locally as well (for PVC access if needed)
         logger.info(f"Saving the trained model locally to {model_output_path}")
         os.makedirs(os.path.dirname(model_output_path), exist_ok=True)
-        model.save_model(model_output_path)
+        with instrumentation.span('save'):
+            model.save_model(model_output_path)
         logger.info("Model saved locally successfully.")
 
         # Evaluate the model
         logger.info("Evaluating the model on validation data.")
-        y_pred = model.predict(X_valid)
-        y_pred_proba = model.predict_proba(X_valid)[:, 1]
-        accuracy = accuracy_score(y_valid, y_pred)
-        auc = roc_auc_score(y_valid, y_pred_proba)
+        # One inference pass; accuracy and AUC both come from the probabilities
+        with instrumentation.span('predict'):
+            y_pred_proba = model.predict_proba(X_valid)[:, 1]
+        with instrumentation.span('metrics'):
+            valid_metrics, _ = binary_metrics.evaluate_scores(y_valid.to_numpy(), y_pred_proba)
+        accuracy, auc = valid_metrics['accuracy'], valid_metrics['auc']
         logger.info(f"Model evaluation completed. Accuracy: {accuracy:.4f}, AUC: {auc:.4f}")
 
         # Log metrics to MLflow
         logger.info("Logging metrics to MLflow.")
-        mlflow.log_metric("validation_accuracy", accuracy)
-        mlflow.log_metric("validation_auc", auc)
+        run.log_metrics({"validation_accuracy": accuracy, "validation_auc": auc})
+
+        # Export the array-backed copy of the trees for low-latency serving and check it
+        # against predict_proba on the validation set
+        if compiled_model_output_path:
+            with instrumentation.span('compile'):
+                max_abs_diff = export_compiled_trees(booster, compiled_model_output_path,
+                                                     X_valid.to_numpy(dtype=np.float32), y_pred_proba)
+            logger.info(f"Compiled trees max abs difference from predict_proba: {max_abs_diff:.3g}")
+            run.log_metric("compiled_trees_max_abs_diff", max_abs_diff)
+            if max_abs_diff > 1e-5:
+                # Remove the export so a server started with --compiled-model-path falls back to
+                # the XGBoost model instead of serving wrong scores; the run is not cached either
+                logger.error(f"Compiled trees disagree with the XGBoost model; removing {compiled_model_output_path}.")
+                os.remove(compiled_model_output_path)
+                run.set_tag("compiled_trees_status", "mismatch")
+                cache = None
+            else:
+                run.log_artifact(compiled_model_output_path, artifact_path=artifact_sub_path)
 
         # Print metrics in the format expected by SageMaker HPO - kept for compatibility
         print(f"validation:accuracy: {accuracy}")
@@ -160,23 +516,71 @@ def train_model(train_data_path, valid_data_path, model_output_path, metrics_out
         # Save metrics to file (SageMaker conventional path) - kept for compatibility
         logger.info(f"Saving evaluation metrics to SageMaker path: {metrics_output_path}")
         os.makedirs(os.path.dirname(metrics_output_path), exist_ok=True)
-        metrics_content = {'accuracy': accuracy, 'auc': auc}
+        metrics_content = {'accuracy': accuracy, 'auc': auc, **increment_metrics}
         with open(metrics_output_path, 'w') as f:
             json.dump(metrics_content, f)
         logger.info("Metrics saved to SageMaker path successfully.")
         
-        mlflow.set_tag("training_status", "completed")
+        run.set_tag("training_status", "completed")
+
+        # Wait for the model upload so its cost is part of the stage's timings
+        with instrumentation.span('upload'):
+            run.wait()
+
+        # Hand the model on only once it is on the tracking server. A spooled run has no server
+        # URI yet (replay creates the run later), so Argo finds no mlflow_model_uri and stops here.
+        if run.offline:
+            logger.error(f"MLflow run {run_id} was spooled to {run.spool_dir}; not writing the model URI or the "
+                         f"watermark. Replay the spool with tracking.py --replay and rerun training.")
+        else:
+            # Save the ABSOLUTE S3 model URI for Argo to pick up
+            write_model_uri(absolute_model_s3_uri)
+            # The next incremental run continues from this model and skips the increments it has seen
+            if state is not None and (refresh_mode == 'incremental' or not state['increments']):
+                watermark.record_training(watermark_path, absolute_model_s3_uri, run_id)
+            if cache:
+                with instrumentation.span('cache_store'):
+                    cache.store(cache_key, outputs, run_id=run_id, extra={'model_uri': absolute_model_s3_uri})
+        profiler.report(run, args_dict.get('perf_output_path'), args_dict.get('prometheus_path'))
         logger.info("XGBoost training script finished.")
+    return model, run_id
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     # Argument for MLflow experiment name
     parser.add_argument('--mlflow-experiment-name', type=str, default="Churn_Prediction_XGBoost", help="Name of the MLflow experiment.")
     # Optional: Add arguments for data paths if you want to override SageMaker defaults when not in SageMaker
+    # Data files may be CSV, Parquet (.parquet) or Arrow IPC (.arrow); the format is taken from the extension
     parser.add_argument('--train-data-path', type=str, default='/opt/ml/processing/input/data/train/train.csv')
     parser.add_argument('--valid-data-path', type=str, default='/opt/ml/processing/input/data/validation/test.csv')
     parser.add_argument('--model-output-path', type=str, default='/opt/ml/processing/model/xgboost-model') # SageMaker model path
     parser.add_argument('--metrics-output-path', type=str, default='/opt/ml/processing/output/metrics.json') # SageMaker metrics path
+    parser.add_argument('--training-mode', type=str, choices=['in-memory', 'iterator', 'external-memory'], default='in-memory',
+                        help="in-memory: load the training file whole. iterator: stream chunks into a QuantileDMatrix. external-memory: stream chunks through an on-disk cache.")
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows per batch for the iterator and external-memory modes.')
+    parser.add_argument('--external-memory-cache-dir', type=str, default=None, help='Directory for the external-memory page cache (default: next to the training data).')
+    parser.add_argument('--hyperparameters-path', type=str, default=None, help='Optional best_config.json written by hpo_search.py.')
+    parser.add_argument('--encoder-path', type=str, default='/opt/ml/processing/model/feature_encoder.json') # Written by preprocessing.py
+    parser.add_argument('--compiled-model-output-path', type=str, default='/opt/ml/processing/model/compiled_trees.npz',
+                        help='Where to export the array-backed trees for model_server.py. Empty string to skip.')
+    parser.add_argument('--refresh-mode', type=str, choices=['full', 'incremental'], default='full',
+                        help='incremental: continue boosting the previous model on the rows added since its training (from --watermark-path), '
+                             'with a full retrain on all rows if the validation AUC drops.')
+    parser.add_argument('--watermark-path', type=str, default=None, help='Watermark written by preprocessing.py (--watermark-path).')
+    parser.add_argument('--previous-model-uri', type=str, default=None,
+                        help='MLflow model URI to continue from (default: --model-output-path, else the URI recorded in the watermark).')
+    parser.add_argument('--incremental-rounds', type=int, default=20, help='Most trees an incremental run adds.')
+    parser.add_argument('--max-auc-drop', type=float, default=0.005,
+                        help='Largest drop in validation AUC, against the previous model on the same rows, before falling back to a full retrain.')
+    parser.add_argument('--max-trees', type=int, default=1000, help='Retrain from scratch instead of growing the model past this many trees. 0 for no limit.')
+    parser.add_argument('--cv-folds', type=int, default=0,
+                        help='Cross-validate with this many folds on the train and validation rows together before training, '
+                             'and log the mean and spread of the metrics. 0 (default) skips it.')
+    parser.add_argument('--cv-strategy', type=str, choices=cross_validation.STRATEGIES, default='stratified',
+                        help='stratified: folds keep the churn rate. time: expanding window over the arrival batches of an incremental refresh.')
+    parser.add_argument('--random-state', type=int, default=42, help='Seed of the stratified fold assignment.')
+    stage_cache.add_cache_arguments(parser)
+    instrumentation.add_profiling_arguments(parser)
 
     args = parser.parse_args()
 
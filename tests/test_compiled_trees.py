@@ -0,0 +1,53 @@
+"""
+CompiledTrees must score exactly like the XGBoost model it was exported from.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'scripts'), os.path.join(ROOT, 'benchmarks')]
+
+xgb = pytest.importorskip('xgboost')
+
+import synthetic_telco
+from compiled_trees import CompiledTrees, export_compiled_trees
+from feature_encoding import FeatureEncoder, TARGET_COLUMN
+
+
+@pytest.fixture(scope='module')
+def sample():
+    raw = synthetic_telco.generate_block(np.random.default_rng(0), 0, 5000)
+    encoder = FeatureEncoder.fit(raw)
+    encoded = encoder.transform(raw)
+    X = encoded[encoder.feature_columns].to_numpy(dtype=np.float32)
+    y = encoded[TARGET_COLUMN].to_numpy()
+    # Missing values must follow each split's default direction
+    X[::17, 0] = np.nan
+    return X, y
+
+
+@pytest.fixture(scope='module')
+def booster(sample):
+    X, y = sample
+    model = xgb.XGBClassifier(n_estimators=50, max_depth=5, learning_rate=0.1, n_jobs=1, random_state=0)
+    model.fit(X[:4000], y[:4000])
+    return model.get_booster()
+
+
+def test_matches_booster_predict(sample, booster):
+    X, _ = sample
+    compiled = CompiledTrees.from_booster(booster)
+    expected = booster.predict(xgb.DMatrix(X[4000:]))
+    np.testing.assert_allclose(compiled.predict(X[4000:]), expected, atol=1e-5)
+    np.testing.assert_allclose(compiled.predict(X[4000]), expected[:1], atol=1e-5)
+
+
+def test_export_round_trip(sample, booster, tmp_path):
+    X, _ = sample
+    path = str(tmp_path / 'compiled_trees.npz')
+    expected = booster.predict(xgb.DMatrix(X[4000:]))
+    assert export_compiled_trees(booster, path, X[4000:], expected) <= 1e-5
+    np.testing.assert_allclose(CompiledTrees.load(path).predict(X[4000:]), expected, atol=1e-5)